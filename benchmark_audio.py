@@ -0,0 +1,290 @@
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import numpy as np
+import soundfile as sf
+
+import casting_tools as ct
+
+
+CONTENTION_SLICE = 0.01 # seconds per busy/idle cycle of a contention worker
+
+
+@dataclass
+class SimulatedStatus:
+    '''Stands in for sd.CallbackFlags.'''
+    output_underflow: bool = False
+
+class SimulatedOutputStream:
+    '''A clock-driven output device that calls the callback once per block period.'''
+
+    samplerate: int
+    blocksize: int
+    channels: int
+    callback: Callable
+    latency_blocks: int
+    before_block: Callable[[int], None] | None
+    callback_seconds: np.ndarray
+    wake_lateness: np.ndarray
+    underflow_blocks: np.ndarray
+    blocks: int
+    _thread: threading.Thread | None
+    _running: bool
+
+    def __init__(self,
+                 samplerate: int,
+                 blocksize: int,
+                 device: int | str,
+                 channels: int,
+                 dtype: str,
+                 callback: Callable,
+                 max_blocks: int = 0,
+                 latency_blocks: int = 1,
+                 before_block: Callable[[int], None] | None = None):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.channels = channels
+        self.callback = callback
+        self.latency_blocks = latency_blocks
+        self.before_block = before_block
+        self.callback_seconds = np.zeros(max_blocks)
+        self.wake_lateness = np.zeros(max_blocks)
+        self.underflow_blocks = np.zeros(max_blocks, dtype=bool)
+        self.blocks = 0
+        self._outdata = np.zeros((blocksize, channels), dtype=dtype)
+        self._thread = None
+        self._running = False
+
+    def start(self) -> None:
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def join(self) -> None:
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        period = self.blocksize / self.samplerate
+        status = SimulatedStatus()
+        deadline = time.perf_counter()
+        while self._running and self.blocks < len(self.callback_seconds):
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if self.before_block is not None:
+                # called before the callback takes its block, so it sees what the producers refilled
+                self.before_block(self.blocks)
+            woke = time.perf_counter()
+            self.callback(self._outdata, self.blocksize, None, status)
+            finished = time.perf_counter()
+
+            block = self.blocks
+            self.callback_seconds[block] = finished - woke
+            self.wake_lateness[block] = max(0.0, woke - deadline)
+            status.output_underflow = finished > deadline + self.latency_blocks * period
+            self.underflow_blocks[block] = status.output_underflow
+            self.blocks += 1
+
+            deadline += period
+            if status.output_underflow:
+                # the device played silence meanwhile, so it resynchronises instead of catching up
+                deadline = max(deadline, finished)
+
+def _busy_loop(duty: float, stop: Any) -> None:
+    '''Burn CPU for duty of every CONTENTION_SLICE in pure Python, so threads also hold the GIL.'''
+    while not stop.is_set():
+        end = time.perf_counter() + CONTENTION_SLICE * duty
+        while time.perf_counter() < end:
+            pass
+        if duty < 1:
+            time.sleep(CONTENTION_SLICE * (1 - duty))
+
+class Contention:
+    '''Background threads and processes that compete with the audio path for the GIL and the CPU.'''
+
+    def __init__(self, threads: int = 0, processes: int = 0, duty: float = 1.0):
+        self.threads = threads
+        self.processes = processes
+        self.duty = duty
+        self._thread_stop = threading.Event()
+        self._process_stop = multiprocessing.Event()
+        self._workers = []
+
+    def __enter__(self) -> 'Contention':
+        for _ in range(self.threads):
+            worker = threading.Thread(target=_busy_loop, args=(self.duty, self._thread_stop), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        for _ in range(self.processes):
+            worker = multiprocessing.Process(target=_busy_loop, args=(self.duty, self._process_stop), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._thread_stop.set()
+        self._process_stop.set()
+        for worker in self._workers:
+            worker.join()
+        self._workers.clear()
+
+def make_test_track(folder: str, seconds: float, samplerate: int, channels: int) -> str:
+    '''Write a quiet noise track so decoding and mixing do real work.'''
+    rng = np.random.default_rng(0)
+    data = (rng.standard_normal((int(seconds * samplerate), channels)) * 0.05).astype(np.float32)
+    path = os.path.join(folder, 'benchmark.wav')
+    sf.write(path, data, samplerate, subtype='FLOAT')
+    return path
+
+def _stats_ms(values: np.ndarray) -> str:
+    if not len(values):
+        return 'n/a'
+    p50, p99 = np.percentile(values, [50, 99]) * 1000
+    return f'p50 {p50:7.3f}  p99 {p99:7.3f}  max {values.max() * 1000:7.3f} ms'
+
+def run_benchmark(seconds: float = 10.0,
+                  samplerate: int = 48000,
+                  channels: int = 2,
+                  block_size: int = ct.MUSIC_BLOCKSIZE,
+                  buffer_size: int = ct.MUSIC_BUFFERSIZE,
+                  voices: int = 1,
+                  latency_blocks: int = 1,
+                  contention: Contention | None = None) -> dict:
+    '''Play voices through an AudioMixer driven by a SimulatedOutputStream and collect per-block metrics.'''
+    max_blocks = int(seconds * samplerate / block_size)
+    # frames of audio each voice had queued when every block was due, -1 once it has finished
+    ring_depth = np.full((max_blocks, voices), -1, dtype=np.int64)
+    players: list[ct.SoundPlayer] = []
+
+    def before_block(block: int) -> None:
+        for i, player in enumerate(players):
+            if player.playing:
+                ring_depth[block, i] = player._ring.readable()
+
+    with tempfile.TemporaryDirectory() as folder:
+        # a private cache so runs neither read nor evict the real one
+        previous_cache = ct.audio_cache
+        ct.set_audio_cache(os.path.join(folder, 'cache'))
+        try:
+            track = make_test_track(folder, seconds + 2, samplerate, channels)
+
+            mixer = ct.AudioMixer('simulated', samplerate, channels, block_size)
+            stream = None
+            def stream_factory(**kwargs) -> SimulatedOutputStream:
+                nonlocal stream
+                stream = SimulatedOutputStream(
+                    **kwargs, max_blocks=max_blocks, latency_blocks=latency_blocks, before_block=before_block)
+                return stream
+
+            # decoded up front, otherwise the voices would stream from the file while the cache fills
+            ct.get_audio_cache().get(track, samplerate, channels)
+            players.extend(ct.SoundPlayer(track, mixer, buffer_size, block_size) for _ in range(voices))
+            producers = [threading.Thread(target=player.play, daemon=True) for player in players]
+            with contention or Contention():
+                for producer in producers:
+                    producer.start()
+                # let every producer pre-fill its ring before the clock starts
+                while len(mixer.voices) < voices:
+                    time.sleep(0.001)
+                mixer.start(stream_factory)
+                stream.join()
+                mixer.close()
+                for producer in producers:
+                    producer.join()
+        finally:
+            ct.audio_cache = previous_cache
+
+    blocks = stream.blocks
+    depth = ring_depth[:blocks]
+    capacity = buffer_size * block_size
+    live = depth[depth >= 0]
+    return {
+        'blocks': blocks,
+        'period': block_size / samplerate,
+        'callback_seconds': stream.callback_seconds[:blocks],
+        'wake_lateness': stream.wake_lateness[:blocks],
+        # how far each producer was behind a full ring, in seconds of audio
+        'producer_lag': (capacity - live) / samplerate,
+        'ring_depth': depth,
+        'underflow_blocks': stream.underflow_blocks[:blocks],
+        'underflows': mixer.underflows,
+        'voice_underruns': sum(player.underruns for player in players),
+        'ring_capacity': capacity,
+    }
+
+def format_report(result: dict, block_size: int, samplerate: int, timeline_seconds: float = 1.0) -> str:
+    period = result['period']
+    callback = result['callback_seconds']
+    lines = [
+        f'{result["blocks"]} blocks of {block_size} frames at {samplerate} Hz ({period * 1000:.2f} ms period)',
+        f'callback time     {_stats_ms(callback)}',
+        f'callback load     p99 {np.percentile(callback, 99) / period if len(callback) else 0:.1%} of the period',
+        f'wake lateness     {_stats_ms(result["wake_lateness"])}',
+        f'producer lag      {_stats_ms(result["producer_lag"])}',
+        f'underflows        {result["underflows"]} (device missed a deadline)',
+        f'voice underruns   {result["voice_underruns"]} (ring buffer ran empty)',
+        '',
+        f'ring depth over time (blocks of {block_size}, capacity {result["ring_capacity"] // block_size}):',
+        f'{"time":>8} {"min":>6} {"mean":>6} {"underflows":>11}',
+    ]
+    depth = result['ring_depth']
+    per_row = max(1, int(timeline_seconds / period))
+    for start in range(0, result['blocks'], per_row):
+        window = depth[start:start + per_row]
+        live = window[window >= 0]
+        low, mean = (live.min() / block_size, live.mean() / block_size) if len(live) else (0, 0)
+        lines.append(f'{start * period:>7.1f}s {low:>6.1f} {mean:>6.1f} '
+                     f'{int(result["underflow_blocks"][start:start + per_row].sum()):>11}')
+    return '\n'.join(lines)
+
+def write_csv(result: dict, path: str) -> None:
+    '''One row per block: callback and lateness in ms, underflow flag, then each voice's ring depth in frames.'''
+    depth = result['ring_depth']
+    columns = [
+        result['callback_seconds'] * 1000,
+        result['wake_lateness'] * 1000,
+        result['underflow_blocks'].astype(int),
+        *depth.T,
+    ]
+    header = ['callback_ms', 'wake_lateness_ms', 'underflow'] + [f'ring_depth_{i}' for i in range(depth.shape[1])]
+    np.savetxt(path, np.column_stack(columns), delimiter=',', header=','.join(header), comments='', fmt='%g')
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Benchmark the audio engine against a simulated output device, no sound card needed.')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--samplerate', type=int, default=48000)
+    parser.add_argument('--channels', type=int, default=2)
+    parser.add_argument('--block-size', type=int, default=ct.MUSIC_BLOCKSIZE)
+    parser.add_argument('--buffer-size', type=int, default=ct.MUSIC_BUFFERSIZE, help='ring buffer size in blocks')
+    parser.add_argument('--voices', type=int, default=1, help='voices playing at the same time')
+    parser.add_argument('--latency-blocks', type=int, default=1,
+                        help='blocks the simulated device buffers before a late callback underflows')
+    parser.add_argument('--busy-threads', type=int, default=0, help='threads competing for the GIL')
+    parser.add_argument('--busy-processes', type=int, default=0, help='processes competing for the CPU')
+    parser.add_argument('--duty', type=float, default=1.0, help='fraction of the time contention workers are busy')
+    parser.add_argument('--csv', default=None, help='also write per-block metrics to this file')
+    args = parser.parse_args()
+
+    result = run_benchmark(args.seconds, args.samplerate, args.channels, args.block_size, args.buffer_size,
+                           args.voices, args.latency_blocks,
+                           Contention(args.busy_threads, args.busy_processes, args.duty))
+    ct.log(format_report(result, args.block_size, args.samplerate))
+    if args.csv is not None:
+        write_csv(result, args.csv)
+
+
+if __name__ == '__main__':
+    main()
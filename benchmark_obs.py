@@ -0,0 +1,554 @@
+import argparse
+import base64
+import functools
+import hashlib
+import heapq
+import json
+import socket
+import struct
+import threading
+import time
+from dataclasses import dataclass
+
+import casting_tools as ct
+
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class FakeOBSConnection:
+    '''One websocket client of the fake server.'''
+
+    def __init__(self, server: 'FakeOBSServer', sock: socket.socket):
+        self.server = server
+        self.sock = sock
+        self.event_subscriptions = 0
+        self._send_lock = threading.Lock()
+        self._outgoing: list[tuple[float, int, dict]] = []
+        self._outgoing_counter = 0
+        self._outgoing_cond = threading.Condition()
+        self.closed = False
+
+    def handshake(self) -> bool:
+        data = b''
+        while b'\r\n\r\n' not in data:
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                return False
+            data += chunk
+        headers = {}
+        for line in data.decode('latin-1').split('\r\n')[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        accept = base64.b64encode(hashlib.sha1(
+            (headers['sec-websocket-key'] + WEBSOCKET_GUID).encode()).digest()).decode()
+        self.sock.sendall((
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept}\r\n\r\n').encode())
+        return True
+
+    def _recv_exact(self, n: int) -> bytes:
+        data = b''
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError('client disconnected')
+            data += chunk
+        return data
+
+    def recv_message(self) -> str | None:
+        while True:
+            first, second = self._recv_exact(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length, = struct.unpack('>H', self._recv_exact(2))
+            elif length == 127:
+                length, = struct.unpack('>Q', self._recv_exact(8))
+            mask = self._recv_exact(4) if second & 0x80 else None
+            payload = self._recv_exact(length)
+            if mask is not None:
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+            if opcode == 0x8:
+                self._send_frame(0x8, b'')
+                return None
+            if opcode == 0x9:
+                self._send_frame(0xA, payload)
+                continue
+            if opcode in (0x1, 0x2):
+                return payload.decode()
+
+    def _send_frame(self, opcode: int, payload: bytes) -> None:
+        header = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([len(payload)])
+        elif len(payload) < 1 << 16:
+            header += bytes([126]) + struct.pack('>H', len(payload))
+        else:
+            header += bytes([127]) + struct.pack('>Q', len(payload))
+        with self._send_lock:
+            self.sock.sendall(header + payload)
+
+    def send(self, message: dict) -> None:
+        try:
+            self._send_frame(0x1, json.dumps(message).encode())
+        except OSError:
+            self.closed = True
+
+    def send_later(self, message: dict, delay: float) -> None:
+        if delay <= 0:
+            self.send(message)
+            return
+        with self._outgoing_cond:
+            self._outgoing_counter += 1
+            heapq.heappush(self._outgoing, (time.monotonic() + delay, self._outgoing_counter, message))
+            self._outgoing_cond.notify()
+
+    def sender_loop(self) -> None:
+        while not self.closed:
+            with self._outgoing_cond:
+                while not self._outgoing and not self.closed:
+                    self._outgoing_cond.wait(0.5)
+                if self.closed:
+                    return
+                due, _, message = self._outgoing[0]
+                now = time.monotonic()
+                if due > now:
+                    self._outgoing_cond.wait(due - now)
+                    continue
+                heapq.heappop(self._outgoing)
+            self.send(message)
+
+    def close(self) -> None:
+        self.closed = True
+        with self._outgoing_cond:
+            self._outgoing_cond.notify_all()
+        try:
+            # shutdown first, close alone does not end a connection another thread is reading
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class FakeOBSServer:
+    '''A local stand-in for obs-websocket v5 that answers a subset of requests from fixtures.'''
+
+    def __init__(self,
+                 scenes: dict[str, list[str]] | None = None,
+                 inputs: list[str] | None = None,
+                 transitions: list[str] | None = None,
+                 response_delay: float = 0.0,
+                 host: str = 'localhost',
+                 port: int = 0):
+        self.response_delay = response_delay
+        self.lock = threading.Lock()
+        self.scenes: dict[str, list[dict]] = {}
+        next_id = 1
+        for scene_name, sources in (scenes or {'Scene': ['Source']}).items():
+            items = []
+            for source_name in sources:
+                items.append({
+                    'sourceName': source_name,
+                    'sceneItemId': next_id,
+                    'sceneItemEnabled': True,
+                    'sceneItemIndex': len(items),
+                })
+                next_id += 1
+            self.scenes[scene_name] = items
+        self.inputs: dict[str, bool] = {name: False for name in (inputs or ['Microphone'])}
+        self.transitions = transitions or ['Fade', 'Cut']
+        self.current_transition = self.transitions[0]
+        self.program_scene = next(iter(self.scenes))
+        self.preview_scene = self.program_scene
+        self.request_counts: dict[str, int] = {}
+        self.connections: list[FakeOBSConnection] = []
+        self._listener = socket.create_server((host, port))
+        self.host = host
+        self.port = self._listener.getsockname()[1]
+        self._running = False
+
+    def start(self) -> 'FakeOBSServer':
+        self._running = True
+        thread = threading.Thread(target=self._accept_loop)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._running = False
+        try:
+            self._listener.close()
+        except OSError:
+            pass
+        for connection in list(self.connections):
+            connection.close()
+
+    def disconnect_all(self) -> None:
+        '''Drop every client, as if OBS had restarted.'''
+        for connection in list(self.connections):
+            connection.close()
+
+    def __enter__(self) -> 'FakeOBSServer':
+        return self.start()
+
+    def __exit__(self, *_) -> None:
+        self.stop()
+
+    def _accept_loop(self) -> None:
+        while self._running:
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            thread = threading.Thread(target=self._serve, args=(FakeOBSConnection(self, sock),))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, connection: FakeOBSConnection) -> None:
+        try:
+            if not connection.handshake():
+                return
+            sender = threading.Thread(target=connection.sender_loop)
+            sender.daemon = True
+            sender.start()
+            connection.send({'op': 0, 'd': {'obsWebSocketVersion': '5.1.0', 'rpcVersion': 1}})
+            self.connections.append(connection)
+            if not self._running:
+                # accepted while the server was being stopped
+                return
+            while not connection.closed:
+                message = connection.recv_message()
+                if message is None:
+                    break
+                self._handle(connection, json.loads(message))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            connection.close()
+            if connection in self.connections:
+                self.connections.remove(connection)
+
+    def _handle(self, connection: FakeOBSConnection, message: dict) -> None:
+        op, data = message['op'], message['d']
+        if op == 1:
+            connection.event_subscriptions = data.get('eventSubscriptions', 0)
+            connection.send({'op': 2, 'd': {'negotiatedRpcVersion': 1}})
+        elif op == 3:
+            connection.event_subscriptions = data.get('eventSubscriptions', connection.event_subscriptions)
+        elif op == 6:
+            response = self._request(data['requestType'], data.get('requestData') or {})
+            response['requestId'] = data['requestId']
+            connection.send_later({'op': 7, 'd': response}, self.response_delay)
+        elif op == 8:
+            results = []
+            for request in data['requests']:
+                result = self._request(request['requestType'], request.get('requestData') or {})
+                results.append(result)
+                if data.get('haltOnFailure') and not result['requestStatus']['result']:
+                    break
+            connection.send_later({'op': 9, 'd': {'requestId': data['requestId'], 'results': results}},
+                                  self.response_delay)
+
+    def emit(self, event_type: str, event_data: dict, intent: int) -> None:
+        for connection in list(self.connections):
+            if connection.event_subscriptions & intent:
+                connection.send({'op': 5, 'd': {
+                    'eventType': event_type,
+                    'eventIntent': intent,
+                    'eventData': event_data,
+                }})
+
+    def _find_item(self, scene_name: str, item_id: int) -> dict | None:
+        for item in self.scenes.get(scene_name, []):
+            if item['sceneItemId'] == item_id:
+                return item
+        return None
+
+    def _request(self, request_type: str, data: dict) -> dict:
+        with self.lock:
+            self.request_counts[request_type] = self.request_counts.get(request_type, 0) + 1
+            try:
+                response_data = self._dispatch(request_type, data)
+            except LookupError as e:
+                return {'requestType': request_type,
+                        'requestStatus': {'result': False, 'code': 600, 'comment': str(e)}}
+            except NotImplementedError:
+                return {'requestType': request_type,
+                        'requestStatus': {'result': False, 'code': 204, 'comment': 'Unknown request type'}}
+        response = {'requestType': request_type, 'requestStatus': {'result': True, 'code': 100}}
+        if response_data is not None:
+            response['responseData'] = response_data
+        return response
+
+    def _dispatch(self, request_type: str, data: dict) -> dict | None:
+        match request_type:
+            case 'GetVersion':
+                return {'obsVersion': '30.0.0', 'obsWebSocketVersion': '5.1.0', 'rpcVersion': 1}
+            case 'GetStats':
+                return {'cpuUsage': 0.0, 'activeFps': 60.0}
+            case 'GetSceneList':
+                return {
+                    'currentProgramSceneName': self.program_scene,
+                    'currentPreviewSceneName': self.preview_scene,
+                    'scenes': [{'sceneName': name, 'sceneIndex': i} for i, name in enumerate(self.scenes)],
+                }
+            case 'GetSceneItemList':
+                if data['sceneName'] not in self.scenes:
+                    raise LookupError(f'No scene {data["sceneName"]}')
+                return {'sceneItems': [dict(item) for item in self.scenes[data['sceneName']]]}
+            case 'GetSceneItemEnabled' | 'SetSceneItemEnabled':
+                item = self._find_item(data['sceneName'], data['sceneItemId'])
+                if item is None:
+                    raise LookupError(f'No scene item {data["sceneItemId"]} in {data["sceneName"]}')
+                if request_type == 'GetSceneItemEnabled':
+                    return {'sceneItemEnabled': item['sceneItemEnabled']}
+                item['sceneItemEnabled'] = data['sceneItemEnabled']
+                self.emit('SceneItemEnableStateChanged', {
+                    'sceneName': data['sceneName'],
+                    'sceneItemId': item['sceneItemId'],
+                    'sceneItemEnabled': item['sceneItemEnabled'],
+                }, 1 << 7)
+                return None
+            case 'GetInputList':
+                return {'inputs': [{'inputName': name} for name in self.inputs]}
+            case 'GetInputMute':
+                if data['inputName'] not in self.inputs:
+                    raise LookupError(f'No input {data["inputName"]}')
+                return {'inputMuted': self.inputs[data['inputName']]}
+            case 'SetInputMute' | 'ToggleInputMute':
+                if data['inputName'] not in self.inputs:
+                    raise LookupError(f'No input {data["inputName"]}')
+                if request_type == 'ToggleInputMute':
+                    self.inputs[data['inputName']] = not self.inputs[data['inputName']]
+                else:
+                    self.inputs[data['inputName']] = data['inputMuted']
+                self.emit('InputMuteStateChanged', {
+                    'inputName': data['inputName'],
+                    'inputMuted': self.inputs[data['inputName']],
+                }, 1 << 3)
+                if request_type == 'ToggleInputMute':
+                    return {'inputMuted': self.inputs[data['inputName']]}
+                return None
+            case 'GetCurrentProgramScene':
+                return {'currentProgramSceneName': self.program_scene}
+            case 'GetCurrentPreviewScene':
+                return {'currentPreviewSceneName': self.preview_scene}
+            case 'SetCurrentPreviewScene':
+                if data['sceneName'] not in self.scenes:
+                    raise LookupError(f'No scene {data["sceneName"]}')
+                self.preview_scene = data['sceneName']
+                self.emit('CurrentPreviewSceneChanged', {'sceneName': self.preview_scene}, 1 << 2)
+                return None
+            case 'SetCurrentProgramScene':
+                if data['sceneName'] not in self.scenes:
+                    raise LookupError(f'No scene {data["sceneName"]}')
+                self.program_scene = data['sceneName']
+                self.emit('CurrentProgramSceneChanged', {'sceneName': self.program_scene}, 1 << 2)
+                return None
+            case 'TriggerStudioModeTransition':
+                self.program_scene, self.preview_scene = self.preview_scene, self.program_scene
+                self.emit('CurrentProgramSceneChanged', {'sceneName': self.program_scene}, 1 << 2)
+                self.emit('CurrentPreviewSceneChanged', {'sceneName': self.preview_scene}, 1 << 2)
+                return None
+            case 'GetCurrentSceneTransition':
+                return {'transitionName': self.current_transition}
+            case 'SetCurrentSceneTransition':
+                if data['transitionName'] not in self.transitions:
+                    raise LookupError(f'No transition {data["transitionName"]}')
+                self.current_transition = data['transitionName']
+                self.emit('CurrentSceneTransitionChanged', {'transitionName': self.current_transition}, 1 << 4)
+                return None
+        raise NotImplementedError(request_type)
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    latencies: list[float]
+    elapsed: float
+    # requests the OBS state mirror dropped as no-ops, which never reached the server
+    skipped: int = 0
+    
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.elapsed if self.elapsed else 0.0
+    
+    def percentile(self, p: float) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[min(int(p / 100 * len(ordered)), len(ordered) - 1)] if ordered else 0.0
+    
+    def as_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'count': len(self.latencies),
+            'actions_per_second': self.throughput,
+            'p50_ms': self.percentile(50) * 1000,
+            'p95_ms': self.percentile(95) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'max_ms': max(self.latencies, default=0.0) * 1000,
+            'skipped_requests': self.skipped,
+        }
+
+def make_fixtures(scene_sizes: list[int]) -> dict[str, list[str]]:
+    scenes = {'Waiting': ['Starting In', 'Resuming In'], 'Casters': ['Camera 1', 'Camera 2']}
+    for size in scene_sizes:
+        scenes[f'Scene {size}'] = [f'Source {i}' for i in range(size)]
+    return scenes
+
+def mirror_skipped() -> int:
+    return ct.obs_state.skipped if ct.obs_state is not None else 0
+
+def run_sequential(name: str, obs_client: ct.obs.ReqClient, bindings: list[list[dict]], iterations: int) -> BenchmarkResult:
+    '''Run bindings one after another through perform_actions, timing each call.'''
+    compiled = [ct.compile_actions(actions) for actions in bindings]
+    latencies = []
+    skipped = mirror_skipped()
+    start = time.perf_counter()
+    for i in range(iterations):
+        actions = compiled[i % len(compiled)]
+        before = time.perf_counter()
+        ct.perform_compiled_actions(obs_client, actions)
+        latencies.append(time.perf_counter() - before)
+    return BenchmarkResult(name, latencies, time.perf_counter() - start, mirror_skipped() - skipped)
+
+def run_dispatched(name: str,
+                   obs_client: ct.obs.ReqClient,
+                   bindings: list[list[dict]],
+                   iterations: int,
+                   workers: int) -> BenchmarkResult:
+    '''Fire bindings through an ActionDispatcher as fast as possible, timing each from submission.'''
+    compiled = [ct.compile_actions(actions) for actions in bindings]
+    dispatcher = ct.ActionDispatcher(workers=workers, max_pending=iterations, overflow='block')
+    dispatcher.start()
+    latencies = []
+    latencies_lock = threading.Lock()
+    done = threading.Semaphore(0)
+    
+    def job(actions: tuple, submitted: float) -> None:
+        try:
+            ct.perform_compiled_actions(obs_client, actions)
+        finally:
+            with latencies_lock:
+                latencies.append(time.perf_counter() - submitted)
+            done.release()
+    
+    skipped = mirror_skipped()
+    start = time.perf_counter()
+    for i in range(iterations):
+        actions = compiled[i % len(compiled)]
+        dispatcher.submit(('benchmark', i), functools.partial(job, actions, time.perf_counter()))
+    for _ in range(iterations):
+        done.acquire()
+    elapsed = time.perf_counter() - start
+    dispatcher.stop()
+    return BenchmarkResult(name, latencies, elapsed, mirror_skipped() - skipped)
+
+def run_benchmarks(response_delay: float = 0.001,
+                   iterations: int = 200,
+                   scene_sizes: list[int] | None = None,
+                   workers: int = 0,
+                   pipelining: bool = True) -> list[BenchmarkResult]:
+    scene_sizes = scene_sizes or [10, 100, 1000]
+    server = FakeOBSServer(
+        scenes=make_fixtures(scene_sizes),
+        inputs=['Microphone', 'Desktop Audio'],
+        transitions=['Fade', 'Cut', 'Base Stinger'],
+        response_delay=response_delay).start()
+    obs_client = ct.connect_to_obs(server.host, server.port, '', pipelining=pipelining)
+    if obs_client is None:
+        server.stop()
+        raise ConnectionError('Could not connect to the fake OBS server')
+    
+    scenarios: list[tuple[str, list[list[dict]]]] = [
+        ('trigger_studio_mode_transition', [[{'type': 'trigger_studio_mode_transition'}]]),
+        ('toggle_input_mute', [[{'type': 'toggle_input_mute', 'name': 'Microphone'}]]),
+        ('set_current_preview_scene', [[{'type': 'set_current_preview_scene', 'name': 'Casters'}],
+                                       [{'type': 'set_current_preview_scene', 'name': 'Waiting'}]]),
+        ('set_current_scene_transition', [[{'type': 'set_current_scene_transition', 'name': 'Cut'}],
+                                          [{'type': 'set_current_scene_transition', 'name': 'Fade'}]]),
+    ]
+    for size in scene_sizes:
+        # the last item is the worst case for a linear scan of the scene
+        scenarios.append((f'set_source_visibility ({size} items)', [
+            [{'type': 'set_source_visibility', 'scene': f'Scene {size}', 'name': f'Source {size - 1}', 'visible': v}]
+            for v in (False, True)]))
+    go_live = [[
+        {'type': 'set_current_scene_transition', 'name': 'Base Stinger'},
+        {'type': 'set_current_preview_scene', 'name': 'Casters'},
+        {'type': 'set_source_visibility', 'scene': 'Waiting', 'name': 'Starting In', 'visible': False},
+        {'type': 'set_source_visibility', 'scene': 'Waiting', 'name': 'Resuming In', 'visible': True},
+        {'type': 'toggle_input_mute', 'name': 'Microphone'},
+        {'type': 'trigger_studio_mode_transition'},
+    ]]
+    scenarios.append(('go live (6 actions)', go_live))
+    
+    results = []
+    try:
+        # resolve every scene item up front so the runs measure the hot path
+        for size in scene_sizes:
+            ct.get_source_id(obs_client, f'Scene {size}', f'Source {size - 1}')
+        for name, bindings in scenarios:
+            if workers > 0:
+                results.append(run_dispatched(name, obs_client, bindings, iterations, workers))
+            else:
+                results.append(run_sequential(name, obs_client, bindings, iterations))
+        # the same bindings without the scene item cache or the state mirror, for comparison,
+        # since the mirror would skip most repeats and the baseline would measure no-ops
+        resolver, mirror = ct.scene_item_resolver, ct.obs_state
+        ct.scene_item_resolver = ct.obs_state = None
+        try:
+            for size in scene_sizes:
+                results.append(run_sequential(f'set_source_visibility ({size} items, uncached)', obs_client, [
+                    [{'type': 'set_source_visibility', 'scene': f'Scene {size}', 'name': f'Source {size - 1}', 'visible': v}]
+                    for v in (False, True)], iterations))
+            results.append(run_sequential('go live (6 actions, uncached)', obs_client, go_live, iterations))
+        finally:
+            ct.scene_item_resolver, ct.obs_state = resolver, mirror
+    finally:
+        if ct.scene_item_resolver is not None:
+            ct.scene_item_resolver.stop()
+        obs_client.stop()
+        if ct.async_obs_client is not None:
+            ct.async_obs_client.stop()
+            ct.async_obs_client = None
+        server.stop()
+    return results
+
+def format_results(results: list[BenchmarkResult]) -> str:
+    lines = [f'{"benchmark":<50} {"actions/s":>10} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8} '
+             f'{"skipped":>8}']
+    for result in results:
+        row = result.as_dict()
+        lines.append(f'{result.name:<50} {row["actions_per_second"]:>10.1f} {row["p50_ms"]:>8.2f} '
+                     f'{row["p95_ms"]:>8.2f} {row["p99_ms"]:>8.2f} {row["max_ms"]:>8.2f} {result.skipped:>8}')
+    return '\n'.join(lines)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the OBS action path against a local fake obs-websocket server.')
+    parser.add_argument('--delay', type=float, default=1.0, help='server response delay in ms')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='scene sizes to benchmark')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='run through an ActionDispatcher with this many workers (0: sequential)')
+    parser.add_argument('--no-pipelining', action='store_true',
+                        help='send requests one at a time on the locked ReqClient instead of the asyncio client')
+    parser.add_argument('--json', default=None, help='also write the results to this file')
+    args = parser.parse_args()
+    
+    results = run_benchmarks(args.delay / 1000, args.iterations, args.sizes, args.workers, not args.no_pipelining)
+    ct.log(format_results(results))
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump([result.as_dict() for result in results], f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
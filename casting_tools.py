@@ -1,171 +1,2165 @@
+from __future__ import annotations
+
 import time
+_import_started = time.perf_counter()
 import sys
 from dataclasses import dataclass
-from typing import Callable, Any
+from typing import Callable, Any, Iterable
 import threading
 import json
 import functools
-import queue
 import os
 import random
+import math
+import itertools
+import bisect
+import heapq
+import collections
+import hashlib
+import tempfile
+import logging
+import base64
+import struct
+import importlib
+import types
+import concurrent.futures
+import asyncio
+
+
+class StartupTimer:
+    '''Records how long each subsystem took to import and initialise.'''
+    
+    steps: list[tuple[str, str, float]]
+    _lock: threading.Lock
+    
+    def __init__(self):
+        self.steps = []
+        self._lock = threading.Lock()
+    
+    def record(self, subsystem: str, step: str, seconds: float) -> None:
+        with self._lock:
+            self.steps.append((subsystem, step, seconds))
+    
+    def measure(self, subsystem: str, step: str) -> 'StartupTimer._Measurement':
+        '''Context manager that records the time spent inside it.'''
+        return StartupTimer._Measurement(self, subsystem, step)
+    
+    class _Measurement:
+        def __init__(self, timer: StartupTimer, subsystem: str, step: str):
+            self.timer = timer
+            self.subsystem = subsystem
+            self.step = step
+        
+        def __enter__(self) -> None:
+            self.started = time.perf_counter()
+        
+        def __exit__(self, *_) -> None:
+            self.timer.record(self.subsystem, self.step, time.perf_counter() - self.started)
+    
+    def total(self) -> float:
+        with self._lock:
+            return sum(seconds for _, _, seconds in self.steps)
+    
+    def report(self, target_ms: float | None = None) -> str:
+        with self._lock:
+            steps = list(self.steps)
+        subsystems: dict[str, list[tuple[str, float]]] = {}
+        for subsystem, step, seconds in steps:
+            subsystems.setdefault(subsystem, []).append((step, seconds))
+        total = sum(seconds for _, _, seconds in steps) * 1000
+        lines = [f'Startup: {total:.1f} ms' + (f' (target {target_ms:.0f} ms)' if target_ms is not None else '')]
+        for subsystem, subsystem_steps in subsystems.items():
+            lines.append(f'    {subsystem:<10} {sum(s for _, s in subsystem_steps) * 1000:>8.1f} ms   '
+                         + ', '.join(f'{step} {seconds * 1000:.1f}' for step, seconds in subsystem_steps))
+        if target_ms is not None and total > target_ms:
+            lines.append(f'Warning: Startup took {total - target_ms:.1f} ms longer than the target')
+        return '\n'.join(lines)
+
+startup_timer = StartupTimer()
+
+class LazyModule:
+    '''Stands in for a module until one of its attributes is used, then imports it.'''
+    
+    def __init__(self, name: str, alias: str, subsystem: str):
+        self._name = name
+        self._alias = alias
+        self._subsystem = subsystem
+    
+    def load(self) -> types.ModuleType:
+        started = time.perf_counter()
+        module = importlib.import_module(self._name)
+        if globals().get(self._alias) is self:
+            globals()[self._alias] = module
+            startup_timer.record(self._subsystem, f'import {self._name}', time.perf_counter() - started)
+        return module
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.load(), name)
+
+class LazyClass:
+    '''Decorates a function that defines a class on a lazily imported module, and calls it on first use.'''
+    
+    def __init__(self, define: Callable[[], type]):
+        self._define = define
+        self._name = define.__name__
+    
+    def load(self) -> type:
+        cls = self._define()
+        if globals().get(self._name) is self:
+            globals()[self._name] = cls
+        return cls
+    
+    def __call__(self, *args, **kwargs) -> Any:
+        return self.load()(*args, **kwargs)
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.load(), name)
 
-import mido
-import obsws_python as obs
-import win32api, win32con
-import keyboard
-import sounddevice as sd
-import soundfile as sf
-import numpy as np
+# loaded on first use, so the GUI and configs without audio or MIDI never pay for them
+np = LazyModule('numpy', 'np', 'audio')
+sf = LazyModule('soundfile', 'sf', 'audio')
+# raises OSError on first use if PortAudio is not installed, e.g. on a headless box
+sd = LazyModule('sounddevice', 'sd', 'audio')
+mido = LazyModule('mido', 'mido', 'midi')
+keyboard = LazyModule('keyboard', 'keyboard', 'input')
+# the heaviest imports of all, and only needed once there is an OBS to connect to
+obs = LazyModule('obsws_python', 'obs', 'obs')
+websocket = LazyModule('websocket', 'websocket', 'obs')
 
 
 MUSIC_BUFFERSIZE = 20 # number of blocks in the buffer
 MUSIC_BLOCKSIZE = 2048 # size of each sample block
+AUDIO_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'casting-tools-audio-cache')
+AUDIO_CACHE_MAX_BYTES = 2 * 1024 ** 3 # decoded float32 audio kept on disk
+AUDIO_DECODE_BLOCKSIZE = 65536 # frames decoded per read when filling the cache
+AUDIO_LIBRARY_INDEX = os.path.join(AUDIO_CACHE_DIR, 'library.json')
+PREPROCESSED_DIRNAME = '.preprocessed' # written inside a library folder by preprocess_music.py
+PREPROCESSED_MANIFEST = 'manifest.json'
+
+# obs-websocket v5 RequestBatchExecutionType values
+BATCH_EXECUTION_TYPES = {
+    'serial_realtime': 0,
+    'serial_frame': 1,
+    'parallel': 2,
+}
+OBS_HEARTBEAT_INTERVAL = 1.0 # seconds between GetVersion requests on each connection
+OBS_HOLD_TIMEOUT = 5.0 # how long a 'hold' action waits for OBS to come back
+OBS_RECONNECT_BACKOFF = (0.25, 8.0) # first and longest wait between reconnect attempts
+TIMELINE_PRECISE_WINDOW = 0.02 # condition timeouts can be a whole timer tick late, so the last 20 ms are slept
+TIMELINE_SPIN = 0.001 # and the last 1 ms spun
+TIMELINE_AUDIO_LEAD_BLOCKS = 2 # how many mixer blocks early frame-aligned audio steps are handed to the mixer
+TIMELINE_WORKERS = 2
+TIMELINE_MAX_PENDING = 256 # steps waiting for a worker before new ones are dropped
+CONFIG_POLL_INTERVAL = 0.5 # seconds between checks of config.json for changes
+# top level config fields a reload applies, the rest are only read at startup
+RELOADABLE_CONFIG = ('keyboard_bindings', 'midi_bindings')
 
 
 # god this is awful
 log = print
 
 
-current_character_index = 0
-target_character_index = 0
+spectator_controller: 'SpectatorController | None' = None
+# used when the first spectator action builds the controller
+spectator_click_delay = 0.0
+spectator_direct_select_keys: list[str] | dict[int, str] | None = None
 
-music_end_event = threading.Event()
 audio_output_device = None
-music_fade_out_length = 0
-current_music_fade_out_progress = 0
+audio_mixers: dict[int | str, 'AudioMixer'] = {}
+audio_mixers_lock = threading.Lock()
+active_playlists: list['Playlist'] = []
+active_playlists_lock = threading.Lock()
+scene_item_resolver: 'SceneItemResolver | None' = None
+# the same object as scene_item_resolver when OBS state mirroring is on
+obs_state: 'OBSStateMirror | None' = None
+obs_state_mirroring = True
+obs_supervisor: 'OBSConnectionSupervisor | None' = None
+async_obs_client: 'AsyncOBSClient | None' = None
+batch_execution_type = BATCH_EXECUTION_TYPES['serial_realtime']
+action_dispatcher: 'ActionDispatcher | None' = None
+timeline_scheduler: 'TimelineScheduler | None' = None
+input_coalescer: 'InputCoalescer | None' = None
+# swapped whole by set_dispatch_table, the key hooks and MIDI callback look bindings up here
+dispatch_table: 'DispatchTable | None' = None
+config_watcher: 'ConfigWatcher | None' = None
+audio_cache: 'AudioCache | None' = None
+audio_library: 'AudioLibrary | None' = None
+# the search for a track's preprocess manifest stops here, None for the working directory
+music_root: str | None = None
+# track folder -> (paths and mtimes to check, folder holding the manifest, manifest). The path is the
+# manifest once one is found, otherwise the folders searched, which change when one is written
+_preprocessed_manifests: dict[str, tuple[tuple[tuple[str, int], ...], str | None, dict | None]] = {}
 
 
 class OBSInterfaceException(Exception):
     pass
 
+class OBSPipelineError(ConnectionError):
+    '''The pipelined connection failed, the supervised ones may still be fine.'''
+
+@functools.cache
+def obs_connection_errors() -> tuple[type[Exception], ...]:
+    '''What a dead or desynchronised websocket looks like from obsws_python.'''
+    return (OSError, websocket.WebSocketException, obs.error.OBSSDKTimeoutError, json.JSONDecodeError)
+
+@LazyClass
+def SynchronizedReqClient() -> type:
+    class SynchronizedReqClient(obs.ReqClient):
+        '''A ReqClient that can be shared between threads without them reading each other's responses.'''
+        
+        request_lock: threading.Lock
+        
+        def __init__(self, **kwargs):
+            self.request_lock = threading.Lock()
+            super().__init__(**kwargs)
+        
+        def send(self, param, data=None, raw=False, record: bool = True):
+            with self.request_lock:
+                started = time.perf_counter()
+                try:
+                    return super().send(param, data, raw)
+                finally:
+                    if record:
+                        latency_tracer.record('obs', param, time.perf_counter() - started)
+    return SynchronizedReqClient
+
+class OBSConnectionSupervisor:
+    '''Keeps an active OBS connection and a warm standby, replacing them in the background.'''
+    
+    host: str
+    port: int
+    password: str
+    timeout: float
+    heartbeat_interval: float
+    hold_timeout: float
+    failovers: int
+    reconnects: int
+    _active: SynchronizedReqClient | None
+    _standby: SynchronizedReqClient | None
+    # set when the active connection changes, so the event subscription gets renewed
+    _swapped: bool
+    _condition: threading.Condition
+    _thread: threading.Thread | None
+    _running: bool
+    
+    def __init__(self,
+                 host: str,
+                 port: int,
+                 password: str,
+                 timeout: float = 3,
+                 heartbeat_interval: float = OBS_HEARTBEAT_INTERVAL,
+                 hold_timeout: float = OBS_HOLD_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.hold_timeout = hold_timeout
+        self.failovers = 0
+        self.reconnects = 0
+        self._active = None
+        self._standby = None
+        self._swapped = False
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+    
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        client = self._active
+        if client is None:
+            raise OBSInterfaceException('Not connected to OBS')
+        return getattr(client, name)
+    
+    @property
+    def connected(self) -> bool:
+        return self._active is not None
+    
+    def start(self) -> None:
+        '''Open the active connection, raising if OBS cannot be reached, then start supervising.'''
+        self._active = self._connect()
+        # obsws_python logs a traceback for every refused connection, which would
+        # flood the console while OBS is down and we retry
+        if not logging.getLogger('obsws_python').handlers:
+            logging.getLogger('obsws_python').addHandler(logging.NullHandler())
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='obs-supervisor')
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for client in (self._active, self._standby):
+            if client is not None:
+                self._disconnect(client)
+        self._active = self._standby = None
+    
+    def acquire(self, policy: str = 'hold', timeout: float | None = None) -> SynchronizedReqClient | None:
+        '''Return the active connection or None, waiting up to timeout for one with the hold policy.'''
+        with self._condition:
+            if self._active is None and policy == 'hold':
+                self._condition.wait_for(lambda: self._active is not None or not self._running,
+                                         self.hold_timeout if timeout is None else timeout)
+            return self._active
+    
+    def report_failure(self, client: SynchronizedReqClient) -> None:
+        '''Drop a connection that raised a connection error, failing over to the standby.'''
+        with self._condition:
+            if client is self._active:
+                self._active, self._standby = self._standby, None
+                self._swapped = True
+                if self._active is not None:
+                    self.failovers += 1
+                    log('Warning: Lost the OBS connection, switched to the standby')
+                else:
+                    log('Warning: Lost the OBS connection, reconnecting...')
+            elif client is self._standby:
+                self._standby = None
+            else:
+                return
+            self._condition.notify_all()
+        self._disconnect(client)
+    
+    def _connect(self) -> SynchronizedReqClient:
+        return SynchronizedReqClient(host=self.host, port=self.port, password=self.password, timeout=self.timeout)
+    
+    @staticmethod
+    def _disconnect(client: SynchronizedReqClient) -> None:
+        try:
+            client.base_client.ws.close()
+        except obs_connection_errors():
+            pass
+    
+    def _heartbeat(self, client: SynchronizedReqClient) -> bool:
+        try:
+            # a probe, not a request anyone waited on, so it stays out of the latency stats
+            client.send('GetVersion', record=False)
+            return True
+        except obs_connection_errors():
+            return False
+    
+    def _run(self) -> None:
+        backoff = OBS_RECONNECT_BACKOFF[0]
+        while self._running:
+            wait = self.heartbeat_interval
+            for client in (self._active, self._standby):
+                if client is not None and not self._heartbeat(client):
+                    self.report_failure(client)
+            if self._active is not None and scene_item_resolver is not None:
+                with self._condition:
+                    swapped, self._swapped = self._swapped, False
+                # the standby may be a different OBS than the one the events came from,
+                # and OBS may have restarted, so the mirror starts over on every swap
+                if swapped or not scene_item_resolver.subscribed:
+                    start_scene_item_resolver(self.host, self.port, self.password)
+            if self._active is None or self._standby is None:
+                try:
+                    client = self._connect()
+                except (*obs_connection_errors(), obs.error.OBSSDKError):
+                    wait = backoff
+                    backoff = min(backoff * 2, OBS_RECONNECT_BACKOFF[1])
+                else:
+                    backoff = OBS_RECONNECT_BACKOFF[0]
+                    with self._condition:
+                        reconnected = self._active is None
+                        if reconnected:
+                            self._active = client
+                            self._swapped = True
+                            self.reconnects += 1
+                        else:
+                            self._standby = client
+                        self._condition.notify_all()
+                    if reconnected:
+                        log('Reconnected to OBS')
+                    # fill the other slot and renew the subscription straight away
+                    continue
+            with self._condition:
+                if self._running:
+                    self._condition.wait(wait)
+
+def start_obs_supervisor(host: str,
+                         port: int,
+                         password: str,
+                         heartbeat_interval: float = OBS_HEARTBEAT_INTERVAL,
+                         hold_timeout: float = OBS_HOLD_TIMEOUT) -> OBSConnectionSupervisor:
+    global obs_supervisor
+    if obs_supervisor is not None:
+        obs_supervisor.stop()
+    supervisor = OBSConnectionSupervisor(host, port, password,
+                                         heartbeat_interval=heartbeat_interval, hold_timeout=hold_timeout)
+    supervisor.start()
+    obs_supervisor = supervisor
+    return supervisor
+
+class AsyncOBSClient:
+    '''An obs-websocket v5 client on asyncio that keeps many requests in flight on one socket.'''
+    
+    host: str
+    port: int
+    password: str
+    timeout: float
+    loop: asyncio.AbstractEventLoop
+    _reader: asyncio.StreamReader | None
+    _writer: asyncio.StreamWriter | None
+    _pending: dict[str, asyncio.Future]
+    _request_ids: itertools.count
+    _read_task: asyncio.Task | None
+    _connect_task: asyncio.Task | None
+    _connect_lock: asyncio.Lock
+    _identified: bool
+    _thread: threading.Thread | None
+    
+    def __init__(self, host: str, port: int, password: str, timeout: float = 3):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.loop = asyncio.new_event_loop()
+        self._reader = None
+        self._writer = None
+        self._pending = {}
+        self._request_ids = itertools.count(1)
+        self._read_task = None
+        self._connect_task = None
+        self._connect_lock = asyncio.Lock()
+        self._identified = False
+        self._thread = None
+    
+    @property
+    def connected(self) -> bool:
+        return self._identified
+    
+    def start(self) -> None:
+        '''Start the event loop thread and connect, raising if OBS cannot be reached.'''
+        self._thread = threading.Thread(target=self.loop.run_forever, name='obs-asyncio')
+        self._thread.daemon = True
+        self._thread.start()
+        try:
+            self.call(self.connect())
+        except BaseException:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self._thread = None
+            raise
+    
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self.call(self.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self._thread = None
+    
+    def submit(self, coroutine: Any) -> concurrent.futures.Future:
+        '''Schedule a coroutine on the client\'s loop from any other thread.'''
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+    
+    def call(self, coroutine: Any) -> Any:
+        '''Run a coroutine on the client\'s loop and wait for its result.'''
+        return self.submit(coroutine).result()
+    
+    def reconnect_soon(self) -> None:
+        '''Start connecting in the background unless already connected or connecting.'''
+        def schedule() -> None:
+            if self.connected or (self._connect_task is not None and not self._connect_task.done()):
+                return
+            self._connect_task = self.loop.create_task(self._reconnect())
+        self.loop.call_soon_threadsafe(schedule)
+    
+    async def _reconnect(self) -> None:
+        try:
+            await self.connect()
+        except (*obs_connection_errors(), obs.error.OBSSDKError):
+            pass
+    
+    async def connect(self) -> None:
+        # requests that find the socket down all wait for one handshake instead of each starting their own
+        async with self._connect_lock:
+            if self.connected:
+                return
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+            try:
+                await asyncio.wait_for(self._handshake(), self.timeout)
+            except BaseException:
+                self._drop_connection(ConnectionError('Could not identify with OBS'))
+                raise
+            self._identified = True
+            self._read_task = self.loop.create_task(self._read_loop())
+    
+    async def close(self) -> None:
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        self._drop_connection(ConnectionError('Connection to OBS closed'))
+    
+    async def _handshake(self) -> None:
+        key = base64.b64encode(os.urandom(16)).decode()
+        self._writer.write((
+            'GET / HTTP/1.1\r\n'
+            f'Host: {self.host}:{self.port}\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Key: {key}\r\n'
+            'Sec-WebSocket-Version: 13\r\n'
+            'Sec-WebSocket-Protocol: obswebsocket.json\r\n\r\n').encode())
+        await self._writer.drain()
+        response = await self._reader.readuntil(b'\r\n\r\n')
+        if not response.startswith(b'HTTP/1.1 101'):
+            raise ConnectionError(f'OBS refused the websocket upgrade: {response.splitlines()[0].decode()}')
+        hello = json.loads(await self._read_message())['d']
+        identify = {'rpcVersion': 1, 'eventSubscriptions': 0}
+        if 'authentication' in hello:
+            auth = hello['authentication']
+            secret = base64.b64encode(hashlib.sha256((self.password + auth['salt']).encode()).digest())
+            identify['authentication'] = base64.b64encode(
+                hashlib.sha256(secret + auth['challenge'].encode()).digest()).decode()
+        self._write_message(json.dumps({'op': 1, 'd': identify}))
+        await self._writer.drain()
+        while True:
+            message = await self._read_message()
+            if message is None:
+                raise ConnectionError('OBS closed the connection while identifying, is the password right?')
+            if json.loads(message)['op'] == 2:
+                return
+    
+    def _write_frame(self, opcode: int, payload: bytes) -> None:
+        # client frames must be masked
+        header = bytearray([0x80 | opcode])
+        n = len(payload)
+        if n < 126:
+            header.append(0x80 | n)
+        elif n < 65536:
+            header.append(0x80 | 126)
+            header += struct.pack('>H', n)
+        else:
+            header.append(0x80 | 127)
+            header += struct.pack('>Q', n)
+        mask = os.urandom(4)
+        masked = (int.from_bytes(payload, 'big') ^ int.from_bytes((mask * (n // 4 + 1))[:n], 'big')).to_bytes(n, 'big')
+        self._writer.write(bytes(header) + mask + masked)
+    
+    def _write_message(self, text: str) -> None:
+        self._write_frame(0x1, text.encode())
+    
+    async def _read_message(self) -> str | None:
+        '''Read the next text message, or None once OBS closes the connection.'''
+        message = b''
+        while True:
+            first, second = await self._reader.readexactly(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length, = struct.unpack('>H', await self._reader.readexactly(2))
+            elif length == 127:
+                length, = struct.unpack('>Q', await self._reader.readexactly(8))
+            payload = await self._reader.readexactly(length)
+            if opcode == 0x8:
+                return None
+            if opcode == 0x9:
+                self._write_frame(0xA, payload)
+                continue
+            if opcode == 0xA:
+                continue
+            message += payload
+            if first & 0x80:
+                return message.decode()
+    
+    async def _read_loop(self) -> None:
+        try:
+            while True:
+                message = await self._read_message()
+                if message is None:
+                    break
+                message = json.loads(message)
+                if message['op'] not in (7, 9):
+                    continue
+                future = self._pending.get(message['d']['requestId'])
+                if future is not None and not future.done():
+                    future.set_result(message['d'])
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._drop_connection(ConnectionError('Lost the connection to OBS'))
+    
+    def _drop_connection(self, error: Exception) -> None:
+        self._identified = False
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+    
+    async def _send(self, op: int, data: dict) -> dict:
+        if not self.connected:
+            await self.connect()
+        request_id = str(next(self._request_ids))
+        future = self.loop.create_future()
+        self._pending[request_id] = future
+        try:
+            self._write_message(json.dumps({'op': op, 'd': data | {'requestId': request_id}}))
+            await self._writer.drain()
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError as e:
+            # unlike a ReqClient the socket stays usable, a late response just finds no future
+            raise obs.error.OBSSDKTimeoutError(f'Timeout while waiting for request {request_id}') from e
+        finally:
+            del self._pending[request_id]
+    
+    async def request(self, request_type: str, request_data: dict | None = None) -> dict:
+        '''Send one request and return its responseData, raising OBSSDKRequestError if it failed.'''
+        request = {'requestType': request_type}
+        if request_data:
+            request['requestData'] = request_data
+        result = await self._send(6, request)
+        status = result['requestStatus']
+        if not status['result']:
+            raise obs.error.OBSSDKRequestError(request_type, status['code'], status.get('comment'))
+        return result.get('responseData', {})
+    
+    async def request_batch(self,
+                            requests: list[tuple[str, dict | None]],
+                            execution_type: int | None = None,
+                            halt_on_failure: bool = False) -> list[dict]:
+        '''Send a RequestBatch and return the result of each request in order.'''
+        batch = []
+        for request_type, request_data in requests:
+            request = {'requestType': request_type}
+            if request_data:
+                request['requestData'] = request_data
+            batch.append(request)
+        response = await self._send(8, {
+            'haltOnFailure': halt_on_failure,
+            'executionType': batch_execution_type if execution_type is None else execution_type,
+            'requests': batch,
+        })
+        return response['results']
+    
+    async def send_requests(self, requests: list[tuple[str, dict | None]]) -> list[dict]:
+        '''Send requests as one round trip and return batch-style results, whether or not they fail.'''
+        if len(requests) != 1:
+            return await self.request_batch(requests)
+        request_type, request_data = requests[0]
+        request = {'requestType': request_type}
+        if request_data:
+            request['requestData'] = request_data
+        return [await self._send(6, request)]
+
+def start_async_obs_client(host: str, port: int, password: str) -> AsyncOBSClient:
+    global async_obs_client
+    if async_obs_client is not None:
+        async_obs_client.stop()
+        async_obs_client = None
+    client = AsyncOBSClient(host, port, password)
+    client.start()
+    async_obs_client = client
+    return client
+
+@dataclass
+class DecodedAudio:
+    '''A track decoded to float32 and memory-mapped as a (frames, channels) array.'''
+    
+    filename: str
+    samplerate: int
+    channels: int
+    frames: int
+    data: np.ndarray
+
+def convert_channels(block: np.ndarray, channels: int) -> np.ndarray:
+    '''Map a (frames, n) block onto the given channel count.'''
+    if block.shape[1] == channels:
+        return block
+    if channels == 1:
+        return block.mean(axis=1, keepdims=True)
+    if block.shape[1] == 1:
+        return np.repeat(block, channels, axis=1)
+    if block.shape[1] > channels:
+        return block[:, :channels]
+    # more outputs than inputs: cycle through the inputs
+    return block[:, np.arange(channels) % block.shape[1]]
+
+class LinearResampler:
+    '''Streams blocks through vectorized linear interpolation to another sample rate.'''
+    
+    ratio: float
+    _time: float
+    _previous: np.ndarray | None
+    
+    def __init__(self, from_rate: int, to_rate: int):
+        self.ratio = from_rate / to_rate
+        # position of the next output frame, relative to the previous block's last frame
+        self._time = 0.0
+        self._previous = None
+    
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if self._previous is None:
+            if not len(block):
+                return block
+            self._previous = block[:1]
+            block = block[1:]
+            self._time = 0.0
+        # frame 0 of x is the last frame of the previous block
+        x = np.concatenate([self._previous, block])
+        count = max(int(np.floor((len(x) - 1 - self._time) / self.ratio)) + 1, 0)
+        times = self._time + np.arange(count) * self.ratio
+        index = np.minimum(times.astype(np.int64), len(x) - 2) if len(x) > 1 else np.zeros(count, np.int64)
+        fraction = (times - index)[:, np.newaxis].astype(np.float32)
+        right = x[np.minimum(index + 1, len(x) - 1)]
+        out = x[index] * (1 - fraction) + right * fraction
+        self._time = self._time + count * self.ratio - (len(x) - 1)
+        self._previous = x[-1:]
+        return out.astype(np.float32, copy=False)
+
+@dataclass
+class _AudioCacheEntry:
+    source_mtime_ns: int
+    cache_path: str
+    size: int
+    decoded: DecodedAudio | None = None
+
+class AudioCache:
+    '''Decodes each track once into a raw float32 file and memory-maps it for playback.'''
+    
+    directory: str
+    max_bytes: int
+    _entries: collections.OrderedDict[tuple[str, int | None, int | None], _AudioCacheEntry]
+    _lock: threading.Lock
+    _decoding: dict[tuple[str, int | None, int | None], threading.Event]
+    
+    def __init__(self, directory: str = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._decoding = {}
+        os.makedirs(directory, exist_ok=True)
+        self._load_existing()
+    
+    def _cache_path(self, key: tuple[str, int | None, int | None]) -> str:
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode()).hexdigest() + '.f32')
+    
+    def _load_existing(self) -> None:
+        '''Pick up entries decoded by a previous session, oldest first.'''
+        existing = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r') as f:
+                    meta = json.load(f)
+                cache_path = os.path.join(self.directory, name[:-len('.json')] + '.f32')
+                stat = os.stat(cache_path)
+            except (OSError, ValueError):
+                continue
+            key = (meta['source'], meta.get('target_samplerate'), meta.get('target_channels'))
+            existing.append((stat.st_mtime, key, _AudioCacheEntry(
+                meta['source_mtime_ns'], cache_path, stat.st_size)))
+        for _, key, entry in sorted(existing, key=lambda e: e[0]):
+            self._entries[key] = entry
+    
+    def get(self, filename: str, samplerate: int | None = None, channels: int | None = None) -> DecodedAudio:
+        '''Return the decoded audio for a file in the given format, decoding it first if needed.'''
+        source = os.path.abspath(filename)
+        key = (source, samplerate, channels)
+        source_mtime_ns = os.stat(source).st_mtime_ns
+        while True:
+            with self._lock:
+                decoded = self._cached(key, source_mtime_ns)
+                if decoded is not None:
+                    return decoded
+                # only one thread decodes a file, the others wait for it
+                decoding = self._decoding.get(key)
+                if decoding is None:
+                    self._decoding[key] = threading.Event()
+                    break
+            decoding.wait()
+        try:
+            entry = self._decode(key, source_mtime_ns)
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                self._evict()
+            return entry.decoded
+        finally:
+            with self._lock:
+                self._decoding.pop(key).set()
+    
+    def peek(self, filename: str, samplerate: int | None = None, channels: int | None = None) -> DecodedAudio | None:
+        '''Return the decoded audio for a file if it is already cached, without decoding it.'''
+        source = os.path.abspath(filename)
+        source_mtime_ns = os.stat(source).st_mtime_ns
+        with self._lock:
+            return self._cached((source, samplerate, channels), source_mtime_ns)
+    
+    def _cached(self, key: tuple[str, int | None, int | None], source_mtime_ns: int) -> DecodedAudio | None:
+        '''Look a current entry up, called with the lock held.'''
+        entry = self._entries.get(key)
+        if entry is None or entry.source_mtime_ns != source_mtime_ns:
+            return None
+        self._entries.move_to_end(key)
+        if entry.decoded is None:
+            entry.decoded = self._open(key[0], entry)
+        return entry.decoded
+    
+    def warm(self,
+             filenames: list[str],
+             samplerate: int | None = None,
+             channels: int | None = None) -> threading.Thread:
+        '''Decode files in the background so their first trigger does not have to.'''
+        def warm_all() -> None:
+            for filename in filenames:
+                try:
+                    self.get(filename, samplerate, channels)
+                except (OSError, RuntimeError) as e:
+                    log(f'Warning: Could not cache {filename}: {e}')
+        warm_thread = threading.Thread(target=warm_all)
+        warm_thread.daemon = True
+        warm_thread.start()
+        return warm_thread
+    
+    def _open(self, source: str, entry: _AudioCacheEntry) -> DecodedAudio | None:
+        try:
+            with open(entry.cache_path[:-len('.f32')] + '.json', 'r') as f:
+                meta = json.load(f)
+            data = np.memmap(entry.cache_path, dtype=np.float32, mode='r',
+                             shape=(meta['frames'], meta['channels']))
+        except (OSError, ValueError, KeyError):
+            return None
+        return DecodedAudio(source, meta['samplerate'], meta['channels'], meta['frames'], data)
+    
+    def _decode(self, key: tuple[str, int | None, int | None], source_mtime_ns: int) -> _AudioCacheEntry:
+        source, target_samplerate, target_channels = key
+        cache_path = self._cache_path(key)
+        partial_path = cache_path + '.partial'
+        with sf.SoundFile(source) as soundfile:
+            samplerate = target_samplerate or soundfile.samplerate
+            channels = target_channels or soundfile.channels
+            resampler = (LinearResampler(soundfile.samplerate, samplerate)
+                         if samplerate != soundfile.samplerate else None)
+            frames = 0
+            with open(partial_path, 'wb') as f:
+                for block in soundfile.blocks(AUDIO_DECODE_BLOCKSIZE, dtype='float32', always_2d=True):
+                    block = convert_channels(block, channels)
+                    if resampler is not None:
+                        block = resampler.process(block)
+                    f.write(np.ascontiguousarray(block, dtype=np.float32).tobytes())
+                    frames += len(block)
+        os.replace(partial_path, cache_path)
+        with open(cache_path[:-len('.f32')] + '.json', 'w') as f:
+            json.dump({
+                'source': source,
+                'source_mtime_ns': source_mtime_ns,
+                'target_samplerate': target_samplerate,
+                'target_channels': target_channels,
+                'samplerate': samplerate,
+                'channels': channels,
+                'frames': frames,
+            }, f)
+        entry = _AudioCacheEntry(source_mtime_ns, cache_path, frames * channels * 4)
+        # np.memmap refuses empty files, so silence gets an in-memory array instead
+        data = (np.memmap(cache_path, dtype=np.float32, mode='r', shape=(frames, channels))
+                if frames else np.zeros((0, channels), dtype=np.float32))
+        entry.decoded = DecodedAudio(source, samplerate, channels, frames, data)
+        return entry
+    
+    def _evict(self) -> None:
+        total = sum(entry.size for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes or len(self._entries) == 1:
+                break
+            entry = self._entries.pop(key)
+            total -= entry.size
+            entry.decoded = None
+            try:
+                os.remove(entry.cache_path)
+                os.remove(entry.cache_path[:-len('.f32')] + '.json')
+            except OSError:
+                # still mapped by a playing track on Windows, it gets cleaned up next session
+                pass
+
+def get_audio_cache() -> AudioCache:
+    global audio_cache
+    if audio_cache is None:
+        audio_cache = AudioCache()
+    return audio_cache
+
+def set_audio_cache(directory: str = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_MAX_BYTES) -> AudioCache:
+    global audio_cache
+    audio_cache = AudioCache(directory, max_bytes)
+    return audio_cache
+
+@dataclass
+class LibraryTrack:
+    path: str
+    mtime_ns: int
+    samplerate: int
+    channels: int
+    duration: float
+    tags: tuple[str, ...]
+
+class AudioLibrary:
+    '''An index of the playable tracks in each folder, persisted between sessions.'''
+    
+    index_path: str
+    _tracks: dict[str, LibraryTrack]
+    # files that failed to probe, by mtime, so they aren't retried every scan
+    _unplayable: dict[str, int]
+    _folders: dict[str, list[str]]
+    _lock: threading.Lock
+    
+    def __init__(self, index_path: str = AUDIO_LIBRARY_INDEX):
+        self.index_path = index_path
+        self._tracks = {}
+        self._unplayable = {}
+        self._folders = {}
+        self._lock = threading.Lock()
+        self._load()
+    
+    def _load(self) -> None:
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        for track in index.get('tracks', []):
+            track['tags'] = tuple(track['tags'])
+            self._tracks[track['path']] = LibraryTrack(**track)
+        self._unplayable = index.get('unplayable', {})
+        self._folders = index.get('folders', {})
+    
+    def save(self) -> None:
+        with self._lock:
+            index = {
+                'tracks': [track.__dict__ | {'tags': list(track.tags)} for track in self._tracks.values()],
+                'unplayable': dict(self._unplayable),
+                'folders': {folder: list(paths) for folder, paths in self._folders.items()},
+            }
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        partial_path = self.index_path + '.partial'
+        with open(partial_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(partial_path, self.index_path)
+    
+    @staticmethod
+    def _probe(path: str, mtime_ns: int, tags: tuple[str, ...]) -> LibraryTrack:
+        with sf.SoundFile(path) as soundfile:
+            metadata = soundfile.copy_metadata()
+            duration = soundfile.frames / soundfile.samplerate
+            genres = tuple(tag.strip().lower()
+                           for tag in metadata.get('genre', '').replace(';', ',').split(',')
+                           if tag.strip())
+            return LibraryTrack(path, mtime_ns, soundfile.samplerate, soundfile.channels,
+                                duration, tags + genres)
+    
+    def scan(self, folder: str) -> list[LibraryTrack]:
+        '''Bring the index of a folder up to date and persist it if anything changed.'''
+        folder = os.path.abspath(folder)
+        changed = False
+        paths = []
+        for root, dirs, files in os.walk(folder):
+            # hidden folders hold things like preprocessed copies, not library tracks
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            relative = os.path.relpath(root, folder)
+            tags = () if relative == '.' else tuple(part.lower() for part in relative.split(os.sep))
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                try:
+                    mtime_ns = os.stat(path).st_mtime_ns
+                except OSError:
+                    continue
+                track = self._tracks.get(path)
+                if track is not None and track.mtime_ns == mtime_ns:
+                    paths.append(path)
+                    continue
+                if self._unplayable.get(path) == mtime_ns:
+                    continue
+                changed = True
+                try:
+                    track = self._probe(path, mtime_ns, tags)
+                except (OSError, RuntimeError):
+                    with self._lock:
+                        self._tracks.pop(path, None)
+                        self._unplayable[path] = mtime_ns
+                    continue
+                with self._lock:
+                    self._tracks[path] = track
+                    self._unplayable.pop(path, None)
+                paths.append(path)
+        with self._lock:
+            if self._folders.get(folder) != paths:
+                changed = True
+                # forget files that are gone, unless another indexed folder still has them
+                removed = set(self._folders.get(folder, [])) - set(paths)
+                self._folders[folder] = paths
+                still_indexed = {p for other in self._folders.values() for p in other}
+                for path in removed - still_indexed:
+                    self._tracks.pop(path, None)
+            tracks = [self._tracks[path] for path in paths]
+        if changed:
+            try:
+                self.save()
+            except OSError as e:
+                log(f'Warning: Could not save the audio library index: {e}')
+        return tracks
+    
+    def refresh(self, folders: list[str]) -> threading.Thread:
+        '''Rescan folders in the background.'''
+        def scan_all() -> None:
+            for folder in folders:
+                try:
+                    self.scan(folder)
+                except OSError as e:
+                    log(f'Warning: Could not scan {folder}: {e}')
+        refresh_thread = threading.Thread(target=scan_all)
+        refresh_thread.daemon = True
+        refresh_thread.start()
+        return refresh_thread
+    
+    def tracks(self,
+               folder: str,
+               min_duration: float = 0,
+               tags: list[str] | tuple[str, ...] = ()) -> list[LibraryTrack]:
+        '''Return the indexed tracks of a folder, scanning it only if it has never been indexed.'''
+        folder = os.path.abspath(folder)
+        with self._lock:
+            paths = self._folders.get(folder)
+            tracks = None if paths is None else [self._tracks[path] for path in paths if path in self._tracks]
+        if tracks is None:
+            tracks = self.scan(folder)
+        wanted = {tag.lower() for tag in tags}
+        return [track for track in tracks
+                if track.duration >= min_duration and wanted.issubset(track.tags)]
+    
+    def choose(self,
+               folder: str,
+               min_duration: float = 0,
+               tags: list[str] | tuple[str, ...] = ()) -> LibraryTrack | None:
+        tracks = self.tracks(folder, min_duration, tags)
+        return random.choice(tracks) if tracks else None
+
+def get_audio_library() -> AudioLibrary:
+    global audio_library
+    if audio_library is None:
+        audio_library = AudioLibrary()
+    return audio_library
+
+def set_audio_library(index_path: str = AUDIO_LIBRARY_INDEX) -> AudioLibrary:
+    global audio_library
+    audio_library = AudioLibrary(index_path)
+    return audio_library
+
+def set_music_root(root: str | None) -> None:
+    global music_root
+    music_root = None if root is None else os.path.abspath(root)
+    _preprocessed_manifests.clear()
+
+def _stamps_match(stamps: tuple[tuple[str, int], ...]) -> bool:
+    try:
+        return all(os.stat(path).st_mtime_ns == mtime_ns for path, mtime_ns in stamps)
+    except OSError:
+        return False
+
+def _preprocessed_manifest(track_folder: str) -> tuple[str | None, dict | None]:
+    '''Find the nearest manifest above a track folder, no higher than the music root.'''
+    cached = _preprocessed_manifests.get(track_folder)
+    if cached is not None and _stamps_match(cached[0]):
+        return cached[1], cached[2]
+    root = music_root or os.getcwd()
+    # a track outside the root only has its own folder searched
+    inside_root = os.path.commonpath((root, track_folder)) == root
+    searched = []
+    folder = track_folder
+    while True:
+        manifest_path = os.path.join(folder, PREPROCESSED_DIRNAME, PREPROCESSED_MANIFEST)
+        try:
+            mtime_ns = os.stat(manifest_path).st_mtime_ns
+        except OSError:
+            pass
+        else:
+            try:
+                with open(manifest_path, 'r') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = None
+            _preprocessed_manifests[track_folder] = (((manifest_path, mtime_ns),), folder, manifest)
+            return folder, manifest
+        try:
+            searched.append((folder, os.stat(folder).st_mtime_ns))
+        except OSError:
+            pass
+        parent = os.path.dirname(folder)
+        if not inside_root or folder == root or parent == folder:
+            break
+        folder = parent
+    _preprocessed_manifests[track_folder] = (tuple(searched), None, None)
+    return None, None
+
+def get_preprocessed_path(filename: str, samplerate: int, channels: int) -> str | None:
+    '''Return the normalised copy of a track made by preprocess_music.py, if it is current for this output format.'''
+    source = os.path.abspath(filename)
+    folder, manifest = _preprocessed_manifest(os.path.dirname(source))
+    if manifest is None:
+        return None
+    entry = manifest['tracks'].get(os.path.relpath(source, folder))
+    if (entry is None or manifest['samplerate'] != samplerate or manifest['channels'] != channels
+            or entry['source_mtime_ns'] != os.stat(source).st_mtime_ns):
+        return None
+    return os.path.join(folder, PREPROCESSED_DIRNAME, entry['output'])
+
+class RingBuffer:
+    '''A preallocated lock-free ring of audio frames for one producer and one consumer.'''
+    
+    buffer: np.ndarray
+    capacity: int
+    read_index: int
+    write_index: int
+    
+    def __init__(self, frames: int, channels: int):
+        self.buffer = np.zeros((frames, channels), dtype=np.float32)
+        self.capacity = frames
+        self.read_index = 0
+        self.write_index = 0
+    
+    def readable(self) -> int:
+        return self.write_index - self.read_index
+    
+    def writable(self) -> int:
+        return self.capacity - (self.write_index - self.read_index)
+    
+    def write(self, data: np.ndarray) -> int:
+        '''Copy as many frames of data as fit, returning how many were written.'''
+        n = min(len(data), self.writable())
+        start = self.write_index % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = data[:first]
+        self.buffer[:n - first] = data[first:n]
+        self.write_index += n
+        return n
+    
+    def read_into(self, out: np.ndarray) -> int:
+        '''Copy up to len(out) frames into out, returning how many were read.'''
+        n = min(len(out), self.readable())
+        start = self.read_index % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        out[first:n] = self.buffer[:n - first]
+        self.read_index += n
+        return n
+
+GAIN_CURVES = ('linear', 'equal_power')
+
+class GainAutomation:
+    '''A sample-accurate gain envelope applied in place to (frames, channels) blocks.'''
+    
+    position: int
+    max_frames: int
+    _gain: float
+    # (start frame, length, start gain, end gain, curve, stop at end)
+    _ramp: tuple[int, int, float, float, str, bool] | None
+    _buffer: np.ndarray
+    _index: np.ndarray
+    
+    def __init__(self, max_frames: int = MUSIC_BLOCKSIZE, gain: float = 1.0):
+        self.position = 0
+        self.max_frames = max_frames
+        self._gain = gain
+        self._ramp = None
+        self._buffer = np.empty(max_frames, dtype=np.float32)
+        self._index = np.arange(max_frames, dtype=np.float32)
+    
+    def gain_at(self, frame: int) -> float:
+        ramp = self._ramp
+        if ramp is None:
+            return self._gain
+        start, length, from_gain, to_gain, curve, _ = ramp
+        if frame <= start:
+            return from_gain
+        if frame >= start + length:
+            return to_gain
+        t = (frame - start) / length
+        return from_gain + (to_gain - from_gain) * self._shape(t, curve, from_gain <= to_gain)
+    
+    @staticmethod
+    def _shape(t: float, curve: str, rising: bool) -> float:
+        if curve == 'linear':
+            return t
+        # equal power: sin for rising ramps, 1 - cos for falling ones
+        return math.sin(t * math.pi / 2) if rising else 1.0 - math.cos(t * math.pi / 2)
+    
+    def set_gain(self, gain: float) -> None:
+        self._gain = gain
+        self._ramp = None
+    
+    def ramp_to(self,
+                target: float,
+                length: int,
+                start_frame: int | None = None,
+                curve: str = 'linear',
+                stop_at_end: bool = False) -> None:
+        '''Ramp to target over length frames, starting at start_frame (default: the next frame).'''
+        if curve not in GAIN_CURVES:
+            raise ValueError(f'Gain curve must be one of {", ".join(GAIN_CURVES)}, not \'{curve}\'')
+        if start_frame is None:
+            start_frame = self.position
+        from_gain = self.gain_at(start_frame)
+        # one tuple assignment, so the audio thread sees either the old ramp or the new one
+        self._ramp = (start_frame, max(int(length), 1), from_gain, float(target), curve, stop_at_end)
+    
+    def finished(self) -> bool:
+        '''True once a ramp scheduled with stop_at_end has completed.'''
+        ramp = self._ramp
+        return ramp is not None and ramp[5] and self.position >= ramp[0] + ramp[1]
+    
+    def process(self, data: np.ndarray) -> None:
+        '''Apply the envelope to a block in place and advance position past it.'''
+        for offset in range(0, len(data), self.max_frames):
+            self._process_chunk(data[offset:offset + self.max_frames])
+    
+    def _process_chunk(self, data: np.ndarray) -> None:
+        n = len(data)
+        position = self.position
+        self.position += n
+        ramp = self._ramp
+        if ramp is None or position >= ramp[0] + ramp[1]:
+            gain = self._gain if ramp is None else ramp[3]
+            if gain != 1.0:
+                data *= gain
+            return
+        start, length, from_gain, to_gain, curve, _ = ramp
+        if position + n <= start:
+            if from_gain != 1.0:
+                data *= from_gain
+            return
+        buffer = self._buffer[:n]
+        ramp_begin = min(max(start - position, 0), n)
+        ramp_end = min(max(start + length - position, 0), n)
+        buffer[:ramp_begin] = from_gain
+        buffer[ramp_end:] = to_gain
+        ramp_part = buffer[ramp_begin:ramp_end]
+        # t for each frame of the ramp, computed in place
+        np.add(self._index[:ramp_end - ramp_begin], position + ramp_begin - start, out=ramp_part)
+        ramp_part *= 1.0 / length
+        if curve == 'equal_power':
+            ramp_part *= np.pi / 2
+            if from_gain <= to_gain:
+                np.sin(ramp_part, out=ramp_part)
+            else:
+                np.cos(ramp_part, out=ramp_part)
+                np.subtract(1.0, ramp_part, out=ramp_part)
+        ramp_part *= to_gain - from_gain
+        ramp_part += from_gain
+        data *= buffer[:, np.newaxis]
+
+class StreamedAudio:
+    '''Decodes a track block by block, converted to an output format, for voices that can't wait for the cache.'''
+    
+    samplerate: int
+    channels: int
+    frames: int
+    _soundfile: sf.SoundFile
+    _resampler: LinearResampler | None
+    _pending: np.ndarray
+    _finished: bool
+    
+    def __init__(self, filename: str, samplerate: int, channels: int):
+        self._soundfile = sf.SoundFile(filename)
+        self.samplerate = samplerate
+        self.channels = channels
+        self._resampler = (LinearResampler(self._soundfile.samplerate, samplerate)
+                           if samplerate != self._soundfile.samplerate else None)
+        source_frames = self._soundfile.frames
+        # what LinearResampler produces from the whole track: one frame every ratio source frames
+        self.frames = (math.floor((source_frames - 1) / self._resampler.ratio) + 1
+                       if self._resampler is not None and source_frames else source_frames)
+        self._pending = np.zeros((0, channels), dtype=np.float32)
+        self._finished = False
+    
+    def read(self, frames: int) -> np.ndarray:
+        '''Return the next frames frames, fewer only at the end of the track.'''
+        # resampling changes block lengths, so what is decoded past frames waits for the next read
+        blocks = [self._pending]
+        available = len(self._pending)
+        while available < frames and not self._finished:
+            block = self._soundfile.read(frames, dtype='float32', always_2d=True)
+            if len(block) < frames:
+                self._finished = True
+            block = convert_channels(block, self.channels)
+            if self._resampler is not None:
+                block = self._resampler.process(block)
+            blocks.append(block)
+            available += len(block)
+        data = np.concatenate(blocks) if len(blocks) > 1 else blocks[0]
+        self._pending = data[frames:]
+        return data[:frames]
+    
+    def close(self) -> None:
+        self._soundfile.close()
+
 class SoundPlayer:
+    '''One voice of an AudioMixer: play() feeds the ring buffer and the mixer drains it.'''
     
     filename: str
-    device: int | str
-    soundfile: sf.SoundFile
-    _queue: queue.Queue
+    mixer: 'AudioMixer'
+    audio: DecodedAudio | None
+    _stream: StreamedAudio | None
+    _ring: RingBuffer
     buffer_size: int
     block_size: int
     playing: bool
+    done: bool
+    underruns: int
+    gain: GainAutomation
+    start_frame: int | None
+    _producer_done: bool
+    thread: threading.Thread | None
     
     def __init__(self,
                  filename: str,
-                 device: int | str,
+                 mixer: 'AudioMixer',
                  buffer_size: int = 20,
-                 block_size: int = 2048):
+                 block_size: int = 2048,
+                 fade_in: int = 0,
+                 fade_curve: str = 'linear',
+                 start_frame: int | None = None):
         self.filename = filename
-        self.device = device
-        self.soundfile = sf.SoundFile(filename)
-        self._queue = queue.Queue(maxsize=buffer_size)
+        self.mixer = mixer
+        # decoded straight to the mixer's format so nothing is converted while playing,
+        # preferring a copy that preprocess_music.py has already converted and normalised
+        source = get_preprocessed_path(filename, mixer.samplerate, mixer.channels) or filename
+        cache = get_audio_cache()
+        self.audio = cache.peek(source, mixer.samplerate, mixer.channels)
+        self._stream = None
+        if self.audio is None:
+            # not cached yet, so this play decodes as it goes while the cache fills for the next
+            self._stream = StreamedAudio(source, mixer.samplerate, mixer.channels)
+            cache.warm([source], mixer.samplerate, mixer.channels)
+        self._ring = RingBuffer(buffer_size * block_size, mixer.channels)
         self.buffer_size = buffer_size
         self.block_size = block_size
         self.playing = False
+        self.done = False
+        self.underruns = 0
+        self.gain = GainAutomation(mixer.block_size)
+        if fade_in > 0:
+            self.gain.set_gain(0.0)
+            self.gain.ramp_to(1.0, fade_in, start_frame=0, curve=fade_curve)
+        # mixer frame of the first sample, None to start on the next block
+        self.start_frame = start_frame
+        self._producer_done = False
+        self.thread = None
     
-    def callback(self, outdata, frames, time, status):
-        assert frames == self.block_size
-        if status.output_underflow:
-            log('Output underflow: increase blocksize?', file=sys.stderr)
-            raise sd.CallbackAbort
-        assert not status
-        try:
-            data = self._queue.get_nowait()
-        except queue.Empty as e:
-            log('Buffer is empty: increase buffersize?', file=sys.stderr)
-            raise sd.CallbackAbort from e
-        if len(data) < len(outdata):
-            outdata[:len(data)] = data
-            outdata[len(data):].fill(0)
-            raise sd.CallbackStop
-        else:
-            outdata[:] = data
+    def start_thread(self) -> threading.Thread:
+        self.thread = threading.Thread(target=self.play)
+        self.thread.daemon = True
+        self.thread.start()
+        return self.thread
+    
+    @property
+    def frames(self) -> int:
+        '''Length of the track in mixer frames.'''
+        return self.audio.frames if self.audio is not None else self._stream.frames
+    
+    @property
+    def buffer_fill(self) -> float:
+        '''How full the ring buffer is, from 0 to 1.'''
+        return self._ring.readable() / self._ring.capacity
+    
+    def render(self, out: np.ndarray, position: int) -> None:
+        '''Fill out with the frames of this voice from mixer frame position, on the audio thread.'''
+        if self.start_frame is None:
+            self.start_frame = position
+        offset = self.start_frame - position
+        if offset > 0:
+            # scheduled to start later in this block or after it
+            if offset >= len(out):
+                out.fill(0)
+                return
+            out[:offset].fill(0)
+            out = out[offset:]
+        n = self._ring.read_into(out)
+        out[n:].fill(0)
+        self.gain.process(out)
+        if self.gain.finished():
+            # a fade out has reached silence
+            self.done = True
+        elif n < len(out):
+            if self._producer_done:
+                self.done = True
+            else:
+                self.underruns += 1
     
     def play(self):
         if self.playing:
             return
         self.playing = True
-        self.soundfile.seek(0)
-        music_end_event.clear()
+        self._producer_done = False
         
-        # Pre-fill queue
-        for _ in range(self.buffer_size):
-            data = self.soundfile.read(self.block_size)
-            if not len(data):
-                break
-            self._queue.put_nowait(data)
+        # Blocks are slices of the memory-mapped decoded audio, so reading is free
+        position = 0
+        def read() -> np.ndarray:
+            nonlocal position
+            if self._stream is not None:
+                return self._stream.read(self.block_size)
+            data = self.audio.data[position:position + self.block_size]
+            position += len(data)
+            return data
         
-        # Create output stream
-        stream = sd.OutputStream(
-            samplerate=self.soundfile.samplerate, blocksize=self.block_size,
-            device=self.device, channels=self.soundfile.channels,
-            callback=self.callback, finished_callback=music_end_event.set)
+        # Pre-fill the ring buffer
+        while self._ring.writable() >= self.block_size:
+            data = read()
+            self._ring.write(data)
+            if len(data) < self.block_size:
+                self._producer_done = True
+                break
         
-        with stream:
-            # Keep playing until the entire file has been played
-            timeout = self.block_size * self.buffer_size / self.soundfile.samplerate
-            while len(data):
-                # If the music has been stopped, break
-                if music_end_event.is_set():
-                    break
-                data = self.soundfile.read(self.block_size)
-                global music_fade_out_length
-                if music_fade_out_length > 0:
-                    global current_music_fade_out_progress
-                    if current_music_fade_out_progress == music_fade_out_length:
-                        # done fading out
-                        break
-                    # big range that will be sliced
-                    fade_out = np.arange(1.0, 0.0, -(1.0 / music_fade_out_length))
-                    new_fade_out_progress = current_music_fade_out_progress + len(data)
-                    # fade out progress should cap at the length
-                    if new_fade_out_progress > music_fade_out_length:
-                        new_fade_out_progress = music_fade_out_length
-                        music_fade_out_length = 0
-                        # shorten data to match if fade out progress was shortened
-                        data = data[:(new_fade_out_progress - current_music_fade_out_progress)]
-                    # apply the fade out
-                    fade_out = fade_out[current_music_fade_out_progress:new_fade_out_progress]
-                    data *= np.vstack([fade_out, fade_out]).T
-                    current_music_fade_out_progress = new_fade_out_progress
-                try:
-                    self._queue.put(data, timeout=timeout)
-                except queue.Full:
-                    # yucky fix
-                    pass
-            music_end_event.wait()  # Wait until playback is finished
+        self.mixer.add(self)
+        # Keep feeding the mixer until the voice has finished or been stopped
+        poll_interval = self.block_size / self.mixer.samplerate / 2
+        while not self.done:
+            if self._producer_done or self._ring.writable() < self.block_size:
+                time.sleep(poll_interval)
+                continue
+            data = read()
+            self._ring.write(data)
+            if len(data) < self.block_size:
+                self._producer_done = True
         
         # Clean up
-        music_end_event.clear()
-        self._queue.queue.clear()
+        self.mixer.remove(self)
+        self._ring.read_index = self._ring.write_index
+        self.close()
         self.playing = False
     
+    def stop(self) -> None:
+        self.done = True
+    
+    def _gain_frame(self, mixer_frame: int | None) -> int | None:
+        '''Convert a mixer frame to a frame of this voice's gain envelope, never one already played.'''
+        if mixer_frame is None or self.start_frame is None:
+            return None
+        return max(mixer_frame - self.start_frame, self.gain.position)
+    
+    def fade_out(self, length: int, curve: str = 'linear', start_frame: int | None = None) -> None:
+        '''Fade to silence and stop. start_frame is a mixer frame, by default the next one.'''
+        self.gain.ramp_to(0.0, length, self._gain_frame(start_frame), curve, stop_at_end=True)
+    
+    def duck(self, gain: float, length: int, curve: str = 'linear', start_frame: int | None = None) -> None:
+        self.gain.ramp_to(gain, length, self._gain_frame(start_frame), curve)
+    
+    def restore(self, length: int, curve: str = 'linear', start_frame: int | None = None) -> None:
+        self.gain.ramp_to(1.0, length, self._gain_frame(start_frame), curve)
+    
     def close(self):
-        self.soundfile.close()
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+class AudioMixer:
+    '''Sums any number of voices into one OutputStream that stays open for the whole session.'''
+    
+    device: int | str
+    samplerate: int
+    channels: int
+    block_size: int
+    position: int
+    underflows: int
+    peak: float
+    energy: float
+    _removed_underruns: int
+    _voices: tuple[SoundPlayer, ...]
+    _lock: threading.Lock
+    _scratch: np.ndarray
+    _stream: Any
+    
+    def __init__(self,
+                 device: int | str,
+                 samplerate: int | None = None,
+                 channels: int | None = None,
+                 block_size: int = MUSIC_BLOCKSIZE):
+        if samplerate is None or channels is None:
+            info = sd.query_devices(device, 'output')
+            samplerate = samplerate or int(info['default_samplerate'])
+            channels = channels or min(2, info['max_output_channels'])
+        self.device = device
+        self.samplerate = samplerate
+        self.channels = channels
+        self.block_size = block_size
+        self.position = 0
+        self.underflows = 0
+        self.peak = 0.0
+        self.energy = 0.0
+        self._removed_underruns = 0
+        self._voices = ()
+        self._lock = threading.Lock()
+        self._scratch = np.zeros((block_size, channels), dtype=np.float32)
+        self._stream = None
+    
+    def start(self, stream_factory: Callable[..., Any] | None = None) -> None:
+        '''Open and start the output stream, through stream_factory instead of sd.OutputStream if given.'''
+        if stream_factory is None:
+            stream_factory = sd.OutputStream
+        self._stream = stream_factory(
+            samplerate=self.samplerate, blocksize=self.block_size,
+            device=self.device, channels=self.channels, dtype='float32',
+            callback=self.callback)
+        self._stream.start()
+    
+    def close(self) -> None:
+        for voice in self._voices:
+            voice.stop()
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+    
+    @property
+    def voices(self) -> tuple[SoundPlayer, ...]:
+        return tuple(voice for voice in self._voices if not voice.done)
+    
+    def add(self, voice: SoundPlayer) -> None:
+        with self._lock:
+            self._voices = (*self.voices, voice)
+    
+    def remove(self, voice: SoundPlayer) -> None:
+        with self._lock:
+            self._voices = tuple(v for v in self.voices if v is not voice)
+            self._removed_underruns += voice.underruns
+    
+    @property
+    def voice_underruns(self) -> int:
+        '''Times a voice of this mixer ran out of buffered audio, including voices that have finished.'''
+        return self._removed_underruns + sum(voice.underruns for voice in self.voices)
+    
+    def take_peak(self) -> float:
+        '''Return the highest output sample since the last call and start over.'''
+        peak, self.peak = self.peak, 0.0
+        return peak
+    
+    def callback(self, outdata, frames, time, status):
+        # runs on the audio thread: no allocations and no locks in here
+        if status.output_underflow:
+            self.underflows += 1
+        outdata.fill(0)
+        if frames > len(self._scratch):
+            self._scratch = np.zeros((frames, self.channels), dtype=np.float32)
+        scratch = self._scratch[:frames]
+        for voice in self._voices:
+            if voice.done:
+                continue
+            voice.render(scratch, self.position)
+            outdata += scratch
+        np.clip(outdata, -1.0, 1.0, out=outdata)
+        # level meters, measured into the scratch buffer now that mixing is done with it
+        np.abs(outdata, out=scratch)
+        peak = float(scratch.max())
+        if peak > self.peak:
+            self.peak = peak
+        self.energy += float(np.vdot(outdata, outdata))
+        self.position += frames
+
+def get_audio_mixer(device: int | str) -> AudioMixer:
+    '''Return the mixer for a device, opening its stream the first time.'''
+    with audio_mixers_lock:
+        mixer = audio_mixers.get(device)
+        if mixer is None:
+            mixer = AudioMixer(device)
+            mixer.start()
+            audio_mixers[device] = mixer
+        return mixer
+
+def playing_voices() -> list[SoundPlayer]:
+    return [voice for mixer in list(audio_mixers.values()) for voice in mixer.voices]
 
 def create_music_thread(filename: str,
                         device: int | str,
                         buffer_size = 20,
-                        block_size = 2048) -> threading.Thread:
-    music_thread = threading.Thread(
-        target=SoundPlayer(filename, device, buffer_size, block_size).play)
-    music_thread.daemon = True
-    music_thread.start()
-    return music_thread
-
-def play_random_audio(folder_path: str, device: int | str | None) -> threading.Thread:
+                        block_size = 2048,
+                        fade_in: int = 0,
+                        fade_curve: str = 'linear',
+                        start_frame: int | None = None) -> SoundPlayer:
+    '''Start playing a file on its own thread. The returned voice can be faded or stopped, and its thread joined.'''
+    player = SoundPlayer(filename, get_audio_mixer(device), buffer_size, block_size, fade_in, fade_curve, start_frame)
+    player.start_thread()
+    return player
+
+def play_random_audio(folder_path: str,
+                      device: int | str | None,
+                      fade_in: int = 0,
+                      fade_curve: str = 'linear',
+                      min_duration: float = 0,
+                      tags: list[str] | tuple[str, ...] = (),
+                      start_frames: dict[AudioMixer, int] | None = None) -> SoundPlayer | None:
+    '''Play a random track from a folder. start_frames maps mixers to the frame to start on.'''
+    if device is None:
+        log('Error: To play audio, \'use_output_audio\' must be set to true in config.json')
+        return None
+    song = get_audio_library().choose(folder_path, min_duration, tags)
+    if song is None:
+        log(f'Error: No playable audio in {folder_path} matches the filters')
+        return None
+    start_frame = start_frames.get(get_audio_mixer(device)) if start_frames else None
+    return create_music_thread(song.path, device, fade_in=fade_in, fade_curve=fade_curve, start_frame=start_frame)
+
+class ShuffleBag:
+    '''Draws items in random order without repeats until every item has been drawn.'''
+    
+    items: list
+    _remaining: list
+    _last: Any
+    
+    def __init__(self, items: list):
+        self.items = list(items)
+        self._remaining = []
+        self._last = None
+    
+    def draw(self) -> Any:
+        if not self._remaining:
+            self._remaining = self.items.copy()
+            random.shuffle(self._remaining)
+            # don't play the last track of one round first in the next
+            if len(self._remaining) > 1 and self._remaining[-1] == self._last:
+                self._remaining[0], self._remaining[-1] = self._remaining[-1], self._remaining[0]
+        self._last = self._remaining.pop()
+        return self._last
+
+class Playlist:
+    '''Plays a folder track after track on one mixer, gaplessly or with a crossfade.'''
+    
+    PREFETCH_SECONDS = 10
+    
+    folder: str
+    mixer: AudioMixer
+    crossfade: int
+    curve: str
+    shuffle: bool
+    current: SoundPlayer | None
+    upcoming: SoundPlayer | None
+    _tracks: ShuffleBag | itertools.cycle
+    _stopped: threading.Event
+    
+    def __init__(self,
+                 folder: str,
+                 mixer: AudioMixer,
+                 crossfade: int = 0,
+                 curve: str = 'equal_power',
+                 shuffle: bool = True,
+                 min_duration: float = 0,
+                 tags: list[str] | tuple[str, ...] = ()):
+        self.folder = folder
+        self.mixer = mixer
+        self.crossfade = crossfade
+        self.curve = curve
+        self.shuffle = shuffle
+        self.current = None
+        self.upcoming = None
+        tracks = [track.path for track in get_audio_library().tracks(folder, min_duration, tags)]
+        if not tracks:
+            raise OSError(f'No tracks in {folder}')
+        self._tracks = ShuffleBag(tracks) if shuffle else itertools.cycle(tracks)
+        self._stopped = threading.Event()
+    
+    def next_track(self) -> str:
+        return self._tracks.draw() if self.shuffle else next(self._tracks)
+    
+    def start(self) -> threading.Thread:
+        playlist_thread = threading.Thread(target=self.run)
+        playlist_thread.daemon = True
+        playlist_thread.start()
+        return playlist_thread
+    
+    def stop(self) -> None:
+        self._stopped.set()
+        for voice in (self.current, self.upcoming):
+            if voice is not None:
+                voice.stop()
+    
+    def _start_voice(self, voice: SoundPlayer) -> None:
+        voice.start_thread()
+    
+    def _prepare(self, track: str, fade_in: int) -> SoundPlayer | None:
+        try:
+            # a track the cache doesn't have yet streams, and is cached in the background for next time
+            voice = SoundPlayer(track, self.mixer, fade_in=fade_in, fade_curve=self.curve)
+        except (OSError, RuntimeError) as e:
+            log(f'Warning: Skipping {track}: {e}')
+            return None
+        if voice.audio is not None:
+            # touch the first seconds so the memory-mapped pages are resident before they play
+            float(voice.audio.data[:self.PREFETCH_SECONDS * voice.audio.samplerate].sum())
+        return voice
+    
+    def run(self) -> None:
+        voice = None
+        while voice is None and not self._stopped.is_set():
+            voice = self._prepare(self.next_track(), 0)
+        if voice is None:
+            return
+        self.current = voice
+        self._start_voice(voice)
+        
+        while not self._stopped.is_set():
+            voice = self.current
+            upcoming = None
+            while upcoming is None and not self._stopped.is_set():
+                upcoming = self._prepare(self.next_track(), self.crossfade)
+            if upcoming is None:
+                break
+            self.upcoming = upcoming
+            
+            # the end of the current track is only known once it has started
+            while voice.start_frame is None and not voice.done:
+                time.sleep(0.01)
+            if voice.done:
+                break
+            crossfade = min(self.crossfade, voice.frames // 2, upcoming.frames // 2)
+            if crossfade > 0:
+                voice.gain.ramp_to(0.0, crossfade, start_frame=voice.frames - crossfade,
+                                   curve=self.curve, stop_at_end=True)
+            end_frame = voice.start_frame + voice.frames
+            upcoming.start_frame = end_frame - crossfade
+            self._start_voice(upcoming)
+            
+            while not voice.done and not self._stopped.is_set():
+                time.sleep(0.05)
+            if self.mixer.position < end_frame - crossfade - self.mixer.block_size:
+                # stopped or faded out before the end, which ends the playlist too
+                break
+            self.current, self.upcoming = upcoming, None
+        self.stop()
+        with active_playlists_lock:
+            if self in active_playlists:
+                active_playlists.remove(self)
+
+def play_playlist(folder_path: str,
+                  device: int | str | None,
+                  crossfade: int = 0,
+                  curve: str = 'equal_power',
+                  shuffle: bool = True,
+                  min_duration: float = 0,
+                  tags: list[str] | tuple[str, ...] = ()) -> Playlist | None:
     if device is None:
         log('Error: To play audio, \'use_output_audio\' must be set to true in config.json')
-    songs = os.listdir(folder_path)
-    song = random.choice(songs)
-    return create_music_thread(os.path.join(folder_path, song), device)
+        return None
+    try:
+        playlist = Playlist(folder_path, get_audio_mixer(device), crossfade, curve, shuffle, min_duration, tags)
+    except OSError as e:
+        log(f'Error: {e}')
+        return None
+    with active_playlists_lock:
+        # only one playlist at a time, a new one replaces the old
+        for old in active_playlists:
+            old.stop()
+        active_playlists.clear()
+        active_playlists.append(playlist)
+    playlist.start()
+    return playlist
+
+# start_frames maps each mixer to the frame its voices start the ramp on, by default the next one
+
+def fade_out_audio(length: int, curve: str = 'linear', start_frames: dict[AudioMixer, int] | None = None) -> None:
+    for voice in playing_voices():
+        voice.fade_out(length, curve, start_frames.get(voice.mixer) if start_frames else None)
+
+def duck_audio(gain: float,
+               length: int,
+               curve: str = 'linear',
+               start_frames: dict[AudioMixer, int] | None = None) -> None:
+    for voice in playing_voices():
+        voice.duck(gain, length, curve, start_frames.get(voice.mixer) if start_frames else None)
 
-def fade_out_audio(length: int) -> None:
-    global music_fade_out_length
-    global current_music_fade_out_progress
-    music_fade_out_length = length
-    current_music_fade_out_progress = 0
+def restore_audio(length: int, curve: str = 'linear', start_frames: dict[AudioMixer, int] | None = None) -> None:
+    for voice in playing_voices():
+        voice.restore(length, curve, start_frames.get(voice.mixer) if start_frames else None)
 
 def stop_audio() -> None:
-    music_end_event.set()
+    with active_playlists_lock:
+        for playlist in active_playlists:
+            playlist.stop()
+        active_playlists.clear()
+    for voice in playing_voices():
+        voice.stop()
+
+@LazyClass
+def WatchedEventClient() -> type:
+    class WatchedEventClient(obs.EventClient):
+        '''An EventClient that calls on_lost if its listener thread dies while subscribed.'''
+        
+        on_lost: Callable[[], None]
+        
+        def __init__(self, on_lost: Callable[[], None], **kwargs):
+            self.on_lost = on_lost
+            super().__init__(**kwargs)
+        
+        def trigger(self):
+            try:
+                super().trigger()
+            except Exception as e:
+                # unsubscribe() clears running before closing the socket, so that is not a loss
+                if self.running:
+                    log(f'Warning: Lost the OBS event subscription ({type(e).__name__}: {e})')
+                    self.running = False
+                    self.on_lost()
+    return WatchedEventClient
+
+class SceneItemResolver:
+    '''Caches (scene, source) -> sceneItemId so visibility toggles only cost one request.'''
+    
+    host: str
+    port: int
+    password: str
+    subscribed: bool
+    _items: dict[tuple[str, str], int]
+    _lock: threading.Lock
+    _event_client: WatchedEventClient | None
+    
+    def __init__(self, host: str, port: int, password: str):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.subscribed = False
+        self._items = {}
+        self._lock = threading.Lock()
+        self._event_client = None
+    
+    def start(self) -> None:
+        '''Subscribe to scene item events and prefetch every scene in the background.'''
+        try:
+            self._event_client = WatchedEventClient(
+                self.subscription_lost,
+                host=self.host,
+                port=self.port,
+                password=self.password,
+                subs=self.event_subscriptions())
+            self._event_client.callback.register(self.event_callbacks())
+            self.subscribed = True
+        except Exception as e:
+            # without events the cache can still go stale, which resolve() recovers from
+            log(f'Warning: Could not subscribe to OBS events ({e}), scene item cache will not auto-refresh')
+            self._event_client = None
+        prefetch_thread = threading.Thread(target=self.prefetch)
+        prefetch_thread.daemon = True
+        prefetch_thread.start()
+    
+    def subscription_lost(self) -> None:
+        '''Called when the events stop coming, the supervisor subscribes again on its next heartbeat.'''
+        self.subscribed = False
+    
+    def stop(self) -> None:
+        self.subscribed = False
+        if self._event_client is not None:
+            try:
+                self._event_client.unsubscribe()
+            except obs_connection_errors():
+                # already gone with the connection
+                pass
+            self._event_client = None
+    
+    def event_subscriptions(self) -> int:
+        return obs.Subs.SCENES | obs.Subs.INPUTS | obs.Subs.SCENEITEMS
+    
+    def event_callbacks(self) -> list[Callable[[Any], None]]:
+        return [
+            self.on_scene_item_created,
+            self.on_scene_item_removed,
+            self.on_input_name_changed,
+            self.on_scene_name_changed,
+            self.on_scene_removed,
+        ]
+    
+    def prefetch(self) -> None:
+        '''Run load() using a separate short-lived connection.'''
+        # a dedicated client so the prefetch never interleaves with hot-path requests
+        try:
+            with obs.ReqClient(host=self.host, port=self.port, password=self.password, timeout=3) as client:
+                self.load(client)
+        except Exception as e:
+            log(f'Warning: Could not prefetch scene items: {e}')
+    
+    def load(self, obs_client: obs.ReqClient) -> None:
+        '''Load the item IDs of every scene.'''
+        for scene in obs_client.get_scene_list().scenes:
+            self.load_scene(obs_client, scene['sceneName'])
+    
+    def load_scene(self, obs_client: obs.ReqClient, scene_name: str) -> list[dict]:
+        '''Fetch every item of a scene and replace its cached entries.'''
+        scene_items = obs_client.get_scene_item_list(name=scene_name).scene_items
+        with self._lock:
+            for key in [k for k in self._items if k[0] == scene_name]:
+                del self._items[key]
+            # reversed so the first matching item wins, like get_source
+            for item in reversed(scene_items):
+                self._items[(scene_name, item['sourceName'])] = item['sceneItemId']
+        return scene_items
+    
+    def resolve(self, obs_client: obs.ReqClient, scene_name: str, source_name: str) -> int:
+        '''Return the scene item ID of a source, scanning the scene only on a miss.'''
+        with self._lock:
+            item_id = self._items.get((scene_name, source_name))
+        if item_id is not None:
+            return item_id
+        self.load_scene(obs_client, scene_name)
+        with self._lock:
+            item_id = self._items.get((scene_name, source_name))
+        if item_id is None:
+            raise OBSInterfaceException(f'Could not find source {source_name} in scene {scene_name}.')
+        return item_id
+    
+    def invalidate(self, scene_name: str, source_name: str | None = None) -> None:
+        with self._lock:
+            if source_name is not None:
+                self._items.pop((scene_name, source_name), None)
+                return
+            for key in [k for k in self._items if k[0] == scene_name]:
+                del self._items[key]
+    
+    # OBS event callbacks, matched by name in obsws_python's Callback
+    
+    def on_scene_item_created(self, data: Any) -> None:
+        with self._lock:
+            self._items.setdefault((data.scene_name, data.source_name), data.scene_item_id)
+    
+    def on_scene_item_removed(self, data: Any) -> None:
+        with self._lock:
+            if self._items.get((data.scene_name, data.source_name)) == data.scene_item_id:
+                del self._items[(data.scene_name, data.source_name)]
+    
+    def on_input_name_changed(self, data: Any) -> None:
+        with self._lock:
+            for scene_name, source_name in [k for k in self._items if k[1] == data.old_input_name]:
+                self._items[(scene_name, data.input_name)] = self._items.pop((scene_name, source_name))
+    
+    def on_scene_name_changed(self, data: Any) -> None:
+        with self._lock:
+            for scene_name, source_name in [k for k in self._items if k[0] == data.old_scene_name]:
+                self._items[(data.scene_name, source_name)] = self._items.pop((scene_name, source_name))
+    
+    def on_scene_removed(self, data: Any) -> None:
+        self.invalidate(data.scene_name)
+
+class OBSStateMirror(SceneItemResolver):
+    '''A local copy of the OBS state the bindings change, kept current from OBS events.'''
+    
+    MAX_WRITES_IN_FLIGHT = 16
+    
+    skipped: int
+    rewritten: int
+    # ('program',), ('preview',), ('transition',), ('mute', input_name) and
+    # ('enabled', scene_name, scene_item_id), None while unsure so requests for it are sent
+    _state: dict[tuple, Any]
+    _writes: dict[tuple, collections.deque]
+    
+    def __init__(self, host: str, port: int, password: str):
+        super().__init__(host, port, password)
+        self.skipped = 0
+        self.rewritten = 0
+        self._state = {}
+        self._writes = {}
+    
+    def get(self, key: tuple) -> Any:
+        with self._lock:
+            return self._state.get(key)
+    
+    def subscription_lost(self) -> None:
+        super().subscription_lost()
+        with self._lock:
+            self._clear()
+    
+    def scene_item_enabled(self, scene_name: str, item_id: int) -> bool | None:
+        return self.get(('enabled', scene_name, item_id))
+    
+    def load(self, obs_client: obs.ReqClient) -> None:
+        scene_list = obs_client.get_scene_list()
+        transition = obs_client.get_current_scene_transition().transition_name
+        mutes = {}
+        for item in obs_client.get_input_list().inputs:
+            try:
+                mutes[item['inputName']] = obs_client.get_input_mute(item['inputName']).input_muted
+            except obs.error.OBSSDKRequestError:
+                # not an audio input
+                pass
+        with self._lock:
+            self._observe(('program',), scene_list.current_program_scene_name)
+            self._observe(('preview',), scene_list.current_preview_scene_name)
+            self._observe(('transition',), transition)
+            for name, muted in mutes.items():
+                self._observe(('mute', name), muted)
+        for scene in scene_list.scenes:
+            self.load_scene(obs_client, scene['sceneName'])
+    
+    def load_scene(self, obs_client: obs.ReqClient, scene_name: str) -> list[dict]:
+        scene_items = super().load_scene(obs_client, scene_name)
+        with self._lock:
+            for item in scene_items:
+                self._observe(('enabled', scene_name, item['sceneItemId']), item['sceneItemEnabled'])
+        return scene_items
+    
+    @staticmethod
+    def _request_target(request_type: str, request_data: dict | None) -> tuple[tuple, Any] | None:
+        '''The state key a request sets and the value it sets it to, if it is a plain set.'''
+        match request_type:
+            case 'SetCurrentProgramScene':
+                return ('program',), request_data['sceneName']
+            case 'SetCurrentPreviewScene':
+                return ('preview',), request_data['sceneName']
+            case 'SetCurrentSceneTransition':
+                return ('transition',), request_data['transitionName']
+            case 'SetInputMute':
+                return ('mute', request_data['inputName']), request_data['inputMuted']
+            case 'SetSceneItemEnabled':
+                return ('enabled', request_data['sceneName'], request_data['sceneItemId']), request_data['sceneItemEnabled']
+        return None
+    
+    def filter_request(self, request_type: str, request_data: dict | None) -> tuple[str, dict | None] | None:
+        '''Return the request to send in place of this one, or None if it would change nothing.'''
+        if not self.subscribed:
+            # nothing keeps the state current without events, so everything is sent as is
+            with self._lock:
+                self._clear()
+            return request_type, request_data
+        if request_type == 'ToggleInputMute':
+            key = ('mute', request_data['inputName'])
+            with self._lock:
+                muted = self._state.get(key)
+                if muted is None:
+                    return request_type, request_data
+                self._write(key, not muted)
+                self.rewritten += 1
+            return 'SetInputMute', {'inputName': request_data['inputName'], 'inputMuted': not muted}
+        if request_type == 'TriggerStudioModeTransition':
+            # whether the old program scene lands in preview depends on OBS settings,
+            # so forget both until the events say what happened
+            with self._lock:
+                self._forget(('program',))
+                self._forget(('preview',))
+            return request_type, request_data
+        target = self._request_target(request_type, request_data)
+        if target is None:
+            return request_type, request_data
+        key, value = target
+        with self._lock:
+            if self._state.get(key) == value:
+                self.skipped += 1
+                return None
+            self._write(key, value)
+        return request_type, request_data
+    
+    def request_failed(self, request_type: str, request_data: dict | None) -> None:
+        '''Undo what filter_request() assumed about a request that did not go through.'''
+        target = self._request_target(request_type, request_data)
+        if target is None:
+            return
+        with self._lock:
+            self._forget(target[0])
+    
+    # the helpers below expect _lock to be held
+    
+    def _clear(self) -> None:
+        self._state.clear()
+        self._writes.clear()
+    
+    def _write(self, key: tuple, value: Any) -> None:
+        writes = self._writes.get(key)
+        if writes is None:
+            writes = self._writes[key] = collections.deque(maxlen=self.MAX_WRITES_IN_FLIGHT)
+        writes.append(value)
+        self._state[key] = value
+    
+    def _forget(self, key: tuple) -> None:
+        self._writes.pop(key, None)
+        self._state[key] = None
+    
+    def _observe(self, key: tuple, value: Any) -> None:
+        '''Take a value reported by OBS, reconciling it with our writes still in flight.'''
+        writes = self._writes.get(key)
+        if not writes:
+            self._state[key] = value
+            return
+        if value not in writes:
+            # changed by someone else while our writes were in flight, so nothing is certain
+            self._forget(key)
+            return
+        # confirms our writes up to this one, the rest are still on their way
+        while writes.popleft() != value:
+            pass
+        self._state[key] = writes[-1] if writes else value
+    
+    def event_subscriptions(self) -> int:
+        return super().event_subscriptions() | obs.Subs.TRANSITIONS | obs.Subs.UI
+    
+    def event_callbacks(self) -> list[Callable[[Any], None]]:
+        return super().event_callbacks() + [
+            self.on_current_program_scene_changed,
+            self.on_current_preview_scene_changed,
+            self.on_current_scene_transition_changed,
+            self.on_input_mute_state_changed,
+            self.on_input_removed,
+            self.on_scene_item_enable_state_changed,
+            self.on_studio_mode_state_changed,
+        ]
+    
+    def on_current_program_scene_changed(self, data: Any) -> None:
+        with self._lock:
+            self._observe(('program',), data.scene_name)
+    
+    def on_current_preview_scene_changed(self, data: Any) -> None:
+        with self._lock:
+            self._observe(('preview',), data.scene_name)
+    
+    def on_current_scene_transition_changed(self, data: Any) -> None:
+        with self._lock:
+            self._observe(('transition',), data.transition_name)
+    
+    def on_input_mute_state_changed(self, data: Any) -> None:
+        with self._lock:
+            self._observe(('mute', data.input_name), data.input_muted)
+    
+    def on_scene_item_enable_state_changed(self, data: Any) -> None:
+        with self._lock:
+            self._observe(('enabled', data.scene_name, data.scene_item_id), data.scene_item_enabled)
+    
+    def on_studio_mode_state_changed(self, data: Any) -> None:
+        with self._lock:
+            self._forget(('preview',))
+    
+    def on_input_removed(self, data: Any) -> None:
+        with self._lock:
+            self._state.pop(('mute', data.input_name), None)
+            self._writes.pop(('mute', data.input_name), None)
+    
+    def on_input_name_changed(self, data: Any) -> None:
+        super().on_input_name_changed(data)
+        with self._lock:
+            self._forget(('mute', data.old_input_name))
+            self._forget(('mute', data.input_name))
+    
+    def on_scene_item_removed(self, data: Any) -> None:
+        super().on_scene_item_removed(data)
+        with self._lock:
+            self._state.pop(('enabled', data.scene_name, data.scene_item_id), None)
+            self._writes.pop(('enabled', data.scene_name, data.scene_item_id), None)
+    
+    def on_scene_name_changed(self, data: Any) -> None:
+        super().on_scene_name_changed(data)
+        self._drop_scene(data.old_scene_name)
+    
+    def on_scene_removed(self, data: Any) -> None:
+        super().on_scene_removed(data)
+        self._drop_scene(data.scene_name)
+    
+    def _drop_scene(self, scene_name: str) -> None:
+        with self._lock:
+            for key in [k for k in self._state if k[0] == 'enabled' and k[1] == scene_name]:
+                del self._state[key]
+                self._writes.pop(key, None)
+            for key in (('program',), ('preview',)):
+                if self._state.get(key) == scene_name:
+                    self._forget(key)
 
 def get_source(obs_client: obs.ReqClient, scene_name: str, source_name: str) -> Any:
     scene_items = obs_client.get_scene_item_list(name=scene_name).scene_items
@@ -174,67 +2168,1390 @@ def get_source(obs_client: obs.ReqClient, scene_name: str, source_name: str) ->
             return scene
     raise OBSInterfaceException(f'Could not find source {source_name} in scene {scene_name}.')
 
+def get_source_id(obs_client: obs.ReqClient, scene_name: str, source_name: str) -> int:
+    if scene_item_resolver is None:
+        return get_source(obs_client, scene_name, source_name)['sceneItemId']
+    return scene_item_resolver.resolve(obs_client, scene_name, source_name)
+
 def set_source_visibility(obs_client: obs.ReqClient, scene_name: str, source_name: str, visible: bool) -> None:
-    source = get_source(obs_client, scene_name, source_name)
-    obs_client.set_scene_item_enabled(scene_name=scene_name, item_id=source['sceneItemId'], enabled=visible)
+    item_id = get_source_id(obs_client, scene_name, source_name)
+    try:
+        obs_client.set_scene_item_enabled(scene_name=scene_name, item_id=item_id, enabled=visible)
+    except obs.error.OBSSDKRequestError:
+        if scene_item_resolver is None:
+            raise
+        # the cached ID may be stale if an event was missed, so look it up once more
+        scene_item_resolver.invalidate(scene_name, source_name)
+        item_id = get_source_id(obs_client, scene_name, source_name)
+        obs_client.set_scene_item_enabled(scene_name=scene_name, item_id=item_id, enabled=visible)
 
 def get_source_visibility(obs_client: obs.ReqClient, scene_name: str, source_name: str) -> bool:
-    source = get_source(obs_client, scene_name, source_name)
-    return source['sceneItemEnabled']
+    if scene_item_resolver is None:
+        return get_source(obs_client, scene_name, source_name)['sceneItemEnabled']
+    item_id = get_source_id(obs_client, scene_name, source_name)
+    if obs_state is not None:
+        enabled = obs_state.scene_item_enabled(scene_name, item_id)
+        if enabled is not None:
+            return enabled
+    return obs_client.get_scene_item_enabled(scene_name=scene_name, item_id=item_id).scene_item_enabled
+
+def start_scene_item_resolver(host: str, port: int, password: str) -> SceneItemResolver:
+    '''Start the resolver, which is also the OBS state mirror if mirroring is on.'''
+    global scene_item_resolver, obs_state
+    if scene_item_resolver is not None:
+        scene_item_resolver.stop()
+    if obs_state_mirroring:
+        scene_item_resolver = obs_state = OBSStateMirror(host, port, password)
+    else:
+        scene_item_resolver, obs_state = SceneItemResolver(host, port, password), None
+    scene_item_resolver.start()
+    return scene_item_resolver
+
+def set_obs_state_mirroring(enabled: bool) -> None:
+    '''Takes effect the next time the resolver is started.'''
+    global obs_state_mirroring
+    obs_state_mirroring = enabled
+
+class InputBackend:
+    '''Where the spectator controller sends its input events.'''
+    
+    def click(self, button: str) -> None:
+        '''Click the \'left\' or \'right\' mouse button.'''
+        raise NotImplementedError
+    
+    def press_key(self, key: str) -> None:
+        raise NotImplementedError
+
+class Win32InputBackend(InputBackend):
+    
+    def __init__(self):
+        # imported here so the rest of the module works without pywin32
+        import win32api, win32con
+        self._mouse_event = win32api.mouse_event
+        self._buttons = {
+            'left': (win32con.MOUSEEVENTF_LEFTDOWN, win32con.MOUSEEVENTF_LEFTUP),
+            'right': (win32con.MOUSEEVENTF_RIGHTDOWN, win32con.MOUSEEVENTF_RIGHTUP),
+        }
+    
+    def click(self, button: str) -> None:
+        down, up = self._buttons[button]
+        self._mouse_event(down, 0, 0, 0, 0)
+        self._mouse_event(up, 0, 0, 0, 0)
+    
+    def press_key(self, key: str) -> None:
+        keyboard.send(key)
+
+class RecordingInputBackend(InputBackend):
+    '''Records events with monotonic timestamps instead of sending them, for testing.'''
+    
+    events: list[tuple[float, str, str]]
+    
+    def __init__(self):
+        self.events = []
+    
+    def click(self, button: str) -> None:
+        self.events.append((time.monotonic(), 'click', button))
+    
+    def press_key(self, key: str) -> None:
+        self.events.append((time.monotonic(), 'key', key))
+
+class SpectatorController:
+    '''Moves the game's spectator camera to the target player.'''
+    
+    backend: InputBackend
+    click_delay: float
+    direct_select_keys: dict[int, str]
+    current_index: int
+    target_index: int
+    _condition: threading.Condition
+    _running: bool
+    
+    def __init__(self,
+                 backend: InputBackend,
+                 click_delay: float = 0.0,
+                 direct_select_keys: list[str] | dict[int, str] | None = None):
+        self.backend = backend
+        self.click_delay = click_delay
+        if isinstance(direct_select_keys, list):
+            direct_select_keys = dict(enumerate(direct_select_keys))
+        self.direct_select_keys = {int(i): key for i, key in (direct_select_keys or {}).items() if key}
+        self.current_index = 0
+        self.target_index = 0
+        self._condition = threading.Condition()
+        self._running = False
+    
+    def start(self) -> threading.Thread:
+        self._running = True
+        controller_thread = threading.Thread(target=self.run)
+        controller_thread.daemon = True
+        controller_thread.start()
+        return controller_thread
+    
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+    
+    def set_target(self, index: int) -> None:
+        with self._condition:
+            self.target_index = index
+            self._condition.notify_all()
+    
+    def wait_until_idle(self, timeout: float | None = None) -> bool:
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self.current_index == self.target_index or not self._running, timeout)
+    
+    def run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self.current_index != self.target_index or not self._running)
+                if not self._running:
+                    return
+                target = self.target_index
+            key = self.direct_select_keys.get(target)
+            if key is not None:
+                self.backend.press_key(key)
+                self._moved_to(target)
+                continue
+            button = 'right' if target > self.current_index else 'left'
+            for _ in range(abs(target - self.current_index)):
+                self.backend.click(button)
+                self._moved_to(self.current_index + (1 if button == 'right' else -1))
+                if self.target_index != target:
+                    # retargeted mid-sequence, work out a new sequence from here
+                    break
+                if self.click_delay > 0:
+                    time.sleep(self.click_delay)
+    
+    def _moved_to(self, index: int) -> None:
+        with self._condition:
+            self.current_index = index
+            self._condition.notify_all()
+
+def get_spectator_controller() -> SpectatorController:
+    # built on the first spectator action, so startup never loads pywin32 and other platforms never need it
+    if spectator_controller is None:
+        start_spectator_controller(Win32InputBackend(), spectator_click_delay, spectator_direct_select_keys)
+    return spectator_controller
+
+def set_spectator_options(click_delay: float = 0.0,
+                          direct_select_keys: list[str] | dict[int, str] | None = None) -> None:
+    '''Takes effect the next time the controller is started.'''
+    global spectator_click_delay, spectator_direct_select_keys
+    spectator_click_delay = click_delay
+    spectator_direct_select_keys = direct_select_keys
+
+def start_spectator_controller(backend: InputBackend,
+                               click_delay: float = 0.0,
+                               direct_select_keys: list[str] | dict[int, str] | None = None) -> SpectatorController:
+    global spectator_controller
+    if spectator_controller is not None:
+        spectator_controller.stop()
+    spectator_controller = SpectatorController(backend, click_delay, direct_select_keys)
+    spectator_controller.start()
+    return spectator_controller
 
 def set_spectated_player(index: int) -> None:
-    global target_character_index
-    target_character_index = index
+    get_spectator_controller().set_target(index)
 
-def move_to_target_loop() -> None:
-    global current_character_index
-    global target_character_index
-    while True:
-        if current_character_index < target_character_index:
-            win32api.mouse_event(win32con.MOUSEEVENTF_RIGHTDOWN, 0, 0, 0, 0)
-            win32api.mouse_event(win32con.MOUSEEVENTF_RIGHTUP, 0, 0, 0, 0)
-            current_character_index += 1
-        elif current_character_index > target_character_index:
-            win32api.mouse_event(win32con.MOUSEEVENTF_LEFTDOWN, 0, 0, 0, 0)
-            win32api.mouse_event(win32con.MOUSEEVENTF_LEFTUP, 0, 0, 0, 0)
-            current_character_index -= 1
-        time.sleep(0.1)
-
-def create_on_message(obs_client: obs.ReqClient, midi_bindings: list[dict]) -> Callable:
-    def on_message(message: mido.Message) -> None:
-        if message.type != 'note_on':
+class LatencyHistogram:
+    '''Counts latencies in buckets 10% apart from 10 us to 100 s, so recording is a bisect and an increment.'''
+    
+    BOUNDS = [1e-5 * 1.1 ** i for i in range(int(math.log(1e7) / math.log(1.1)) + 2)]
+    
+    counts: list[int]
+    count: int
+    total: float
+    max: float
+    
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+    
+    def record(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+    
+    def copy(self) -> LatencyHistogram:
+        histogram = LatencyHistogram()
+        histogram.counts = self.counts.copy()
+        histogram.count = self.count
+        histogram.total = self.total
+        histogram.max = self.max
+        return histogram
+    
+    def since(self, earlier: LatencyHistogram) -> LatencyHistogram:
+        '''The latencies recorded after earlier was copied from this histogram.'''
+        histogram = LatencyHistogram()
+        histogram.counts = [now - before for now, before in zip(self.counts, earlier.counts)]
+        histogram.count = self.count - earlier.count
+        histogram.total = self.total - earlier.total
+        top = max((i for i, count in enumerate(histogram.counts) if count), default=None)
+        if top is not None:
+            histogram.max = min(self.BOUNDS[top] if top < len(self.BOUNDS) else self.max, self.max)
+        return histogram
+    
+    def merge(self, other: LatencyHistogram) -> None:
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+    
+    def percentile(self, p: float) -> float:
+        '''The upper bound of the bucket holding the p-th percentile, in seconds.'''
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.BOUNDS[i] if i < len(self.BOUNDS) else self.max, self.max)
+        return self.max
+
+@dataclass
+class Trace:
+    '''Timestamps of one input event on its way through dispatch, from time.perf_counter.'''
+    
+    binding_key: Any
+    hook_time: float
+
+class LatencyTracer:
+    '''Keeps latency histograms per (category, name) in memory.'''
+    
+    enabled: bool
+    # the dispatch path records queue (hook to worker), binding (hook to last action done),
+    # action (one action until OBS acknowledged it) and obs (one request or batch)
+    _histograms: dict[tuple[str, str], LatencyHistogram]
+    _lock: threading.Lock
+    
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._histograms = {}
+        self._lock = threading.Lock()
+    
+    def record(self, category: str, name: str, seconds: float) -> None:
+        if not self.enabled:
             return
-        log(f'MIDI note pressed: {message.note}')
-        for binding in midi_bindings:
-            if binding['note'] == message.note:
-                perform_actions(obs_client, binding['actions'])
-    return on_message
+        with self._lock:
+            histogram = self._histograms.get((category, name))
+            if histogram is None:
+                histogram = self._histograms[(category, name)] = LatencyHistogram()
+            histogram.record(seconds)
+    
+    def histograms(self) -> dict[tuple[str, str], LatencyHistogram]:
+        with self._lock:
+            return dict(self._histograms)
+    
+    def snapshot(self,
+                 previous: dict[tuple[str, str], LatencyHistogram] | None = None
+                 ) -> dict[tuple[str, str], LatencyHistogram]:
+        '''Copy every histogram, reusing the copies in previous that nothing was recorded to since.'''
+        previous = previous or {}
+        with self._lock:
+            return {key: (previous[key] if key in previous and previous[key].count == histogram.count
+                          else histogram.copy())
+                    for key, histogram in self._histograms.items()}
+    
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+    
+    def report(self) -> str:
+        lines = [f'{"category":<8} {"name":<40} {"count":>7} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"max ms":>9}']
+        with self._lock:
+            for (category, name), histogram in sorted(self._histograms.items()):
+                lines.append(
+                    f'{category:<8} {name:<40} {histogram.count:>7} '
+                    f'{histogram.percentile(50) * 1000:>9.2f} {histogram.percentile(95) * 1000:>9.2f} '
+                    f'{histogram.percentile(99) * 1000:>9.2f} {histogram.max * 1000:>9.2f}')
+        return '\n'.join(lines)
+    
+    def dump(self, filename: str | None = None) -> None:
+        '''Print the report, or append it to a file with a timestamp.'''
+        report = self.report()
+        if filename is None:
+            log(report)
+            return
+        with open(filename, 'a') as f:
+            f.write(f'--- {time.strftime("%Y-%m-%d %H:%M:%S")} ---\n{report}\n\n')
 
-def perform_actions(obs_client: obs.ReqClient, actions: list[dict], *_) -> None:
-    # TODO: Use keyboard event that is passed in now I guess
-    for action in actions:
-        perform_action(obs_client, action)
+latency_tracer = LatencyTracer()
 
-def perform_action(obs_client: obs.ReqClient, action: dict) -> None:
-    match action['type']:
+class RecentLatencies:
+    '''Histograms of only the latencies a tracer recorded in the last window seconds, built from periodic snapshots.'''
+    
+    tracer: LatencyTracer
+    window: float
+    _snapshots: collections.deque
+    
+    def __init__(self, tracer: LatencyTracer, window: float = 30.0):
+        self.tracer = tracer
+        self.window = window
+        self._snapshots = collections.deque()
+    
+    def sample(self) -> dict[tuple[str, str], LatencyHistogram]:
+        now = time.monotonic()
+        snapshot = self.tracer.snapshot(self._snapshots[-1][1] if self._snapshots else None)
+        self._snapshots.append((now, snapshot))
+        # keep the newest snapshot from before the window as the baseline
+        while len(self._snapshots) > 1 and self._snapshots[1][0] <= now - self.window:
+            self._snapshots.popleft()
+        taken, baseline = self._snapshots[0]
+        if taken > now - self.window:
+            # sampling started less than a window ago, count everything
+            baseline = {}
+        recent = {}
+        for key, histogram in snapshot.items():
+            earlier = baseline.get(key)
+            # a reset of the tracer starts the histogram over
+            if earlier is None or earlier.count > histogram.count:
+                earlier = LatencyHistogram()
+            recent[key] = histogram.since(earlier)
+        return recent
+
+def format_binding_key(binding_key: Any) -> str:
+    if isinstance(binding_key, tuple) and len(binding_key) == 3:
+        section, i, trigger = binding_key
+        return f'{section}[{i}] {trigger}'
+    return str(binding_key)
+
+class ActionDispatcher:
+    '''Runs binding actions on worker threads, in order per binding key, so input hooks only have to enqueue.'''
+    
+    OVERFLOW_POLICIES = ('drop', 'coalesce', 'block')
+    # past max_pending waiting jobs, the new one is discarded (drop), replaces the newest
+    # waiting job of its binding or else is discarded (coalesce), or waits for room (block)
+    
+    workers: int
+    max_pending: int
+    overflow: str
+    dropped: int
+    coalesced: int
+    _pending: dict[Any, collections.deque]
+    _ready: collections.deque
+    _active: set
+    _pending_count: int
+    _condition: threading.Condition
+    _threads: list[threading.Thread]
+    _running: bool
+    
+    def __init__(self, workers: int = 4, max_pending: int = 64, overflow: str = 'drop'):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f'Overflow policy must be one of {", ".join(self.OVERFLOW_POLICIES)}, not \'{overflow}\'')
+        self.workers = workers
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.dropped = 0
+        self.coalesced = 0
+        self._pending = {}
+        self._ready = collections.deque()
+        self._active = set()
+        self._pending_count = 0
+        self._condition = threading.Condition()
+        self._threads = []
+        self._running = False
+    
+    def start(self) -> None:
+        self._running = True
+        for i in range(self.workers):
+            worker = threading.Thread(target=self._work, name=f'action-worker-{i}')
+            worker.daemon = True
+            worker.start()
+            self._threads.append(worker)
+    
+    def stop(self, wait: bool = True) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if wait:
+            for worker in self._threads:
+                worker.join()
+        self._threads.clear()
+    
+    def submit(self, key: Any, job: Callable[[], Any]) -> bool:
+        '''Queue a job under a binding key. Returns False if it was dropped, coalesced or the dispatcher is stopped.'''
+        with self._condition:
+            if not self._running:
+                return False
+            if self._pending_count >= self.max_pending:
+                if self.overflow == 'block':
+                    while self._pending_count >= self.max_pending and self._running:
+                        self._condition.wait()
+                    if not self._running:
+                        # stopped while waiting for room, nothing would ever run it
+                        return False
+                elif self.overflow == 'coalesce':
+                    waiting = self._pending.get(key)
+                    if waiting:
+                        waiting[-1] = job
+                        self.coalesced += 1
+                    else:
+                        self.dropped += 1
+                    return False
+                else:
+                    self.dropped += 1
+                    return False
+            waiting = self._pending.setdefault(key, collections.deque())
+            waiting.append(job)
+            self._pending_count += 1
+            # a key is only scheduled once at a time, which keeps its jobs in order
+            if key not in self._active:
+                self._active.add(key)
+                self._ready.append(key)
+                self._condition.notify()
+            return True
+    
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while not self._ready and self._running:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                key = self._ready.popleft()
+                job = self._pending[key].popleft()
+                self._pending_count -= 1
+                self._condition.notify_all()
+            try:
+                job()
+            except Exception as e:
+                log(f'Error while performing actions: {type(e).__name__}: {e}', file=sys.stderr)
+            with self._condition:
+                if self._pending[key]:
+                    self._ready.append(key)
+                    self._condition.notify()
+                else:
+                    del self._pending[key]
+                    self._active.discard(key)
+
+def start_action_dispatcher(workers: int = 4, max_pending: int = 64, overflow: str = 'drop') -> ActionDispatcher:
+    global action_dispatcher
+    if action_dispatcher is not None:
+        action_dispatcher.stop(wait=False)
+    action_dispatcher = ActionDispatcher(workers, max_pending, overflow)
+    action_dispatcher.start()
+    return action_dispatcher
+
+@dataclass(frozen=True)
+class TimelineStep:
+    '''Actions a timeline runs together, at seconds after the trigger.'''
+    
+    at: float
+    aligned: bool # audio actions started on the mixer frame at seconds, through perform_at
+    actions: tuple[CompiledAction, ...]
+
+class TimelineRun:
+    '''One triggered run of a timeline.'''
+    
+    name: str
+    obs_client: obs.ReqClient
+    started: float
+    # the frame each mixer was at when the timeline was triggered
+    anchors: dict[AudioMixer, int]
+    remaining: int
+    cancelled: bool
+    
+    def __init__(self, name: str, obs_client: obs.ReqClient, started: float, steps: int):
+        self.name = name
+        self.obs_client = obs_client
+        self.started = started
+        self.anchors = {mixer: mixer.position for mixer in list(audio_mixers.values())}
+        self.remaining = steps
+        self.cancelled = False
+
+class TimelineScheduler:
+    '''Runs the steps of timelines at their offsets from the trigger, on one thread.'''
+    
+    lateness: LatencyHistogram
+    dropped: int
+    _dispatcher: ActionDispatcher
+    _heap: list[tuple[float, int, TimelineRun, TimelineStep]]
+    _runs: dict[str, list[TimelineRun]]
+    _sequence: itertools.count
+    _condition: threading.Condition
+    _thread: threading.Thread | None
+    _running: bool
+    
+    def __init__(self):
+        self.lateness = LatencyHistogram()
+        self.dropped = 0
+        # drop rather than block, a blocked clock would make every later step late
+        self._dispatcher = ActionDispatcher(TIMELINE_WORKERS, TIMELINE_MAX_PENDING, 'drop')
+        self._heap = []
+        self._runs = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+    
+    def start_thread(self) -> None:
+        self._dispatcher.start()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='timeline-scheduler')
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._dispatcher.stop(wait=False)
+    
+    def start(self,
+              name: str,
+              steps: tuple[TimelineStep, ...],
+              obs_client: obs.ReqClient,
+              preempt: bool = True) -> TimelineRun:
+        '''Schedule the steps of a timeline from now.'''
+        run = TimelineRun(name, obs_client, time.perf_counter(), len(steps))
+        lead = max((TIMELINE_AUDIO_LEAD_BLOCKS * mixer.block_size / mixer.samplerate for mixer in run.anchors),
+                   default=0.0)
+        with self._condition:
+            if preempt:
+                self._cancel(name)
+            self._runs.setdefault(name, []).append(run)
+            for step in steps:
+                due = run.started + step.at - (lead if step.aligned else 0.0)
+                heapq.heappush(self._heap, (due, next(self._sequence), run, step))
+            self._condition.notify()
+        return run
+    
+    def cancel(self, name: str | None = None) -> None:
+        '''Drop the steps still due of the named timeline, or of every timeline.'''
+        with self._condition:
+            for run_name in ([name] if name is not None else list(self._runs)):
+                self._cancel(run_name)
+    
+    def _cancel(self, name: str) -> None:
+        for run in self._runs.pop(name, ()):
+            # its steps are skipped when they come up
+            run.cancelled = True
+    
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while True:
+                    if not self._running:
+                        return
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    remaining = self._heap[0][0] - time.perf_counter() - TIMELINE_PRECISE_WINDOW
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                due = self._heap[0][0]
+            remaining = due - time.perf_counter()
+            if remaining > TIMELINE_SPIN:
+                time.sleep(remaining - TIMELINE_SPIN)
+            while time.perf_counter() < due:
+                # yield rather than hold the GIL the audio callback needs
+                time.sleep(0)
+            with self._condition:
+                now = time.perf_counter()
+                entries = []
+                while self._heap and self._heap[0][0] <= now:
+                    entries.append(heapq.heappop(self._heap))
+            for due, _, run, step in entries:
+                if run.cancelled:
+                    continue
+                self.lateness.record(time.perf_counter() - due)
+                self._fire(run, step)
+    
+    def _fire(self, run: TimelineRun, step: TimelineStep) -> None:
+        job = functools.partial(self._perform, run, step)
+        if not self._dispatcher.submit(('timeline', run.name, step.aligned), job):
+            self.dropped += 1
+            log(f'Error: Timeline {run.name} has too many steps waiting, dropped '
+                f'{", ".join(action.action["type"] for action in step.actions)} at {step.at * 1000:g} ms',
+                file=sys.stderr)
+        with self._condition:
+            run.remaining -= 1
+            runs = self._runs.get(run.name)
+            if run.remaining == 0 and runs is not None and run in runs:
+                runs.remove(run)
+                if not runs:
+                    del self._runs[run.name]
+    
+    def _perform(self, run: TimelineRun, step: TimelineStep) -> None:
+        if run.cancelled:
+            return
+        if not step.aligned:
+            perform_compiled_actions(run.obs_client, step.actions)
+            return
+        frames = {mixer: anchor + round(step.at * mixer.samplerate) for mixer, anchor in run.anchors.items()}
+        for action in step.actions:
+            start = time.perf_counter()
+            action.perform_at(frames)
+            latency_tracer.record('action', action.action['type'], time.perf_counter() - start)
+
+def get_timeline_scheduler() -> TimelineScheduler:
+    global timeline_scheduler
+    if timeline_scheduler is None:
+        timeline_scheduler = TimelineScheduler()
+        timeline_scheduler.start_thread()
+    return timeline_scheduler
+
+# required fields of each action type, checked when bindings are compiled
+ACTION_FIELDS: dict[str, tuple[str, ...]] = {
+    'trigger_studio_mode_transition': (),
+    'toggle_input_mute': ('name',),
+    'set_current_preview_scene': ('name',),
+    'set_current_scene_transition': ('name',),
+    'set_source_visibility': ('scene', 'name', 'visible'),
+    'set_spectated_player': ('index',),
+    'play_random_audio': ('folder',),
+    'fade_in_audio': ('folder', 'length'),
+    'play_playlist': ('folder',),
+    'stop_audio': (),
+    'fade_out_audio': ('length',),
+    'duck_audio': ('gain', 'length'),
+    'restore_audio': ('length',),
+    'dump_latency': (),
+    'timeline': ('steps',),
+    'cancel_timeline': (),
+}
+
+CONNECTION_POLICIES = ('hold', 'fail')
+# what an OBS action does while OBS is unreachable, unless it sets on_disconnect:
+#     hold: wait for the connection to come back, and resend it if it was lost mid-request
+#     fail: report an error straight away
+# going live late is worse than not at all, and a resent toggle could flip twice
+DEFAULT_CONNECTION_POLICIES = {
+    'trigger_studio_mode_transition': 'fail',
+    'toggle_input_mute': 'fail',
+}
+
+class BindingConfigError(Exception):
+    pass
+
+@dataclass(frozen=True)
+class CompiledAction:
+    '''An action with its arguments bound, ready to run without looking anything up.'''
+    
+    action: dict
+    perform: Callable[[obs.ReqClient], Any]
+    # the obs-websocket request, for batching, None for actions that run locally
+    obs_request: Callable[[obs.ReqClient], tuple[str, dict | None]] | None = None
+    connection_policy: str = 'hold'
+    # starts an audio action on the given frame of each mixer, for timelines
+    perform_at: Callable[[dict[AudioMixer, int]], Any] | None = None
+
+# a binding key (for the dispatcher) and the compiled actions it runs
+CompiledBinding = tuple[Any, tuple[CompiledAction, ...]]
+
+@dataclass
+class DispatchTable:
+    midi: dict[int, tuple[CompiledBinding, ...]]
+    keyboard: dict[str, tuple[CompiledBinding, ...]]
+
+def _gain_curve(action: dict) -> str:
+    curve = action.get('curve', 'linear')
+    if curve not in GAIN_CURVES:
+        raise BindingConfigError(f'curve must be one of {", ".join(GAIN_CURVES)}, not {curve!r}')
+    return curve
+
+def _tags(action: dict) -> tuple[str, ...]:
+    tags = action.get('tags', [])
+    if isinstance(tags, str) or not all(isinstance(tag, str) for tag in tags):
+        raise BindingConfigError('tags must be a list of strings')
+    return tuple(tags)
+
+def _connection_policy(action: dict) -> str:
+    policy = action.get('on_disconnect', DEFAULT_CONNECTION_POLICIES.get(action['type'], 'hold'))
+    if policy not in CONNECTION_POLICIES:
+        raise BindingConfigError(f'on_disconnect must be one of {", ".join(CONNECTION_POLICIES)}, not {policy!r}')
+    return policy
+
+def compile_action(action: dict) -> CompiledAction:
+    action_type = action.get('type')
+    if action_type not in ACTION_FIELDS:
+        raise BindingConfigError(f'unknown action type {action_type!r}')
+    missing = [field for field in ACTION_FIELDS[action_type] if field not in action]
+    if missing:
+        raise BindingConfigError(f'{action_type} is missing {", ".join(missing)}')
+    policy = _connection_policy(action)
+    
+    match action_type:
         case 'trigger_studio_mode_transition':
-            obs_client.trigger_studio_mode_transition()
+            return CompiledAction(
+                action,
+                lambda c: c.trigger_studio_mode_transition(),
+                lambda c: ('TriggerStudioModeTransition', None),
+                policy)
         case 'toggle_input_mute':
-            obs_client.toggle_input_mute(action['name'])
+            name = action['name']
+            return CompiledAction(
+                action,
+                lambda c: c.toggle_input_mute(name),
+                lambda c: ('ToggleInputMute', {'inputName': name}),
+                policy)
         case 'set_current_preview_scene':
-            obs_client.set_current_preview_scene(action['name'])
+            name = action['name']
+            return CompiledAction(
+                action,
+                lambda c: c.set_current_preview_scene(name),
+                lambda c: ('SetCurrentPreviewScene', {'sceneName': name}),
+                policy)
         case 'set_current_scene_transition':
-            obs_client.set_current_scene_transition(action['name'])
+            name = action['name']
+            return CompiledAction(
+                action,
+                lambda c: c.set_current_scene_transition(name),
+                lambda c: ('SetCurrentSceneTransition', {'transitionName': name}),
+                policy)
         case 'set_source_visibility':
-            set_source_visibility(obs_client, action['scene'], action['name'], action['visible'])
+            scene, name, visible = action['scene'], action['name'], bool(action['visible'])
+            return CompiledAction(
+                action,
+                lambda c: set_source_visibility(c, scene, name, visible),
+                lambda c: ('SetSceneItemEnabled', {
+                    'sceneName': scene,
+                    'sceneItemId': get_source_id(c, scene, name),
+                    'sceneItemEnabled': visible,
+                }),
+                policy)
         case 'set_spectated_player':
-            set_spectated_player(action['index'])
+            index = int(action['index'])
+            return CompiledAction(action, lambda _: set_spectated_player(index))
         case 'play_random_audio':
-            play_random_audio(action['folder'], audio_output_device)
+            folder, min_duration, tags = action['folder'], float(action.get('min_duration', 0)), _tags(action)
+            # the device is read at trigger time since it can be chosen after loading
+            return CompiledAction(
+                action,
+                lambda _: play_random_audio(folder, audio_output_device,
+                                            min_duration=min_duration, tags=tags),
+                perform_at=lambda frames: play_random_audio(folder, audio_output_device, min_duration=min_duration,
+                                                            tags=tags, start_frames=frames))
+        case 'fade_in_audio':
+            folder, length, curve = action['folder'], int(action['length']), _gain_curve(action)
+            min_duration, tags = float(action.get('min_duration', 0)), _tags(action)
+            return CompiledAction(
+                action,
+                lambda _: play_random_audio(folder, audio_output_device, length, curve, min_duration, tags),
+                perform_at=lambda frames: play_random_audio(folder, audio_output_device, length, curve,
+                                                            min_duration, tags, frames))
+        case 'play_playlist':
+            folder, crossfade = action['folder'], int(action.get('crossfade', 0))
+            curve, shuffle = action.get('curve', 'equal_power'), bool(action.get('shuffle', True))
+            min_duration, tags = float(action.get('min_duration', 0)), _tags(action)
+            if curve not in GAIN_CURVES:
+                raise BindingConfigError(f'curve must be one of {", ".join(GAIN_CURVES)}, not {curve!r}')
+            return CompiledAction(
+                action,
+                lambda _: play_playlist(folder, audio_output_device, crossfade, curve, shuffle,
+                                        min_duration, tags))
         case 'stop_audio':
-            music_end_event.set()
+            return CompiledAction(action, lambda _: stop_audio())
         case 'fade_out_audio':
-            fade_out_audio(action['length'])
+            length, curve = int(action['length']), _gain_curve(action)
+            return CompiledAction(action, lambda _: fade_out_audio(length, curve),
+                                  perform_at=lambda frames: fade_out_audio(length, curve, frames))
+        case 'duck_audio':
+            gain, length, curve = float(action['gain']), int(action['length']), _gain_curve(action)
+            return CompiledAction(action, lambda _: duck_audio(gain, length, curve),
+                                  perform_at=lambda frames: duck_audio(gain, length, curve, frames))
+        case 'dump_latency':
+            filename = action.get('file')
+            return CompiledAction(action, lambda _: latency_tracer.dump(filename))
+        case 'restore_audio':
+            length, curve = int(action['length']), _gain_curve(action)
+            return CompiledAction(action, lambda _: restore_audio(length, curve),
+                                  perform_at=lambda frames: restore_audio(length, curve, frames))
+        case 'timeline':
+            name = str(action.get('name') or f'timeline {next(_timeline_names)}')
+            steps, preempt = _timeline_steps(action), bool(action.get('preempt', True))
+            return CompiledAction(action, lambda c: get_timeline_scheduler().start(name, steps, c, preempt))
+        case 'cancel_timeline':
+            name = action.get('name')
+            return CompiledAction(action, lambda _: get_timeline_scheduler().cancel(name))
+
+_timeline_names = itertools.count(1)
+
+def _timeline_steps(action: dict) -> tuple[TimelineStep, ...]:
+    '''Compile the steps of a timeline, grouping the actions that are due together.'''
+    if not isinstance(action['steps'], list):
+        raise BindingConfigError('steps must be a list')
+    groups: dict[tuple[float, bool], list[CompiledAction]] = {}
+    for i, step in enumerate(action['steps']):
+        if 'action' not in step:
+            raise BindingConfigError(f'steps[{i}] is missing action')
+        at = float(step.get('at_ms', 0)) / 1000
+        if at < 0:
+            raise BindingConfigError(f'steps[{i}].at_ms must not be negative')
+        if isinstance(step['action'], dict) and step['action'].get('type') == 'timeline':
+            raise BindingConfigError(f'steps[{i}]: timelines cannot be nested')
+        try:
+            compiled = compile_action(step['action'])
+        except BindingConfigError as e:
+            raise BindingConfigError(f'steps[{i}]: {e}') from None
+        groups.setdefault((at, compiled.perform_at is not None), []).append(compiled)
+    return tuple(TimelineStep(at, aligned, tuple(actions)) for (at, aligned), actions in sorted(groups.items()))
+
+def compile_actions(actions: list[dict]) -> tuple[CompiledAction, ...]:
+    return tuple(compile_action(action) for action in actions)
+
+def compile_bindings(config: dict) -> DispatchTable:
+    '''Compile the bindings in a config into lookup tables, reporting every problem at once.'''
+    errors = []
+    midi: dict[int, list[CompiledBinding]] = {}
+    keyboard_table: dict[str, list[CompiledBinding]] = {}
+    for section, trigger_field, table in (('midi_bindings', 'note', midi),
+                                          ('keyboard_bindings', 'key', keyboard_table)):
+        for i, binding in enumerate(config.get(section, [])):
+            if trigger_field not in binding:
+                errors.append(f'{section}[{i}] is missing {trigger_field}')
+                continue
+            compiled = []
+            for j, action in enumerate(binding.get('actions', [])):
+                try:
+                    compiled.append(compile_action(action))
+                except (BindingConfigError, TypeError, ValueError) as e:
+                    errors.append(f'{section}[{i}].actions[{j}]: {e}')
+            trigger = binding[trigger_field]
+            table.setdefault(trigger, []).append(((section, i, trigger), tuple(compiled)))
+    if errors:
+        raise BindingConfigError('Invalid bindings:\n\t' + '\n\t'.join(errors))
+    return DispatchTable(
+        midi={note: tuple(bindings) for note, bindings in midi.items()},
+        keyboard={key: tuple(bindings) for key, bindings in keyboard_table.items()})
+
+COALESCE_RULES = ('latest', 'debounce', 'none')
+# how bursts of each action type are merged before dispatch:
+#     latest: bindings setting the same targets share a key, and a waiting firing is skipped
+#             once a later one has been admitted
+#     debounce: firing again within debounce_ms of the last accepted firing is dropped
+#     none: always runs
+# a binding takes 'none' if any of its actions has it, otherwise 'debounce' if any has it
+DEFAULT_COALESCE_RULES: dict[str, str] = {
+    'trigger_studio_mode_transition': 'debounce',
+    'toggle_input_mute': 'debounce',
+    'set_current_preview_scene': 'latest',
+    'set_current_scene_transition': 'latest',
+    'set_source_visibility': 'latest',
+    'set_spectated_player': 'latest',
+    'play_random_audio': 'debounce',
+    'fade_in_audio': 'debounce',
+    'play_playlist': 'debounce',
+    'stop_audio': 'debounce',
+    'fade_out_audio': 'debounce',
+    'duck_audio': 'debounce',
+    'restore_audio': 'debounce',
+    'dump_latency': 'none',
+    'timeline': 'debounce',
+    'cancel_timeline': 'none',
+}
+
+class InputCoalescer:
+    '''Merges bursts of triggers before they reach the dispatcher.'''
+    
+    debounce: float
+    ignore_key_repeat: bool
+    rules: dict[str, str]
+    counters: collections.Counter
+    per_binding: collections.Counter
+    _held: set
+    _last_accepted: dict[Any, float]
+    _generations: dict[frozenset, int]
+    _lock: threading.Lock
+    
+    def __init__(self,
+                 debounce_ms: float = 150,
+                 ignore_key_repeat: bool = True,
+                 rules: dict[str, str] | None = None):
+        rules = DEFAULT_COALESCE_RULES | (rules or {})
+        for action_type, rule in rules.items():
+            if rule not in COALESCE_RULES:
+                raise ValueError(f'Coalesce rule for {action_type} must be one of {", ".join(COALESCE_RULES)}, '
+                                 f'not \'{rule}\'')
+        self.debounce = debounce_ms / 1000
+        self.ignore_key_repeat = ignore_key_repeat
+        self.rules = rules
+        self.counters = collections.Counter()
+        self.per_binding = collections.Counter()
+        self._held = set()
+        self._last_accepted = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+    
+    def press(self, trigger: Any) -> bool:
+        '''Record a key going down, returning False if it is an auto-repeat of a held key.'''
+        with self._lock:
+            if trigger in self._held and self.ignore_key_repeat:
+                self.counters['repeats'] += 1
+                return False
+            self._held.add(trigger)
+            return True
+    
+    def release(self, trigger: Any) -> None:
+        with self._lock:
+            self._held.discard(trigger)
+    
+    @staticmethod
+    def _target(action: dict) -> tuple:
+        if action['type'] == 'set_source_visibility':
+            return action['type'], action['scene'], action['name']
+        return (action['type'],)
+    
+    def rule(self, actions: tuple[CompiledAction, ...]) -> str:
+        rules = {self.rules.get(action.action['type'], 'none') for action in actions}
+        if not rules or 'none' in rules:
+            return 'none'
+        return 'debounce' if 'debounce' in rules else 'latest'
+    
+    def admit(self,
+              binding_key: Any,
+              actions: tuple[CompiledAction, ...],
+              now: float) -> tuple[Any, Callable[[], bool] | None] | None:
+        '''Return the dispatcher key and pre-run check for a binding that just fired, or None to drop it.'''
+        match self.rule(actions):
+            case 'debounce':
+                with self._lock:
+                    last = self._last_accepted.get(binding_key)
+                    bounced = last is not None and now - last < self.debounce
+                    if not bounced:
+                        self._last_accepted[binding_key] = now
+                if bounced:
+                    self._count('debounced', binding_key)
+                    return None
+                return binding_key, None
+            case 'latest':
+                targets = frozenset(self._target(action.action) for action in actions)
+                with self._lock:
+                    generation = self._generations[targets] = self._generations.get(targets, 0) + 1
+                def still_wanted() -> bool:
+                    if self._generations[targets] == generation:
+                        return True
+                    self._count('superseded', binding_key)
+                    return False
+                return ('latest', targets), still_wanted
+        return binding_key, None
+    
+    def _count(self, reason: str, binding_key: Any) -> None:
+        with self._lock:
+            self.counters[reason] += 1
+            self.per_binding[(format_binding_key(binding_key), reason)] += 1
+    
+    def report(self) -> str:
+        lines = [f'Input coalescing: {self.counters["superseded"]} superseded, '
+                 f'{self.counters["debounced"]} debounced, {self.counters["repeats"]} key repeats ignored']
+        for (binding, reason), count in sorted(self.per_binding.items()):
+            lines.append(f'    {binding:<40} {reason:<10} {count:>6}')
+        return '\n'.join(lines)
+
+def start_input_coalescer(debounce_ms: float = 150,
+                          ignore_key_repeat: bool = True,
+                          rules: dict[str, str] | None = None) -> InputCoalescer:
+    global input_coalescer
+    input_coalescer = InputCoalescer(debounce_ms, ignore_key_repeat, rules)
+    return input_coalescer
+
+def dispatch_actions(obs_client: obs.ReqClient,
+                     binding_key: Any,
+                     actions: tuple[CompiledAction, ...],
+                     hook_time: float | None = None) -> None:
+    '''Hand a binding's actions to the dispatcher, or run them inline if there is none.'''
+    trace = Trace(binding_key, hook_time if hook_time is not None else time.perf_counter())
+    dispatch_key, still_wanted = binding_key, None
+    if input_coalescer is not None:
+        admission = input_coalescer.admit(binding_key, actions, trace.hook_time)
+        if admission is None:
+            return
+        dispatch_key, still_wanted = admission
+    if action_dispatcher is None:
+        perform_admitted_actions(obs_client, actions, trace, still_wanted)
+        return
+    action_dispatcher.submit(
+        dispatch_key, functools.partial(perform_admitted_actions, obs_client, actions, trace, still_wanted))
+
+def perform_admitted_actions(obs_client: obs.ReqClient,
+                             actions: tuple[CompiledAction, ...],
+                             trace: Trace,
+                             still_wanted: Callable[[], bool] | None) -> None:
+    # a later firing may have superseded this one while it was queued
+    if still_wanted is not None and not still_wanted():
+        return
+    perform_compiled_actions(obs_client, actions, trace)
+
+def dispatch_bindings(obs_client: obs.ReqClient,
+                      bindings: tuple[CompiledBinding, ...],
+                      hook_time: float | None = None) -> None:
+    # the hooks pass the time they saw the event, which the latency traces start from
+    if hook_time is None:
+        hook_time = time.perf_counter()
+    for binding_key, actions in bindings:
+        dispatch_actions(obs_client, binding_key, actions, hook_time)
+
+def create_on_key_event(obs_client: obs.ReqClient, key: str) -> Callable:
+    def on_key_event(event: keyboard.KeyboardEvent) -> None:
+        hook_time = time.perf_counter()
+        if event.event_type == keyboard.KEY_UP:
+            if input_coalescer is not None:
+                input_coalescer.release(key)
+            return
+        if input_coalescer is not None and not input_coalescer.press(key):
+            return
+        bindings = dispatch_table.keyboard.get(key)
+        if bindings is not None:
+            dispatch_bindings(obs_client, bindings, hook_time=hook_time)
+    return on_key_event
+
+def create_on_message(obs_client: obs.ReqClient) -> Callable:
+    def on_message(message: mido.Message) -> None:
+        hook_time = time.perf_counter()
+        if message.type != 'note_on':
+            return
+        log(f'MIDI note pressed: {message.note}')
+        bindings = dispatch_table.midi.get(message.note)
+        if bindings is not None:
+            dispatch_bindings(obs_client, bindings, hook_time=hook_time)
+    return on_message
+
+def set_dispatch_table(table: DispatchTable) -> None:
+    global dispatch_table
+    dispatch_table = table
+
+def diff_bindings(old: dict[Any, tuple[CompiledBinding, ...]],
+                  new: dict[Any, tuple[CompiledBinding, ...]]) -> tuple[set, set, set]:
+    '''Return the triggers added, removed and changed between two lookup tables.'''
+    def actions(bindings: tuple[CompiledBinding, ...]) -> list[list[dict]]:
+        # binding keys hold config positions, which shift when a binding is inserted above
+        return [[action.action for action in compiled] for _, compiled in bindings]
+    added = new.keys() - old.keys()
+    removed = old.keys() - new.keys()
+    changed = {trigger for trigger in old.keys() & new.keys() if actions(old[trigger]) != actions(new[trigger])}
+    return added, removed, changed
+
+def _format_diff(name: str, diff: tuple[set, set, set]) -> str:
+    parts = [f'{label} {", ".join(str(trigger) for trigger in sorted(triggers))}'
+             for label, triggers in zip(('added', 'removed', 'changed'), diff) if triggers]
+    return f'{name} {"; ".join(parts) if parts else "unchanged"}'
+
+class ConfigWatcher:
+    '''Reloads the bindings of a config file when it changes, without a restart.'''
+    
+    path: str
+    obs_client: obs.ReqClient
+    poll_interval: float
+    on_reload: Callable[[DispatchTable], None] | None
+    reloads: int
+    _config: dict
+    _signature: tuple[int, int] | None
+    _hooks: dict[str, Callable]
+    _stop: threading.Event
+    _thread: threading.Thread | None
+    
+    def __init__(self,
+                 path: str,
+                 obs_client: obs.ReqClient,
+                 config: dict,
+                 poll_interval: float = CONFIG_POLL_INTERVAL,
+                 on_reload: Callable[[DispatchTable], None] | None = None):
+        self.path = path
+        self.obs_client = obs_client
+        self.poll_interval = poll_interval
+        self.on_reload = on_reload
+        self.reloads = 0
+        self._config = config
+        self._signature = None
+        self._hooks = {}
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def hook_keys(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self._hooks[key] = keyboard.hook_key(key, create_on_key_event(self.obs_client, key))
+    
+    def unhook_keys(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            keyboard.unhook_key(self._hooks.pop(key))
+            # a key unhooked while held would otherwise stay held
+            if input_coalescer is not None:
+                input_coalescer.release(key)
+    
+    def start(self, watch: bool = True) -> None:
+        '''Hook the keys of the current dispatch table, then poll the file for changes if watch is set.'''
+        self._signature = self._stat()
+        self.hook_keys(dispatch_table.keyboard)
+        if not watch:
+            return
+        self._thread = threading.Thread(target=self._run, name='config-watcher')
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.unhook_keys(list(self._hooks))
+    
+    def _stat(self) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    def _run(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            signature = self._stat()
+            # a missing file is most likely an editor replacing it, wait for the new one
+            if signature is None or signature == self._signature:
+                continue
+            self._signature = signature
+            self.reload()
+    
+    def reload(self) -> bool:
+        '''Compile the file and swap in its bindings, returning whether anything was applied.'''
+        started = time.perf_counter()
+        try:
+            with open(self.path, 'r') as f:
+                config = json.load(f)
+            table = compile_bindings(config)
+        except (OSError, ValueError, BindingConfigError) as e:
+            log(f'Error: Keeping the current bindings, could not reload {self.path}: {e}')
+            return False
+        previous = dispatch_table
+        keyboard_diff = diff_bindings(previous.keyboard, table.keyboard)
+        midi_diff = diff_bindings(previous.midi, table.midi)
+        added, removed, _ = keyboard_diff
+        # new keys are hooked before the swap and old ones unhooked after, so no trigger goes unheard
+        self.hook_keys(added)
+        set_dispatch_table(table)
+        self.unhook_keys(removed)
+        self.reloads += 1
+        log(f'Reloaded {self.path} in {(time.perf_counter() - started) * 1000:.1f} ms: '
+            f'{_format_diff("keys", keyboard_diff)}, {_format_diff("MIDI notes", midi_diff)}')
+        restart = sorted(field for field in config.keys() | self._config.keys()
+                         if field not in RELOADABLE_CONFIG and config.get(field) != self._config.get(field))
+        if restart:
+            log(f'Warning: Changes to {", ".join(restart)} take effect after a restart')
+        self._config = config
+        if self.on_reload is not None:
+            self.on_reload(table)
+        return True
+
+def start_config_watcher(path: str,
+                         obs_client: obs.ReqClient,
+                         config: dict,
+                         watch: bool = True,
+                         poll_interval: float = CONFIG_POLL_INTERVAL,
+                         on_reload: Callable[[DispatchTable], None] | None = None) -> ConfigWatcher:
+    global config_watcher
+    if config_watcher is not None:
+        config_watcher.stop()
+    config_watcher = ConfigWatcher(path, obs_client, config, poll_interval, on_reload)
+    config_watcher.start(watch)
+    return config_watcher
+
+def set_batch_execution_type(execution_type: str) -> None:
+    global batch_execution_type
+    try:
+        batch_execution_type = BATCH_EXECUTION_TYPES[execution_type]
+    except KeyError:
+        log(f'Error: Unknown batch execution type \'{execution_type}\', '
+            f'must be one of {", ".join(BATCH_EXECUTION_TYPES)}')
+
+_batch_request_ids = itertools.count(1)
+
+def send_request_batch(obs_client: obs.ReqClient,
+                       requests: list[tuple[str, dict | None]],
+                       execution_type: int | None = None,
+                       halt_on_failure: bool = False) -> list[dict]:
+    '''Send several requests in one RequestBatch round trip and return their results in order.'''
+    # obsws_python has no batch support, so speak the protocol on its socket directly
+    if execution_type is None:
+        execution_type = batch_execution_type
+    batch = []
+    for request_type, request_data in requests:
+        request = {'requestType': request_type}
+        if request_data:
+            request['requestData'] = request_data
+        batch.append(request)
+    request_id = f'batch-{next(_batch_request_ids)}'
+    payload = {
+        'op': 8,
+        'd': {
+            'requestId': request_id,
+            'haltOnFailure': halt_on_failure,
+            'executionType': execution_type,
+            'requests': batch,
+        },
+    }
+    ws = obs_client.base_client.ws
+    try:
+        with obs_client.request_lock:
+            started = time.perf_counter()
+            ws.send(json.dumps(payload))
+            while True:
+                response = json.loads(ws.recv())
+                if response['op'] == 9 and response['d']['requestId'] == request_id:
+                    latency_tracer.record('obs', 'RequestBatch', time.perf_counter() - started)
+                    return response['d']['results']
+    except websocket.WebSocketTimeoutException as e:
+        raise obs.error.OBSSDKTimeoutError('Timeout while trying to send the request batch') from e
+
+def send_request(obs_client: obs.ReqClient, request_type: str, request_data: dict | None) -> dict:
+    '''Send one request and return a RequestBatch style result instead of raising if it fails.'''
+    try:
+        obs_client.send(request_type, request_data)
+    except obs.error.OBSSDKRequestError as e:
+        return {'requestType': request_type, 'requestStatus': {'result': False, 'code': e.code, 'comment': str(e)}}
+    return {'requestType': request_type, 'requestStatus': {'result': True, 'code': 100}}
+
+def flush_request_batch(obs_client: obs.ReqClient,
+                        pending: list[tuple[CompiledAction, tuple[str, dict | None]]]) -> None:
+    if not pending:
+        return
+    requests = [request for _, request in pending]
+    if async_obs_client is not None and async_obs_client.connected:
+        # pipelined, so other bindings' requests can be in flight on the socket meanwhile
+        started = time.perf_counter()
+        try:
+            results = async_obs_client.call(async_obs_client.send_requests(requests))
+        except obs_connection_errors() as e:
+            raise OBSPipelineError(f'{type(e).__name__}: {e}') from e
+        latency_tracer.record('obs', requests[0][0] if len(requests) == 1 else 'RequestBatch',
+                              time.perf_counter() - started)
+    else:
+        if async_obs_client is not None:
+            async_obs_client.reconnect_soon()
+        if len(pending) == 1:
+            # a batch of one saves nothing
+            results = [send_request(obs_client, *requests[0])]
+        else:
+            results = send_request_batch(obs_client, requests)
+    for (action, request), result in zip(pending, results):
+        if result['requestStatus']['result']:
+            continue
+        if obs_state is not None:
+            obs_state.request_failed(*request)
+        if action.action['type'] == 'set_source_visibility' and scene_item_resolver is not None:
+            # possibly a stale cached item ID, so retry through the slow path once
+            scene_item_resolver.invalidate(action.action['scene'], action.action['name'])
+            action.perform(obs_client)
+            continue
+        log(f'Error: {result["requestType"]} failed with code {result["requestStatus"]["code"]}'
+            f'{": " + result["requestStatus"]["comment"] if result["requestStatus"].get("comment") else ""}')
+    pending.clear()
+
+def acquire_obs_client(obs_client: obs.ReqClient, action: CompiledAction) -> obs.ReqClient | None:
+    '''The connection to run an OBS action on, following its policy if obs_client is supervised.'''
+    if isinstance(obs_client, OBSConnectionSupervisor):
+        return obs_client.acquire(action.connection_policy)
+    return obs_client
+
+def perform_compiled_actions(obs_client: obs.ReqClient,
+                             actions: tuple[CompiledAction, ...],
+                             trace: Trace | None = None) -> None:
+    # consecutive OBS requests are sent as one batch, local actions flush the batch first
+    if trace is not None:
+        latency_tracer.record('queue', format_binding_key(trace.binding_key),
+                              time.perf_counter() - trace.hook_time)
+    pending: list[tuple[CompiledAction, tuple[str, dict | None]]] = []
+    started: list[float] = []
+    # the connection the pending batch goes out on
+    client = None
+    
+    def forget(request: tuple[str, dict | None]) -> None:
+        if obs_state is not None:
+            obs_state.request_failed(*request)
+    
+    def send() -> None:
+        # the mirror forgets whatever OBS never answered, however this exits
+        unconfirmed = list(pending)
+        try:
+            try:
+                flush_request_batch(client, pending)
+                unconfirmed.clear()
+                return
+            except obs_connection_errors() as e:
+                if not isinstance(obs_client, OBSConnectionSupervisor):
+                    raise
+                if not isinstance(e, OBSPipelineError):
+                    obs_client.report_failure(client)
+            held = [(action, request) for action, request in pending if action.connection_policy == 'hold']
+            for action, _ in pending:
+                if action.connection_policy != 'hold':
+                    log(f'Error: Lost the OBS connection during {action.action["type"]}')
+            pending.clear()
+            # the standby can drop along with the active connection when OBS restarts,
+            # so keep retrying on whatever connection comes up until hold_timeout runs out
+            deadline = time.monotonic() + obs_client.hold_timeout
+            while held:
+                retry_client = obs_client.acquire('hold', max(deadline - time.monotonic(), 0.0))
+                if retry_client is None:
+                    break
+                try:
+                    flush_request_batch(retry_client, list(held))
+                    unconfirmed = [entry for entry in unconfirmed if entry not in held]
+                    return
+                except obs_connection_errors() as e:
+                    if not isinstance(e, OBSPipelineError):
+                        obs_client.report_failure(retry_client)
+                    if time.monotonic() >= deadline:
+                        break
+            for action, _ in held:
+                log(f'Error: OBS did not come back within {obs_client.hold_timeout:g}s, '
+                    f'dropped {action.action["type"]}')
+        finally:
+            for _, request in unconfirmed:
+                forget(request)
+    
+    def flush() -> None:
+        types = [action.action['type'] for action, _ in pending]
+        send()
+        done = time.perf_counter()
+        for action_type, start in zip(types, started):
+            latency_tracer.record('action', action_type, done - start)
+        started.clear()
+    
+    for action in actions:
+        start = time.perf_counter()
+        if action.obs_request is None:
+            flush()
+            start = time.perf_counter()
+            action.perform(obs_client)
+            latency_tracer.record('action', action.action['type'], time.perf_counter() - start)
+            continue
+        target = acquire_obs_client(obs_client, action)
+        if target is None:
+            log(f'Error: Not connected to OBS, skipped {action.action["type"]}')
+            continue
+        if target is not client:
+            # failed over since the batch was started
+            flush()
+            client = target
+        request = action.obs_request(client)
+        if obs_state is not None:
+            # drop what OBS is known to already be in, before it costs a round trip
+            request = obs_state.filter_request(*request)
+            if request is None:
+                continue
+        pending.append((action, request))
+        started.append(start)
+    flush()
+    if trace is not None:
+        latency_tracer.record('binding', format_binding_key(trace.binding_key),
+                              time.perf_counter() - trace.hook_time)
+
+def perform_actions(obs_client: obs.ReqClient, actions: list[dict], *_) -> None:
+    perform_compiled_actions(obs_client, compile_actions(actions))
+
+def perform_action(obs_client: obs.ReqClient, action: dict) -> None:
+    perform_compiled_actions(obs_client, (compile_action(action),))
 
 def get_midi_input_device() -> Any: # idk what actual type is
     controller = None
@@ -272,6 +3589,8 @@ def list_possible_audio_devices() -> list[str]:
 def set_audio_output_device(device: int) -> None:
     global audio_output_device
     audio_output_device = device
+    # open the stream now so the first trigger does not pay for it
+    get_audio_mixer(device)
 
 def get_audio_output_device() -> dict[str, Any]:
     devices = sd.query_devices()
@@ -294,40 +3613,63 @@ def get_audio_output_device() -> dict[str, Any]:
         except IndexError:
             log(f'Error: Selection must be between 1 and {len(devices)}')
 
-def connect_to_obs(host: str, port: int | str, password: str) -> obs.ReqClient | None:
+def connect_to_obs(host: str,
+                   port: int | str,
+                   password: str,
+                   heartbeat_interval: float = OBS_HEARTBEAT_INTERVAL,
+                   hold_timeout: float = OBS_HOLD_TIMEOUT,
+                   pipelining: bool = True) -> OBSConnectionSupervisor | None:
     try:
         port = int(port)
     except ValueError:
         log('Port number must be a valid integer!')
     log('Connecting to OBS... ', end='')
     try:
-        obs_client = obs.ReqClient(
-            host=host,
-            port=port,
-            password=password,
-            timeout=3)
+        obs_client = start_obs_supervisor(host, port, password, heartbeat_interval, hold_timeout)
     except ConnectionRefusedError:
         log('Error!')
         log('Could not connect to OBS! Make sure you have a websocket server open.')
         return
     log('connected!')
+    if pipelining:
+        try:
+            start_async_obs_client(host, port, password)
+        except (*obs_connection_errors(), obs.error.OBSSDKError) as e:
+            log(f'Warning: Could not open the pipelined OBS connection ({e}), requests will be sent one at a time')
+    start_scene_item_resolver(host, port, password)
     return obs_client
 
 def main() -> None:
     try:
-        with open('config.json', 'r') as f:
-            config = json.load(f)
+        with startup_timer.measure('config', 'load'):
+            with open('config.json', 'r') as f:
+                config = json.load(f)
     except OSError as e:
         log(f'Error opening config.json: {e}. Exiting...')
         return
+    try:
+        with startup_timer.measure('config', 'compile bindings'):
+            set_dispatch_table(compile_bindings(config))
+    except BindingConfigError as e:
+        log(f'Error in config.json: {e}')
+        log('Exiting...')
+        return
     
-    obs_client = connect_to_obs(
-        host=config['obs']['host'],
-        port=config['obs']['port'],
-        password=config['obs']['password'],
-    )
+    set_obs_state_mirroring(config['obs'].get('mirror_state', True))
+    with startup_timer.measure('obs', 'connect'):
+        obs_client = connect_to_obs(
+            host=config['obs']['host'],
+            port=config['obs']['port'],
+            password=config['obs']['password'],
+            heartbeat_interval=config['obs'].get('heartbeat_interval', OBS_HEARTBEAT_INTERVAL),
+            hold_timeout=config['obs'].get('hold_timeout', OBS_HOLD_TIMEOUT),
+            pipelining=config['obs'].get('pipelining', True),
+        )
     if obs_client is None:
         return
+    set_batch_execution_type(config['obs'].get('batch_execution', 'serial_realtime'))
+    tracing_config = config.get('tracing', {})
+    latency_tracer.enabled = tracing_config.get('enabled', True)
 
     midi_controller = None
     if config['use_midi_controller']:
@@ -339,29 +3681,106 @@ def main() -> None:
     
     if config['use_output_audio']:
         log()
-        set_audio_output_device(get_audio_output_device()['index'])
+        device = get_audio_output_device()['index']
+        with startup_timer.measure('audio', 'open output stream'):
+            set_audio_output_device(device)
+        cache_config = config.get('audio_cache', {})
+        cache = set_audio_cache(
+            directory=cache_config.get('directory', AUDIO_CACHE_DIR),
+            max_bytes=int(cache_config.get('max_size_mb', AUDIO_CACHE_MAX_BYTES // 1024 ** 2) * 1024 ** 2))
+        with startup_timer.measure('audio', 'load library index'):
+            library = set_audio_library(config.get('audio_library', {}).get('index', AUDIO_LIBRARY_INDEX))
+        set_music_root(config.get('audio_library', {}).get('root'))
+        mixer = get_audio_mixer(audio_output_device)
+        prepared_folders = set()
+        def prepare_audio(table: DispatchTable) -> None:
+            # decode everything the bindings can play before the first trigger needs it
+            folders = sorted({action.action['folder']
+                              for bindings in (*table.midi.values(), *table.keyboard.values())
+                              for _, actions in bindings
+                              for action in actions
+                              if action.action['type'] in ('play_random_audio', 'fade_in_audio', 'play_playlist')}
+                             - prepared_folders)
+            prepared_folders.update(folders)
+            def prepare() -> None:
+                # bring the index up to date, then decode what it found
+                library.refresh(folders).join()
+                cache.warm([track.path for folder in folders for track in library.tracks(folder)],
+                           mixer.samplerate, mixer.channels)
+            prepare_thread = threading.Thread(target=prepare)
+            prepare_thread.daemon = True
+            prepare_thread.start()
+        prepare_audio(dispatch_table)
     
-    for binding in config['keyboard_bindings']:
-        keyboard.on_press_key(binding['key'],
-                              functools.partial(perform_actions, obs_client, binding['actions']))
-    character_switch_thread = threading.Thread(target=move_to_target_loop)
-    character_switch_thread.daemon = True
-    character_switch_thread.start()
-
-    log()
-    log('Listening for actions...')
+    dispatch_config = config.get('dispatch', {})
+    try:
+        with startup_timer.measure('dispatch', 'start workers'):
+            start_action_dispatcher(
+                workers=dispatch_config.get('workers', 4),
+                max_pending=dispatch_config.get('max_pending', 64),
+                overflow=dispatch_config.get('overflow', 'drop'))
+    except ValueError as e:
+        log(f'Error: {e}. Exiting...')
+        return
+    
+    coalesce_config = config.get('coalesce', {})
+    if coalesce_config.get('enabled', True):
+        try:
+            start_input_coalescer(
+                debounce_ms=coalesce_config.get('debounce_ms', 150),
+                ignore_key_repeat=coalesce_config.get('ignore_key_repeat', True),
+                rules=coalesce_config.get('rules'))
+        except ValueError as e:
+            log(f'Error: {e}. Exiting...')
+            return
+    
+    reload_config = config.get('reload', {})
+    with startup_timer.measure('input', 'hook keys'):
+        start_config_watcher(
+            'config.json',
+            obs_client,
+            config,
+            watch=reload_config.get('enabled', True),
+            poll_interval=reload_config.get('poll_interval', CONFIG_POLL_INTERVAL),
+            on_reload=prepare_audio if config['use_output_audio'] else None)
+    spectator_config = config.get('spectator', {})
+    set_spectator_options(
+        click_delay=spectator_config.get('click_delay', 0.02),
+        direct_select_keys=spectator_config.get('direct_select_keys'))
 
+    inport = None
     try:
         if midi_controller is not None:
-            inport = mido.open_input(name=midi_controller,
-                                    callback=create_on_message(obs_client, config['midi_bindings']))
+            with startup_timer.measure('midi', 'open input'):
+                inport = mido.open_input(name=midi_controller, callback=create_on_message(obs_client))
+        startup_config = config.get('startup', {})
+        if startup_config.get('report', True):
+            log()
+            log(startup_timer.report(startup_config.get('target_ms')))
+        log()
+        log('Listening for actions...')
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
         pass
     finally:
-        inport.close()
-        keyboard.unhook_all()
+        if inport is not None:
+            inport.close()
+        config_watcher.stop()
+        obs_client.stop()
+        if async_obs_client is not None:
+            async_obs_client.stop()
+        if timeline_scheduler is not None:
+            timeline_scheduler.stop()
+            log(f'Timeline steps: {timeline_scheduler.lateness.count} run, {timeline_scheduler.dropped} dropped, '
+                f'p99 {timeline_scheduler.lateness.percentile(99) * 1000:.2f} ms late, '
+                f'max {timeline_scheduler.lateness.max * 1000:.2f} ms')
+        if latency_tracer.enabled:
+            latency_tracer.dump(tracing_config.get('report_file'))
+        if input_coalescer is not None:
+            log(input_coalescer.report())
+
+startup_timer.record('core', 'import casting_tools', time.perf_counter() - _import_started)
 
 
 if __name__ == '__main__':
@@ -3,11 +3,19 @@ import tkinter.ttk as ttk
 from typing import Callable, Any
 from dataclasses import dataclass
 import json
+import math
+import queue
 
 import obsws_python as obs
 
 import casting_tools as ct
 
+UI_POLL_INTERVAL = 50 # milliseconds between drains of the results sent back by the worker
+DASHBOARD_INTERVAL = 1000 # milliseconds between refreshes of the performance panel
+DASHBOARD_WINDOW = 30.0 # seconds of latencies the percentiles cover
+# connection probes rather than requests an action waited on
+DASHBOARD_IGNORED_REQUESTS = {'GetVersion'}
+
 @dataclass
 class Action:
     name: str
@@ -44,7 +52,7 @@ class TriggerStudioModeTransitionAction(Action):
         super().__init__(
             name='Trigger Studio Mode Transition',
             key=key,
-            action=lambda: gui.obs_client.trigger_studio_mode_transition(),
+            action=lambda: ct.perform_action(gui.obs_client, {'type': 'trigger_studio_mode_transition'}),
         )
 
 class ToggleInputMuteAction(Action):
@@ -56,7 +64,7 @@ class ToggleInputMuteAction(Action):
         super().__init__(
             name='Toggle Input Mute',
             key=key,
-            action=lambda: gui.obs_client.toggle_input_mute(input_name),
+            action=lambda: ct.perform_action(gui.obs_client, {'type': 'toggle_input_mute', 'name': input_name}),
         )
 
 class SetCurrentPreviewSceneAction(Action):
@@ -68,7 +76,7 @@ class SetCurrentPreviewSceneAction(Action):
         super().__init__(
             name='Set Current Preview Scene',
             key=key,
-            action=lambda: gui.obs_client.set_current_preview_scene(scene_name),
+            action=lambda: ct.perform_action(gui.obs_client, {'type': 'set_current_preview_scene', 'name': scene_name}),
         )
 
 class SetCurrentSceneTransitionAction(Action):
@@ -80,7 +88,8 @@ class SetCurrentSceneTransitionAction(Action):
         super().__init__(
             name='Set Current Scene Transition',
             key=key,
-            action=lambda: gui.obs_client.set_current_scene_transition(transition_name),
+            action=lambda: ct.perform_action(gui.obs_client, {'type': 'set_current_scene_transition',
+                                                              'name': transition_name}),
         )
 
 class SetSourceVisibilityAction(Action):
@@ -96,52 +105,54 @@ class SetSourceVisibilityAction(Action):
         super().__init__(
             name='Set Source Visibility',
             key=key,
-            action=lambda: ct.set_source_visibility(gui.obs_client, scene_name, source_name, visibility),
+            action=lambda: ct.perform_action(gui.obs_client, {'type': 'set_source_visibility', 'scene': scene_name,
+                                                              'name': source_name, 'visible': visibility}),
         )
 
 class SetSpectatedPlayerAction(Action):
     
     player_index: int
     
-    def __init__(self, key: str, player_index: int, **_):
+    def __init__(self, key: str, gui: 'CastingToolsGUI', player_index: int, **_):
         self.player_index = player_index
         super().__init__(
             name='Set Spectated Player',
             key=key,
-            action=lambda: ct.set_spectated_player(player_index),
+            action=lambda: ct.perform_action(gui.obs_client, {'type': 'set_spectated_player', 'index': player_index}),
         )
 
 class PlayRandomAudioAction(Action):
     
     folder: str
     
-    def __init__(self, key: str, folder: str, **_):
+    def __init__(self, key: str, gui: 'CastingToolsGUI', folder: str, **_):
         self.folder = folder
         super().__init__(
             name='Play Random Audio',
             key=key,
-            action=lambda: ct.play_random_audio(folder),
+            # compiled like a config action, so it plays on the connected audio device
+            action=lambda: ct.perform_action(gui.obs_client, {'type': 'play_random_audio', 'folder': folder}),
         )
 
 class StopAudioAction(Action):
     
-    def __init__(self, key: str, **_):
+    def __init__(self, key: str, gui: 'CastingToolsGUI', **_):
         super().__init__(
             name='Stop Audio',
             key=key,
-            action=ct.stop_audio,
+            action=lambda: ct.perform_action(gui.obs_client, {'type': 'stop_audio'}),
         )
 
 class FadeOutAudioAction(Action):
     
     length: int
     
-    def __init__(self, key: str, length: int, **_):
+    def __init__(self, key: str, gui: 'CastingToolsGUI', length: int, **_):
         self.length = length
         super().__init__(
             name='Fade Out Audio',
             key=key,
-            action=lambda: ct.fade_out_audio(length),
+            action=lambda: ct.perform_action(gui.obs_client, {'type': 'fade_out_audio', 'length': length}),
         )
 
 action_types = {
@@ -168,13 +179,43 @@ class CastingToolsGUI:
     obs_status_var: tk.StringVar | None = None
     audio_status_var: tk.StringVar | None = None
     midi_status_var: tk.StringVar | None = None
+    # the open mido input port, whose callback runs on mido's own thread
+    midi_input: Any = None
+    
+    # the performance panel, refreshed from counters the hot paths keep anyway
+    dashboard_list: ttk.Treeview | None = None
+    dashboard_items: dict[str, str] = {}
+    obs_timing_var: tk.StringVar | None = None
+    audio_health_var: tk.StringVar | None = None
+    recent_latencies: ct.RecentLatencies | None = None
+    _audio_energy: dict[int | str, tuple[int, float]] = {}
+    
+    # runs OBS and device I/O so Tk callbacks never wait on it, and hands results back through ui_queue
+    worker: ct.ActionDispatcher | None = None
+    ui_queue: 'queue.SimpleQueue[Callable[[], None]] | None' = None
     
     keybinds: dict[str, list[Action]] = {}
+    # Treeview item IDs of each keybind row and back, so rows are found without scanning the table
+    keybind_items: dict[str, str] = {}
+    item_keybinds: dict[str, str] = {}
+    # the keybind whose actions the action table shows, and the item ID of each of its rows
+    displayed_keybind: str | None = None
+    action_items: list[str] = []
     
     def __init__(self) -> None:
+        self.keybinds = {}
+        self.keybind_items = {}
+        self.item_keybinds = {}
+        self.action_items = []
+        self.worker = ct.ActionDispatcher(workers=2)
+        self.worker.start()
+        self.ui_queue = queue.SimpleQueue()
+        self.dashboard_items = {}
+        self.recent_latencies = ct.RecentLatencies(ct.latency_tracer, DASHBOARD_WINDOW)
+        self._audio_energy = {}
         self.root = tk.Tk()
         self.root.title('Casting Tools')
-        self.root.geometry('1000x500')
+        self.root.geometry('1000x700')
         
         info_frame = tk.Frame(self.root)
         info_frame.pack(fill=tk.BOTH, expand=True)
@@ -187,6 +228,10 @@ class CastingToolsGUI:
         action_info_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
         self.action_list = self.configure_action_info_frame(action_info_frame)
         
+        dashboard_frame = tk.LabelFrame(self.root, text='Performance')
+        dashboard_frame.pack(fill=tk.BOTH, expand=True)
+        self.configure_dashboard_frame(dashboard_frame)
+        
         status_frame = tk.Frame(self.root)
         status_frame.pack(fill=tk.X)
         self.configure_status_frame(status_frame)
@@ -195,18 +240,63 @@ class CastingToolsGUI:
         buttons_frame.pack(fill=tk.X)
         self.configure_buttons(buttons_frame)
         
-        # Make it so that clicking a row in the table will print the row's values.
+        # Make it so that clicking a row in the table will show its actions.
         def on_select(event):
-            self.refresh_action_display()
+            if self.get_current_keybind_focus() != self.displayed_keybind:
+                self.refresh_action_display()
         self.keybind_list.bind('<<TreeviewSelect>>', on_select)
         
         # Make it so that pressing delete will delete the selected row.
         def delete(event):
-            self.keybind_list.delete(self.keybind_list.focus())
+            keybind = self.get_current_keybind_focus()
+            if keybind is not None:
+                self.remove_keybind(keybind)
         self.root.bind('<Delete>', delete)
+        
+        self.root.after(UI_POLL_INTERVAL, self.drain_ui_queue)
+        self.root.after(DASHBOARD_INTERVAL, self.refresh_dashboard)
     
     def mainloop(self) -> None:
         self.root.mainloop()
+        self.worker.stop(wait=False)
+        if self.obs_client is not None:
+            self.obs_client.stop()
+    
+    def drain_ui_queue(self) -> None:
+        '''Apply the results the worker sent back, on the Tk thread.'''
+        while True:
+            try:
+                update = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            update()
+        self.root.after(UI_POLL_INTERVAL, self.drain_ui_queue)
+    
+    def set_status(self, status_var: tk.StringVar, text: str) -> None:
+        '''Set a status label from any thread.'''
+        self.ui_queue.put(lambda: status_var.set(text))
+    
+    def run_in_background(self,
+                          key: Any,
+                          job: Callable[[], Any],
+                          status_var: tk.StringVar,
+                          on_done: Callable[[Any], None] | None = None) -> None:
+        '''Run a job on the worker, then on_done with its result on the Tk thread.'''
+        def run() -> None:
+            try:
+                result = job()
+            except Exception as e:
+                ct.log(f'Error: {type(e).__name__}: {e}')
+                self.set_status(status_var, f'Error: {e}')
+                return
+            if on_done is not None:
+                self.ui_queue.put(lambda: on_done(result))
+        if not self.worker.submit(key, run):
+            status_var.set('Busy, try again')
+    
+    def run_action(self, action: Action) -> None:
+        '''Perform an action on the worker, in order with the other actions of its keybind.'''
+        self.run_in_background(('action', action.key), action.action, self.obs_status_var)
     
     def create_connection_window(self, title: str, connect: Callable) -> tk.Toplevel:
         # Create a new window.
@@ -243,7 +333,16 @@ class CastingToolsGUI:
         password_var.set('')
         
         def connect() -> None:
-            self.obs_client = ct.connect_to_obs(address_var.get(), port_var.get(), password_var.get())
+            address, port = address_var.get(), port_var.get()
+            def on_connected(obs_client: obs.ReqClient | None) -> None:
+                self.obs_client = obs_client
+                if obs_client is None:
+                    self.obs_status_var.set('Could not connect to OBS')
+                else:
+                    self.obs_status_var.set(f'Connected to OBS at {address}:{port}')
+            self.obs_status_var.set(f'Connecting to OBS at {address}:{port}...')
+            self.run_in_background('obs', lambda: ct.connect_to_obs(address, port, password_var.get()),
+                                   self.obs_status_var, on_connected)
         window = self.create_connection_window('Connect to OBS', connect)
         
         # Create a text box for the address.
@@ -265,13 +364,21 @@ class CastingToolsGUI:
         ttk.Button(window, text='Connect', command=submit).grid(row=3, column=0, columnspan=2)
     
     def connect_to_audio_device_window(self) -> None:
+        '''List the audio devices in the background, then open a window to connect to one.'''
+        self.audio_status_var.set('Looking for audio devices...')
+        self.run_in_background('audio', ct.list_possible_audio_devices, self.audio_status_var,
+                               self.choose_audio_device_window)
+    
+    def choose_audio_device_window(self, possible_devices: list[str]) -> None:
         '''Open a new window to connect to an audio device'''
-        possible_devices = ct.list_possible_audio_devices()
+        self.audio_status_var.set('No audio device connected')
         
         def connect() -> None:
             device_index = int(device_var.get().split(':')[0])
-            self.audio_status_var.set(f'Connected to audio device {device_index}')
-            ct.set_audio_output_device(device_index)
+            self.audio_status_var.set(f'Connecting to audio device {device_index}...')
+            self.run_in_background(
+                'audio', lambda: ct.set_audio_output_device(device_index), self.audio_status_var,
+                lambda _: self.audio_status_var.set(f'Connected to audio device {device_index}'))
         window = self.create_connection_window('Connect to Audio Device', connect)
         
         # Create a dropdown for the audio device.
@@ -286,6 +393,52 @@ class CastingToolsGUI:
             window.destroy()
         ttk.Button(window, text='Connect', command=submit).grid(row=1, column=0, columnspan=2)
     
+    def connect_to_midi_device_window(self) -> None:
+        '''List the MIDI inputs in the background, then open a window to connect to one.'''
+        self.midi_status_var.set('Looking for MIDI devices...')
+        self.run_in_background('midi', ct.mido.get_input_names, self.midi_status_var,
+                               self.choose_midi_device_window)
+    
+    def choose_midi_device_window(self, possible_devices: list[str]) -> None:
+        '''Open a new window to connect to a MIDI device'''
+        if not possible_devices:
+            self.midi_status_var.set('No MIDI devices found')
+            return
+        self.midi_status_var.set('No MIDI device connected' if self.midi_input is None
+                                 else f'Connected to MIDI device {self.midi_input.name}')
+        
+        def open_input(name: str) -> Any:
+            if self.midi_input is not None:
+                self.midi_input.close()
+                self.midi_input = None
+            # the GUI has no MIDI bindings, so notes only show that the device is alive
+            def on_message(message) -> None:
+                if message.type == 'note_on':
+                    self.set_status(self.midi_status_var, f'Connected to MIDI device {name}, last note {message.note}')
+            return ct.mido.open_input(name, callback=on_message)
+        
+        def on_connected(midi_input: Any) -> None:
+            self.midi_input = midi_input
+            self.midi_status_var.set(f'Connected to MIDI device {midi_input.name}')
+        
+        def connect() -> None:
+            name = device_var.get()
+            self.midi_status_var.set(f'Connecting to MIDI device {name}...')
+            self.run_in_background('midi', lambda: open_input(name), self.midi_status_var, on_connected)
+        window = self.create_connection_window('Connect to MIDI Device', connect)
+        
+        # Create a dropdown for the MIDI device.
+        device_var = tk.StringVar()
+        device_var.set(possible_devices[0])
+        ttk.Label(window, text='Device:').grid(row=0, column=0)
+        ttk.OptionMenu(window, device_var, *possible_devices).grid(row=0, column=1)
+        
+        # Create a submit button.
+        def submit():
+            connect()
+            window.destroy()
+        ttk.Button(window, text='Connect', command=submit).grid(row=1, column=0, columnspan=2)
+    
     def edit_action_window(self, original: Action) -> None:
         '''Open a new window to edit an action'''
         window = tk.Toplevel(self.root)
@@ -360,68 +513,79 @@ class CastingToolsGUI:
         ttk.Button(window, text='Confirm', command=submit).grid(row=1, column=0, columnspan=2)
         
     def get_current_keybind_focus(self) -> str | None:
-        keybind_focus = self.keybind_list.focus()
-        if keybind_focus != '':
-            return self.keybind_list.item(keybind_focus)['values'][0]
-        return None
+        # looked up rather than read back from the row, Tk turns a keybind like '1' into an int
+        return self.item_keybinds.get(self.keybind_list.focus())
     
     def add_action(self, action: Action, index: int | None = None) -> None:
         '''Add an action to the table.'''
-        if action.key not in self.keybinds:
-            self.keybinds[action.key] = []
-            self.keybind_list.insert('', index if index is not None else tk.END, values=(action.key,))
+        self.add_keybind(action.key)
+        actions = self.keybinds[action.key]
         if index is None:
-            self.keybinds[action.key].append(action)
-        else:
-            self.keybinds[action.key].insert(index, action)
-        self.refresh_action_display()
+            index = len(actions)
+        actions.insert(index, action)
+        if action.key == self.displayed_keybind:
+            item = self.action_list.insert('', index, values=(action.format_for_gui(),))
+            self.action_items.insert(index, item)
     
     def remove_action(self, keybind: str, index: int) -> None:
         '''Remove an action from the table.'''
         self.keybinds[keybind].pop(index)
-        self.refresh_action_display()
+        if keybind == self.displayed_keybind:
+            self.action_list.delete(self.action_items.pop(index))
     
     def update_action(self, old_action: Action, new_action: Action) -> None:
         '''Update an action in the table.'''
-        index = self.keybinds[old_action.key].index(old_action)
-        self.remove_action(old_action.key, index)
-        self.add_action(new_action, index)
+        actions = self.keybinds[old_action.key]
+        index = actions.index(old_action)
+        actions[index] = new_action
+        if old_action.key == self.displayed_keybind:
+            self.action_list.item(self.action_items[index], values=(new_action.format_for_gui(),))
     
     def add_keybind(self, keybind: str) -> None:
         '''Add a keybind to the table.'''
         if keybind not in self.keybinds:
             self.keybinds[keybind] = []
-            self.keybind_list.insert('', tk.END, values=(keybind,))
+            item = self.keybind_list.insert('', tk.END, values=(keybind,))
+            self.keybind_items[keybind] = item
+            self.item_keybinds[item] = keybind
     
     def remove_keybind(self, keybind: str) -> None:
         '''Remove a keybind from the table.'''
         del self.keybinds[keybind]
-        for child in self.keybind_list.get_children():
-            if self.keybind_list.item(child)['values'][0] == keybind:
-                self.keybind_list.delete(child)
-                break
+        item = self.keybind_items.pop(keybind)
+        del self.item_keybinds[item]
+        self.keybind_list.delete(item)
+        if keybind == self.displayed_keybind:
+            self.refresh_action_display()
     
     def change_keybind(self, old_keybind: str, new_keybind: str) -> None:
         '''Change a keybind in the table.'''
-        self.keybinds[new_keybind] = self.keybinds[old_keybind]
-        del self.keybinds[old_keybind]
+        self.keybinds[new_keybind] = self.keybinds.pop(old_keybind)
         for action in self.keybinds[new_keybind]:
             action.key = new_keybind
         
-        item = ''
-        for child in self.keybind_list.get_children():
-            if self.keybind_list.item(child)['values'][0] == old_keybind:
-                item = child
-        
+        item = self.keybind_items.pop(old_keybind)
+        self.keybind_items[new_keybind] = item
+        self.item_keybinds[item] = new_keybind
         self.keybind_list.item(item, values=(new_keybind,))
+        if old_keybind == self.displayed_keybind:
+            self.displayed_keybind = new_keybind
+    
+    def load_keybinds(self, keybinds: dict[str, list[Action]]) -> None:
+        '''Replace every keybind in the tables at once.'''
+        self.keybind_list.delete(*self.keybind_list.get_children())
+        self.keybinds = keybinds
+        self.keybind_items = {keybind: self.keybind_list.insert('', tk.END, values=(keybind,))
+                              for keybind in keybinds}
+        self.item_keybinds = {item: keybind for keybind, item in self.keybind_items.items()}
+        self.refresh_action_display()
     
     def refresh_action_display(self) -> None:
-        '''Refresh the action table.'''
-        self.action_list.delete(*self.action_list.get_children())
-        current_focus = self.keybind_list.focus()
-        if current_focus != '':
-            for action in self.keybinds[self.keybind_list.item(current_focus)['values'][0]]:
-                self.action_list.insert('', tk.END, values=(action.format_for_gui(),))
+        '''Show the actions of the focused keybind in the action table.'''
+        self.action_list.delete(*self.action_items)
+        self.displayed_keybind = self.get_current_keybind_focus()
+        self.action_items = [self.action_list.insert('', tk.END, values=(action.format_for_gui(),))
+                             for action in self.keybinds.get(self.displayed_keybind, ())]
 
     def configure_keybind_info_frame(self, frame: tk.Frame) -> ttk.Treeview:
         '''Create a table of hotkey information with two columns.'''
@@ -442,15 +606,15 @@ class CastingToolsGUI:
         ttk.Button(button_frame, text='Add Keybind', command=add_new_keybind).pack(side=tk.LEFT)
         
         def remove_selected_keybind() -> None:
-            keybind_focus = self.keybind_list.focus()
-            if keybind_focus != '':
-                self.remove_keybind(self.keybind_list.item(keybind_focus)['values'][0])
+            keybind = self.get_current_keybind_focus()
+            if keybind is not None:
+                self.remove_keybind(keybind)
         ttk.Button(button_frame, text='Remove Keybind', command=remove_selected_keybind).pack(side=tk.LEFT)
         
         def edit_selected_keybind() -> None:
-            keybind_focus = self.keybind_list.focus()
-            if keybind_focus != '':
-                self.edit_keybind_window(self.keybind_list.item(keybind_focus)['values'][0])
+            keybind = self.get_current_keybind_focus()
+            if keybind is not None:
+                self.edit_keybind_window(keybind)
         ttk.Button(button_frame, text='Edit Keybind', command=edit_selected_keybind).pack(side=tk.LEFT)
         
         return table
@@ -492,8 +656,90 @@ class CastingToolsGUI:
                     self.edit_action_window(action)
         ttk.Button(button_frame, text='Edit Action', command=edit_selected_action).pack(side=tk.LEFT)
         
+        def run_selected_action() -> None:
+            current_keybind = self.get_current_keybind_focus()
+            if current_keybind is not None:
+                action_focus = self.action_list.focus()
+                if action_focus != '':
+                    self.run_action(self.keybinds[current_keybind][self.action_list.index(action_focus)])
+        ttk.Button(button_frame, text='Run Action', command=run_selected_action).pack(side=tk.LEFT)
+        
         return table
 
+    def configure_dashboard_frame(self, frame: tk.Frame) -> None:
+        '''Create a table of per-binding latency and labels for OBS and audio health.'''
+        columns = {'binding': 'Binding', 'count': 'Triggers', 'p50': 'p50 ms', 'p95': 'p95 ms', 'p99': 'p99 ms'}
+        self.dashboard_list = ttk.Treeview(frame, columns=tuple(columns), show='headings', height=5)
+        for column, heading in columns.items():
+            self.dashboard_list.heading(column, text=heading)
+            if column != 'binding':
+                self.dashboard_list.column(column, width=80, anchor=tk.E, stretch=False)
+        self.dashboard_list.pack(fill=tk.BOTH, expand=True)
+        
+        self.obs_timing_var = tk.StringVar()
+        self.obs_timing_var.set('OBS requests: none yet')
+        tk.Label(frame, textvariable=self.obs_timing_var, anchor=tk.W).pack(fill=tk.X, padx=5)
+        
+        self.audio_health_var = tk.StringVar()
+        self.audio_health_var.set('Audio: no output stream')
+        tk.Label(frame, textvariable=self.audio_health_var, anchor=tk.W).pack(fill=tk.X, padx=5)
+    
+    def refresh_dashboard(self) -> None:
+        '''Update the performance panel, then schedule the next refresh.'''
+        recent = self.recent_latencies.sample()
+        totals = ct.latency_tracer.histograms()
+        obs_timing = ct.LatencyHistogram()
+        obs_types = []
+        for (category, name), histogram in recent.items():
+            if category == 'obs':
+                if name in DASHBOARD_IGNORED_REQUESTS or not histogram.count:
+                    continue
+                obs_timing.merge(histogram)
+                obs_types.append((histogram.count, name))
+            elif category == 'binding':
+                item = self.dashboard_items.get(name)
+                if item is None:
+                    item = self.dashboard_items[name] = self.dashboard_list.insert('', tk.END)
+                # triggers count the whole session, percentiles only the recent window
+                total = totals.get((category, name), histogram)
+                self.dashboard_list.item(item, values=(name, total.count, *(
+                    f'{histogram.percentile(p) * 1000:.1f}' if histogram.count else '-' for p in (50, 95, 99))))
+        
+        if obs_timing.count:
+            self.obs_timing_var.set(
+                f'OBS requests: {obs_timing.count} in the last {DASHBOARD_WINDOW:.0f}s, '
+                f'p50 {obs_timing.percentile(50) * 1000:.1f} ms, p95 {obs_timing.percentile(95) * 1000:.1f} ms, '
+                f'p99 {obs_timing.percentile(99) * 1000:.1f} ms, max {obs_timing.max * 1000:.1f} ms ('
+                + ', '.join(f'{name} {count}' for count, name in sorted(obs_types, reverse=True)) + ')')
+        else:
+            self.obs_timing_var.set(f'OBS requests: none in the last {DASHBOARD_WINDOW:.0f}s')
+        
+        self.audio_health_var.set(self.format_audio_health())
+        self.root.after(DASHBOARD_INTERVAL, self.refresh_dashboard)
+    
+    def format_audio_health(self) -> str:
+        mixers = list(ct.audio_mixers.items())
+        if not mixers:
+            return 'Audio: no output stream'
+        parts = []
+        for device, mixer in mixers:
+            voices = mixer.voices
+            fill = f'{min(voice.buffer_fill for voice in voices):.0%}' if voices else '-'
+            # RMS of what was played since the last refresh
+            position, energy = mixer.position, mixer.energy
+            last_position, last_energy = self._audio_energy.get(device, (0, 0.0))
+            self._audio_energy[device] = (position, energy)
+            samples = (position - last_position) * mixer.channels
+            rms = math.sqrt((energy - last_energy) / samples) if samples > 0 else 0.0
+            parts.append(f'device {device}: {len(voices)} voices, buffer {fill}, '
+                         f'{mixer.underflows} underflows, {mixer.voice_underruns} underruns, '
+                         f'peak {self._dbfs(mixer.take_peak())}, RMS {self._dbfs(rms)}')
+        return 'Audio: ' + '; '.join(parts)
+    
+    @staticmethod
+    def _dbfs(level: float) -> str:
+        return f'{20 * math.log10(level):.1f} dBFS' if level > 0 else '-inf dBFS'
+    
     def configure_buttons(self, frame: tk.Frame) -> None:
         '''Create a frame of buttons for connecting to OBS, adding a sound device, and adding a MIDI device.'''       
         # Create a button to connect to OBS.
@@ -503,7 +749,7 @@ class CastingToolsGUI:
         ttk.Button(frame, text='Add Sound Device', command=self.connect_to_audio_device_window).pack(side=tk.LEFT, padx=5)
         
         # Create a button to add a MIDI device.
-        ttk.Button(frame, text='Add MIDI Device', command=lambda: None).pack(side=tk.LEFT, padx=5)
+        ttk.Button(frame, text='Add MIDI Device', command=self.connect_to_midi_device_window).pack(side=tk.LEFT, padx=5)
         
         # Create a button to save to the config file.
         ttk.Button(frame, text='Save Config', command=lambda: self.save_config('config.json')).pack(side=tk.LEFT, padx=5)
@@ -570,13 +816,12 @@ class CastingToolsGUI:
         with open(filename, 'r') as f:
             data = json.load(f)
         
-        self.keybind_list.delete(*self.keybind_list.get_children())
-        self.action_list.delete(*self.action_list.get_children())
-        self.keybinds.clear()
-        
+        keybinds: dict[str, list[Action]] = {}
         for _, actions in data.items():
             for action in actions:
-                self.add_action(self._json_to_action(action))
+                action = self._json_to_action(action)
+                keybinds.setdefault(action.key, []).append(action)
+        self.load_keybinds(keybinds)
 
 
 def main():
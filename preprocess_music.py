@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import soundfile as sf
+
+import casting_tools as ct
+
+
+RESAMPLE_HALF_TAPS = 32 # sinc taps on each side of an output sample
+RESAMPLE_KAISER_BETA = 8.6
+RESAMPLE_CHUNK = 16384 # output frames interpolated per matrix product
+
+LOUDNESS_BLOCK_SECONDS = 0.4
+LOUDNESS_STEP_SECONDS = 0.1 # 75% overlap between gating blocks
+LOUDNESS_ABSOLUTE_GATE = -70.0
+LOUDNESS_RELATIVE_GATE = -10.0
+
+
+def resample(data: np.ndarray, from_rate: int, to_rate: int) -> np.ndarray:
+    '''Band-limited resampling of a (frames, channels) array with a Kaiser-windowed sinc.'''
+    if from_rate == to_rate:
+        return data
+    frames = len(data)
+    out_frames = int(round(frames * to_rate / from_rate))
+    # cut off below the lower of the two Nyquist frequencies
+    cutoff = min(1.0, to_rate / from_rate)
+    half_width = int(np.ceil(RESAMPLE_HALF_TAPS / cutoff))
+    padded = np.pad(data, ((half_width, half_width + 1), (0, 0)))
+    offsets = np.arange(-half_width + 1, half_width + 1)
+    out = np.empty((out_frames, data.shape[1]), dtype=np.float32)
+    window_norm = np.i0(RESAMPLE_KAISER_BETA)
+    for start in range(0, out_frames, RESAMPLE_CHUNK):
+        times = np.arange(start, min(start + RESAMPLE_CHUNK, out_frames)) * (from_rate / to_rate)
+        base = np.floor(times).astype(np.int64)
+        # (outputs, taps) matrix of input indices and their distance from each output time
+        taps = base[:, np.newaxis] + offsets
+        distance = times[:, np.newaxis] - taps
+        window = np.i0(RESAMPLE_KAISER_BETA * np.sqrt(np.clip(1 - (distance / half_width) ** 2, 0, 1)))
+        weights = cutoff * np.sinc(cutoff * distance) * window / window_norm
+        gathered = padded[taps + half_width]
+        out[start:start + len(times)] = np.einsum('ot,otc->oc', weights, gathered)
+    return out
+
+def k_weighting_response(samplerate: int, bins: int) -> np.ndarray:
+    '''Squared magnitude of the ITU-R BS.1770 K-weighting filter at rfft bin frequencies.'''
+    # high shelf stage
+    k = np.tan(np.pi * 1681.974450955533 / samplerate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf_b = np.array([vh + vb * k / q + k * k, 2 * (k * k - vh), vh - vb * k / q + k * k]) / a0
+    shelf_a = np.array([a0, 2 * (k * k - 1), 1 - k / q + k * k]) / a0
+    # high pass stage
+    k = np.tan(np.pi * 38.13547087602444 / samplerate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    pass_b = np.array([1.0, -2.0, 1.0])
+    pass_a = np.array([a0, 2 * (k * k - 1), 1 - k / q + k * k]) / a0
+
+    z = np.exp(-1j * np.linspace(0, np.pi, bins))
+    def response(b: np.ndarray, a: np.ndarray) -> np.ndarray:
+        return (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return np.abs(response(shelf_b, shelf_a) * response(pass_b, pass_a)) ** 2
+
+def integrated_loudness(data: np.ndarray, samplerate: int) -> float:
+    '''Gated integrated loudness in LUFS, following ITU-R BS.1770-4.'''
+    step = int(samplerate * LOUDNESS_STEP_SECONDS)
+    steps_per_block = int(round(LOUDNESS_BLOCK_SECONDS / LOUDNESS_STEP_SECONDS))
+    steps = len(data) // step
+    if steps < steps_per_block:
+        return float('-inf')
+    # K-weighted energy of each 100 ms step, filtered in the frequency domain
+    response = k_weighting_response(samplerate, step // 2 + 1)
+    energy = np.empty(steps)
+    chunk = max(1, (1 << 22) // (step * data.shape[1]))
+    for start in range(0, steps, chunk):
+        stop = min(start + chunk, steps)
+        frames = data[start * step:stop * step].reshape(stop - start, step, data.shape[1])
+        spectrum = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+        weighted = (spectrum * response[np.newaxis, :, np.newaxis]).sum(axis=1)
+        # Parseval: undo the one-sided spectrum and normalise to mean square power
+        weighted = 2 * weighted - spectrum[:, 0] * response[0]
+        if step % 2 == 0:
+            weighted -= spectrum[:, -1] * response[-1]
+        energy[start:stop] = (weighted / step ** 2).sum(axis=1)
+    # each 400 ms gating block is the mean of four consecutive steps
+    block_energy = np.convolve(energy, np.ones(steps_per_block) / steps_per_block, mode='valid')
+    with np.errstate(divide='ignore'):
+        block_loudness = -0.691 + 10 * np.log10(block_energy)
+    gated = block_energy[block_loudness > LOUDNESS_ABSOLUTE_GATE]
+    if not len(gated):
+        return float('-inf')
+    relative_gate = -0.691 + 10 * np.log10(gated.mean()) + LOUDNESS_RELATIVE_GATE
+    gated = block_energy[(block_loudness > LOUDNESS_ABSOLUTE_GATE) & (block_loudness > relative_gate)]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+def preprocess_track(source: str,
+                     output: str,
+                     samplerate: int,
+                     channels: int,
+                     target_lufs: float,
+                     peak_ceiling: float) -> dict:
+    '''Convert one track to the output format and write a loudness-normalised copy.'''
+    data, source_samplerate = sf.read(source, dtype='float32', always_2d=True)
+    data = resample(ct.convert_channels(data, channels), source_samplerate, samplerate)
+    loudness = integrated_loudness(data, samplerate)
+    peak = float(np.abs(data).max()) if len(data) else 0.0
+    peak_db = 20 * np.log10(peak) if peak > 0 else float('-inf')
+    gain_db = target_lufs - loudness if np.isfinite(loudness) else 0.0
+    # never push the sample peak over the ceiling
+    if np.isfinite(peak_db):
+        gain_db = min(gain_db, peak_ceiling - peak_db)
+    data *= np.float32(10 ** (gain_db / 20))
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    partial = output + '.partial'
+    sf.write(partial, data, samplerate, format='FLAC', subtype='PCM_24')
+    os.replace(partial, output)
+    return {
+        'integrated_lufs': loudness if np.isfinite(loudness) else None,
+        'peak_dbfs': peak_db if np.isfinite(peak_db) else None,
+        'gain_db': gain_db,
+    }
+
+def preprocess_library(folder: str,
+                       samplerate: int,
+                       channels: int,
+                       target_lufs: float = -16.0,
+                       peak_ceiling: float = -1.0,
+                       workers: int | None = None) -> dict:
+    '''Preprocess every track of a library folder in parallel and write the gain manifest.'''
+    folder = os.path.abspath(folder)
+    output_folder = os.path.join(folder, ct.PREPROCESSED_DIRNAME)
+    manifest_path = os.path.join(output_folder, ct.PREPROCESSED_MANIFEST)
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    settings = {
+        'samplerate': samplerate,
+        'channels': channels,
+        'target_lufs': target_lufs,
+        'peak_ceiling': peak_ceiling,
+    }
+    previous = manifest.get('tracks', {}) if all(manifest.get(k) == v for k, v in settings.items()) else {}
+    manifest = settings | {'tracks': {}}
+
+    tracks = ct.AudioLibrary(os.path.join(output_folder, 'library.json')).scan(folder)
+    jobs = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for track in tracks:
+            relative = os.path.relpath(track.path, folder)
+            entry = previous.get(relative)
+            if (entry is not None and entry['source_mtime_ns'] == track.mtime_ns
+                    and os.path.exists(os.path.join(output_folder, entry['output']))):
+                manifest['tracks'][relative] = entry
+                continue
+            output = os.path.splitext(relative)[0] + '.flac'
+            future = executor.submit(preprocess_track, track.path, os.path.join(output_folder, output),
+                                     samplerate, channels, target_lufs, peak_ceiling)
+            jobs[future] = (relative, output, track.mtime_ns)
+        for future in as_completed(jobs):
+            relative, output, mtime_ns = jobs[future]
+            try:
+                result = future.result()
+            except (OSError, RuntimeError, ValueError) as e:
+                ct.log(f'Error: Could not preprocess {relative}: {e}')
+                continue
+            manifest['tracks'][relative] = {'source_mtime_ns': mtime_ns, 'output': output} | result
+            ct.log(f'{relative}: {result["gain_db"]:+.1f} dB')
+
+    os.makedirs(output_folder, exist_ok=True)
+    with open(manifest_path + '.partial', 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(manifest_path + '.partial', manifest_path)
+    return manifest
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Resample and loudness-normalise a music folder for casting_tools playback.')
+    parser.add_argument('folder')
+    parser.add_argument('--device', type=int, default=None,
+                        help='output device to match (default: the default output device)')
+    parser.add_argument('--samplerate', type=int, default=None, help='overrides the device sample rate')
+    parser.add_argument('--channels', type=int, default=None, help='overrides the device channel count')
+    parser.add_argument('--target-lufs', type=float, default=-16.0)
+    parser.add_argument('--peak', type=float, default=-1.0, help='sample peak ceiling in dBFS')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    samplerate, channels = args.samplerate, args.channels
+    if samplerate is None or channels is None:
+        device = ct.sd.query_devices(args.device, 'output')
+        samplerate = samplerate or int(device['default_samplerate'])
+        channels = channels or min(2, device['max_output_channels'])
+
+    start = time.perf_counter()
+    manifest = preprocess_library(args.folder, samplerate, channels, args.target_lufs, args.peak, args.workers)
+    ct.log(f'Preprocessed {len(manifest["tracks"])} tracks to {samplerate} Hz, {channels} channels '
+           f'in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+import json
+import os
+import threading
+import types
+
+import numpy as np
+import pytest
+
+import casting_tools as ct
+
+
+def make_action(action_type: str, perform=lambda obs_client: None, **fields) -> ct.CompiledAction:
+    return ct.CompiledAction({'type': action_type, **fields}, perform)
+
+# Preprocessed tracks
+
+def write_manifest(folder, track: str, output: str) -> None:
+    preprocessed = folder / ct.PREPROCESSED_DIRNAME
+    preprocessed.mkdir(exist_ok=True)
+    (preprocessed / ct.PREPROCESSED_MANIFEST).write_text(json.dumps({
+        'samplerate': 48000,
+        'channels': 2,
+        'tracks': {track: {'output': output, 'source_mtime_ns': os.stat(folder / track).st_mtime_ns}},
+    }))
+
+def test_preprocessed_path_found_above_track_folder(tmp_path):
+    (tmp_path / 'hype').mkdir()
+    (tmp_path / 'hype' / 'song.wav').write_bytes(b'')
+    write_manifest(tmp_path, os.path.join('hype', 'song.wav'), 'song.flac')
+    track = str(tmp_path / 'hype' / 'song.wav')
+    ct.set_music_root(str(tmp_path))
+    try:
+        assert ct.get_preprocessed_path(track, 48000, 2) == str(tmp_path / ct.PREPROCESSED_DIRNAME / 'song.flac')
+        assert ct.get_preprocessed_path(track, 44100, 2) is None
+    finally:
+        ct.set_music_root(None)
+
+def test_preprocessed_path_search_stops_at_music_root(tmp_path):
+    (tmp_path / 'music').mkdir()
+    (tmp_path / 'music' / 'song.wav').write_bytes(b'')
+    write_manifest(tmp_path, os.path.join('music', 'song.wav'), 'song.flac')
+    track = str(tmp_path / 'music' / 'song.wav')
+    ct.set_music_root(str(tmp_path / 'music'))
+    try:
+        assert ct.get_preprocessed_path(track, 48000, 2) is None
+        # a manifest written after the first miss is still noticed
+        write_manifest(tmp_path / 'music', 'song.wav', 'song.flac')
+        preprocessed = tmp_path / 'music' / ct.PREPROCESSED_DIRNAME
+        assert ct.get_preprocessed_path(track, 48000, 2) == str(preprocessed / 'song.flac')
+    finally:
+        ct.set_music_root(None)
+
+# RingBuffer
+
+def test_ring_buffer_wraps_around():
+    ring = ct.RingBuffer(8, 1)
+    out = np.zeros((8, 1), dtype=np.float32)
+    assert ring.write(np.arange(6, dtype=np.float32)[:, np.newaxis]) == 6
+    assert ring.read_into(out[:4]) == 4
+    # the second write wraps past the end of the buffer
+    assert ring.write(np.arange(6, 12, dtype=np.float32)[:, np.newaxis]) == 6
+    assert ring.readable() == 8
+    assert ring.read_into(out) == 8
+    assert out[:, 0].tolist() == list(range(4, 12))
+
+def test_ring_buffer_write_stops_when_full():
+    ring = ct.RingBuffer(4, 2)
+    assert ring.write(np.ones((6, 2), dtype=np.float32)) == 4
+    assert ring.writable() == 0
+    assert ring.write(np.ones((1, 2), dtype=np.float32)) == 0
+
+def test_ring_buffer_read_stops_when_empty():
+    ring = ct.RingBuffer(4, 1)
+    ring.write(np.ones((2, 1), dtype=np.float32))
+    out = np.zeros((4, 1), dtype=np.float32)
+    assert ring.read_into(out) == 2
+    assert ring.read_into(out) == 0
+
+# GainAutomation
+
+def test_gain_automation_linear_ramp_starts_on_exact_frame():
+    gain = ct.GainAutomation(max_frames=16)
+    gain.ramp_to(0.0, 4, start_frame=2)
+    data = np.ones((8, 1), dtype=np.float32)
+    gain.process(data)
+    assert data[:, 0].tolist() == pytest.approx([1.0, 1.0, 1.0, 0.75, 0.5, 0.25, 0.0, 0.0])
+    assert gain.position == 8
+
+def test_gain_automation_matches_gain_at_across_blocks():
+    gain = ct.GainAutomation(max_frames=4)
+    gain.ramp_to(0.5, 10, start_frame=3, curve='equal_power')
+    expected = [gain.gain_at(frame) for frame in range(16)]
+    data = np.ones((16, 2), dtype=np.float32)
+    # larger than max_frames, so this is processed in chunks
+    gain.process(data)
+    assert data[:, 0].tolist() == pytest.approx(expected, abs=1e-6)
+    assert data[:, 1].tolist() == pytest.approx(expected, abs=1e-6)
+
+def test_gain_automation_new_ramp_starts_from_current_gain():
+    gain = ct.GainAutomation()
+    gain.ramp_to(0.0, 100)
+    gain.process(np.ones((50, 1), dtype=np.float32))
+    gain.ramp_to(1.0, 50)
+    assert gain.gain_at(50) == pytest.approx(0.5)
+
+def test_gain_automation_finished_after_stop_at_end_ramp():
+    gain = ct.GainAutomation()
+    gain.ramp_to(0.0, 4, stop_at_end=True)
+    gain.process(np.ones((3, 1), dtype=np.float32))
+    assert not gain.finished()
+    gain.process(np.ones((1, 1), dtype=np.float32))
+    assert gain.finished()
+
+def test_gain_automation_rejects_unknown_curve():
+    with pytest.raises(ValueError):
+        ct.GainAutomation().ramp_to(0.0, 4, curve='cubic')
+
+# OBSStateMirror
+
+def make_mirror() -> ct.OBSStateMirror:
+    mirror = ct.OBSStateMirror('localhost', 4455, '')
+    # as if start() had subscribed to OBS events
+    mirror.subscribed = True
+    return mirror
+
+def test_state_mirror_skips_requests_that_change_nothing():
+    mirror = make_mirror()
+    request = ('SetCurrentPreviewScene', {'sceneName': 'Game'})
+    # unknown state is always sent
+    assert mirror.filter_request(*request) == request
+    assert mirror.filter_request(*request) is None
+    assert mirror.skipped == 1
+
+def test_state_mirror_rewrites_toggle_mute_once_known():
+    mirror = make_mirror()
+    request = ('ToggleInputMute', {'inputName': 'Mic'})
+    assert mirror.filter_request(*request) == request
+    mirror.on_input_mute_state_changed(types.SimpleNamespace(input_name='Mic', input_muted=True))
+    assert mirror.filter_request(*request) == ('SetInputMute', {'inputName': 'Mic', 'inputMuted': False})
+    assert mirror.filter_request(*request) == ('SetInputMute', {'inputName': 'Mic', 'inputMuted': True})
+    assert mirror.rewritten == 2
+
+def test_state_mirror_forgets_state_changed_by_someone_else():
+    mirror = make_mirror()
+    mirror.on_current_preview_scene_changed(types.SimpleNamespace(scene_name='Game'))
+    assert mirror.filter_request('SetCurrentPreviewScene', {'sceneName': 'Break'}) is not None
+    # an event for a scene we never asked for while our write is in flight
+    mirror.on_current_preview_scene_changed(types.SimpleNamespace(scene_name='Intro'))
+    assert mirror.get(('preview',)) is None
+    assert mirror.filter_request('SetCurrentPreviewScene', {'sceneName': 'Break'}) is not None
+
+def test_state_mirror_passes_everything_through_without_events():
+    mirror = make_mirror()
+    request = ('SetCurrentPreviewScene', {'sceneName': 'Game'})
+    mirror.filter_request(*request)
+    mirror.subscription_lost()
+    assert mirror.get(('preview',)) is None
+    assert mirror.filter_request(*request) == request
+    assert mirror.filter_request(*request) == request
+    assert mirror.skipped == 0
+
+def test_state_mirror_forgets_failed_requests():
+    mirror = make_mirror()
+    request = ('SetCurrentPreviewScene', {'sceneName': 'Game'})
+    mirror.filter_request(*request)
+    mirror.request_failed(*request)
+    assert mirror.filter_request(*request) == request
+
+# InputCoalescer
+
+def test_input_coalescer_debounces_toggles():
+    coalescer = ct.InputCoalescer(debounce_ms=100)
+    actions = (make_action('toggle_input_mute', name='Mic'),)
+    assert coalescer.admit('mute', actions, 0.0) == ('mute', None)
+    assert coalescer.admit('mute', actions, 0.05) is None
+    assert coalescer.admit('mute', actions, 0.15) == ('mute', None)
+    assert coalescer.counters['debounced'] == 1
+
+def test_input_coalescer_skips_superseded_latest_firings():
+    coalescer = ct.InputCoalescer()
+    performed = []
+    firings = []
+    for binding_key, scene in (('a', 'A'), ('b', 'B')):
+        actions = (make_action('set_current_preview_scene', lambda obs_client, scene=scene: performed.append(scene),
+                               name=scene),)
+        firings.append((actions, coalescer.admit(binding_key, actions, 0.0)))
+    # both set the preview scene, so they share a key and only the newest still runs
+    assert firings[0][1][0] == firings[1][1][0]
+    for actions, (dispatch_key, still_wanted) in firings:
+        ct.perform_admitted_actions(None, actions, ct.Trace(dispatch_key, 0.0), still_wanted)
+    assert performed == ['B']
+    assert coalescer.counters['superseded'] == 1
+
+def test_input_coalescer_none_wins_over_other_rules():
+    coalescer = ct.InputCoalescer(rules={'play_random_audio': 'none'})
+    actions = (make_action('toggle_input_mute'), make_action('play_random_audio'))
+    assert coalescer.rule(actions) == 'none'
+    assert coalescer.admit('both', actions, 0.0) == ('both', None)
+    assert coalescer.admit('both', actions, 0.0) == ('both', None)
+
+def test_input_coalescer_ignores_key_repeat():
+    coalescer = ct.InputCoalescer()
+    assert coalescer.press('f1')
+    assert not coalescer.press('f1')
+    coalescer.release('f1')
+    assert coalescer.press('f1')
+
+def test_input_coalescer_rejects_unknown_rule():
+    with pytest.raises(ValueError):
+        ct.InputCoalescer(rules={'toggle_input_mute': 'sometimes'})
+
+# ActionDispatcher
+
+def test_action_dispatcher_refuses_work_after_stop():
+    dispatcher = ct.ActionDispatcher(workers=0, max_pending=1, overflow='block')
+    assert not dispatcher.submit('a', lambda: None)
+    dispatcher.start()
+    assert dispatcher.submit('a', lambda: None)
+    results = []
+    blocked = threading.Thread(target=lambda: results.append(dispatcher.submit('b', lambda: None)))
+    blocked.start()
+    threading.Event().wait(0.05)
+    dispatcher.stop()
+    blocked.join(2)
+    # the submit waiting for room gives up instead of queueing behind a stopped dispatcher
+    assert results == [False]
+    assert not dispatcher.submit('c', lambda: None)
+
+# TimelineScheduler
+
+def test_timeline_scheduler_runs_steps_in_offset_order():
+    performed = []
+    done = threading.Event()
+
+    def step(at: float, name: str) -> ct.TimelineStep:
+        def perform(obs_client) -> None:
+            performed.append(name)
+            if len(performed) == 3:
+                done.set()
+        return ct.TimelineStep(at, False, (make_action('wait', perform),))
+
+    scheduler = ct.TimelineScheduler()
+    scheduler.start_thread()
+    try:
+        scheduler.start('intro', (step(0.06, 'third'), step(0.0, 'first'), step(0.03, 'second')), None)
+        assert done.wait(2)
+    finally:
+        scheduler.stop()
+    assert performed == ['first', 'second', 'third']
+    assert scheduler.dropped == 0
+
+def test_timeline_scheduler_cancel_skips_remaining_steps():
+    performed = []
+    scheduler = ct.TimelineScheduler()
+    scheduler.start_thread()
+    try:
+        scheduler.start('outro', (ct.TimelineStep(0.2, False, (make_action('wait', performed.append),)),), None)
+        scheduler.cancel('outro')
+        threading.Event().wait(0.3)
+    finally:
+        scheduler.stop()
+    assert performed == []